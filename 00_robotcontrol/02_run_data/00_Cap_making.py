@@ -2,32 +2,21 @@
 
 Invoked using `python examples/pick_place_from_json.py examples/pp_frames.json`
 """
-from compas import json_load
-from compas_rrc import Zone
-
+from mmec_fab import ProgressServer
+from mmec_fab import ProgressTracker
 from mmec_fab import RobotClient
+from mmec_fab import RunRecorder
+from mmec_fab import prepare_job
 
 
 def run_cap_making(file_path):
 
-    data = json_load(file_path)
-
-    with RobotClient() as client:
-        client.pre()
-
-        for pick, measure, safe, place in zip(data["pick_frames"], data["measure_frames"], data["safe_frames"], data["place_frames"]):
-            client.cap_making(
-                pick,
-                measure,
-                safe,
-                place,
-                travel_speed=250,
-                travel_zone=Zone.Z10,
-                precise_speed=100,
-                precise_zone=Zone.FINE,
-                offset_distance=150,
-            )
-        client.post()
+    # Prepared plans are cached, see mmec_fab.JOBS for the speeds and zones used
+    plan = prepare_job(file_path, "cap_making")
+
+    with RobotClient() as client, RunRecorder(client, file_path):
+        with ProgressServer(ProgressTracker(client)):
+            client.run_plan(plan)
 
 
 if __name__ == "__main__":
@@ -2,30 +2,21 @@
 
 Invoked using `python examples/pick_place_from_json.py examples/pp_frames.json`
 """
-from compas import json_load
-from compas_rrc import Zone
-
+from mmec_fab import ProgressServer
+from mmec_fab import ProgressTracker
 from mmec_fab import RobotClient
+from mmec_fab import RunRecorder
+from mmec_fab import prepare_job
 
 
 def run_marking(file_path):
 
-    data = json_load(file_path)
-
-    with RobotClient() as client:
-        client.pre()
-
-        for marking, dummy in zip(data["marking_frames"], data["dummy_frames"]):
-            client.marking(
-                marking,
-                dummy,
-                travel_speed=250,
-                travel_zone=Zone.Z10,
-                precise_speed=100,
-                precise_zone=Zone.FINE,
-                offset_distance=150,
-            )
-        client.post()
+    # Prepared plans are cached, see mmec_fab.JOBS for the speeds and zones used
+    plan = prepare_job(file_path, "marking")
+
+    with RobotClient() as client, RunRecorder(client, file_path):
+        with ProgressServer(ProgressTracker(client)):
+            client.run_plan(plan)
 
 
 if __name__ == "__main__":
@@ -1,58 +1,46 @@
-"""Load frames from JSON and run simple pick and place procedure.
+"""Make slices and place them on the lattice, one run data file after another.
 
-Invoked using `python examples/pick_place_from_json.py examples/pp_frames.json`
+Invoked using `python 02_making_placing.py 02_making_placing_aa-01-01.json 02_making_placing_aa-01-02.json`
+Interleave the items of the files with `--schedule --capacity 2`, see mmec_fab.schedule_files
 """
-from compas import json_load
-from compas_rrc import Zone
-
+from mmec_fab import ProgressServer
+from mmec_fab import ProgressTracker
 from mmec_fab import RobotClient
+from mmec_fab import RunRecorder
+from mmec_fab import prepare_job
+from mmec_fab import schedule_files
 
 
-def run_making_placing(file_path):
+def run_making_placing(file_paths, schedule=False, capacity=1):
 
-    data = json_load(file_path) 
+    # Prepared plans are cached, see mmec_fab.JOBS for the speeds and zones used
+    if schedule:
+        # One plan for all files, recorded as one run of them
+        plan, _ = schedule_files(file_paths, "making_placing", capacity)
+        runs = [(file_paths, plan)]
+    else:
+        runs = [
+            (file_path, prepare_job(file_path, "making_placing"))
+            for file_path in file_paths
+        ]
 
     with RobotClient() as client:
-        client.pre()
-
-        for pick, measure, safe, place in zip(data["pick_frames"], data["measure_frames"], data["safe_frames"], data["place_frames"]):
-            client.slice_making(
-                pick,
-                measure,
-                safe,
-                place,
-                travel_speed=1000,
-                travel_zone=Zone.Z10,
-                precise_speed=100,
-                precise_zone=Zone.FINE,
-                offset_distance=150,
-            )
-        for pick_slice, safe2, rotated_safe2, place_offset, place_slice in zip(data["pick_slice_frames"], data["safe2_frames"], data["rotated_safe2_frames"], data["place_offset_frames"], data["place_slice_frames"]):
-            client.slice_placing(
-                pick_slice,
-                safe2,
-                rotated_safe2,
-                place_offset,
-                place_slice,
-                travel_speed=250,
-                travel_zone=Zone.Z10,
-                precise_speed=100,
-                precise_zone=Zone.FINE,
-                offset_distance=150,
-            )
-        client.post()
+        with ProgressServer(ProgressTracker(client)):
+            for job_path, plan in runs:
+                with RunRecorder(client, job_path):
+                    client.run_plan(plan)
 
 
 if __name__ == "__main__":
+    import argparse
     import os.path
-    import sys
 
-    if len(sys.argv) > 1:
-        # filepath = "slice_making_aa-01-01.json"
-        # filepath = "C:\Users\indra\repos\mmec_fab\00_robotcontrol\02_run_data\01_slice_making\slice_making_aa-01-01.json"
-        filepath = "C:/Users/indra/repos/mmec_fab/00_robotcontrol/02_run_data/01_slice_making/slice_making_aa-01-01.json"
-    else:
-        # print("No input file specified, using example file pp_frames.json")
-        filepath = os.path.abspath(os.path.join(__file__, "..", "02_making_placing_aa-01-01a.json"))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="run data files in placing order")
+    parser.add_argument("--schedule", action="store_true", help="interleave the items of the files")
+    parser.add_argument("--capacity", type=int, default=1, help="slices the slice station holds")
+    args = parser.parse_args()
+
+    filepaths = args.paths or [os.path.abspath(os.path.join(__file__, "..", "02_making_placing_aa-01-01.json"))]
 
-    run_making_placing(filepath)
\ No newline at end of file
+    run_making_placing(filepaths, args.schedule, args.capacity)
@@ -0,0 +1,25 @@
+MODULE A057_Measure
+    !
+    ! Custom instruction r_A057_StopNoRegain for mmec_fab.measure_points
+    !
+    ! Stops like r_RRC_Stop, but without regain: when the operator presses
+    ! play after jogging, the robot stays where it was jogged to instead of
+    ! moving back to the stop position. A following r_RRC_GetRobtarget reads
+    ! the jogged TCP.
+    !
+    ! String values:  none
+    ! Float values:   none
+    !
+    ! Load it into the robot task next to the RRC modules. The buffer access
+    ! follows the custom instruction template of compas_rrc.
+    !
+
+    PROC r_A057_StopNoRegain()
+        Stop\NoRegain;
+
+        ! Feedback
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.Data.FeedbackLevel>0 THEN
+            r_RRC_FDone;
+        ENDIF
+    ENDPROC
+ENDMODULE
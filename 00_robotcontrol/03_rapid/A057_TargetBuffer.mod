@@ -0,0 +1,121 @@
+MODULE A057_TargetBuffer
+    !
+    ! Custom instructions r_A057_StoreTargets and r_A057_MoveSteps for
+    ! mmec_fab.buffer_plan
+    !
+    ! The targets of a plan are stored on the controller once, then moves
+    ! refer to them by index, so each instruction carries up to six moves in
+    ! a few numbers instead of a full robtarget per move.
+    !
+    ! r_A057_StoreTargets
+    !   Float values:   1  index of the first target, 2  number of targets
+    !                   (up to 4), then per target 3 position and 4
+    !                   orientation (q1-q4) values
+    !
+    ! r_A057_MoveSteps
+    !   String values:  1  name of the digital output of the trigger,
+    !                   2-7  work objects of the moves
+    !   Float values:   1  number of moves (up to 6), 2  move with the
+    !                   trigger (0 for none), 3  trigger distance in mm or
+    !                   time in s, 4  trigger value, 5  trigger measured 0
+    !                   before the end, 1 from the start of the path, 2 as a
+    !                   time, then per move 5 values: target index, speed,
+    !                   zone (-1 for fine), 1 for a linear move, string
+    !                   value of the work object
+    !
+    ! Load it into the robot task next to the RRC modules. The buffer access
+    ! follows the custom instruction template of compas_rrc. Targets are kept
+    ! while the program runs and are stored again at the start of each plan.
+    !
+
+    CONST num n_A057_MaxTargets:=2000;
+    VAR robtarget pA057_Targets{n_A057_MaxTargets};
+    VAR triggdata td_A057_Step;
+    VAR signaldo do_A057_Step;
+    VAR wobjdata ob_A057_Step;
+
+    PROC r_A057_StoreTargets()
+        VAR num n_First;
+        VAR num n_Base;
+
+        n_First:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{1};
+        FOR i FROM 0 TO bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{2}-1 DO
+            n_Base:=2+i*7;
+            pA057_Targets{n_First+i}.trans:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+1},
+                                             bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+2},
+                                             bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+3}];
+            pA057_Targets{n_First+i}.rot:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+4},
+                                           bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+5},
+                                           bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+6},
+                                           bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+7}];
+        ENDFOR
+
+        ! Feedback
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.Data.FeedbackLevel>0 THEN
+            r_RRC_FDone;
+        ENDIF
+    ENDPROC
+
+    PROC r_A057_MoveSteps()
+        VAR robtarget rt_Target;
+        VAR speeddata v_Speed;
+        VAR zonedata z_Zone;
+        VAR num n_Trigger;
+        VAR num n_Base;
+        VAR num n_Zone;
+        VAR bool b_Fine;
+        VAR bool b_Linear;
+
+        ! Trigger event
+        n_Trigger:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{2};
+        IF n_Trigger>0 THEN
+            AliasIO bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.S{1},do_A057_Step;
+            IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{5}=2 THEN
+                TriggIO td_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{3}\Time\DOp:=do_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{4};
+            ELSEIF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{5}=1 THEN
+                TriggIO td_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{3}\Start\DOp:=do_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{4};
+            ELSE
+                TriggIO td_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{3}\DOp:=do_A057_Step,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{4};
+            ENDIF
+        ENDIF
+
+        FOR i FROM 1 TO bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{1} DO
+            n_Base:=5+(i-1)*5;
+
+            ! Work object and target, in the configuration of the robot
+            GetDataVal bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.S{bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+5}},ob_A057_Step;
+            rt_Target:=CRobT(\Tool:=CTool()\WObj:=ob_A057_Step);
+            rt_Target.trans:=pA057_Targets{bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+1}}.trans;
+            rt_Target.rot:=pA057_Targets{bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+1}}.rot;
+
+            v_Speed:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+2},500,5000,1000];
+            n_Zone:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+3};
+            b_Fine:=n_Zone<0;
+            IF b_Fine THEN
+                z_Zone:=fine;
+            ELSE
+                z_Zone:=[FALSE,n_Zone,1.5*n_Zone,1.5*n_Zone,0.15*n_Zone,1.5*n_Zone,0.15*n_Zone];
+            ENDIF
+            b_Linear:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{n_Base+4}=1;
+
+            ! Movement
+            IF i=n_Trigger AND b_Linear THEN
+                TriggL rt_Target,v_Speed,td_A057_Step,z_Zone,CTool()\WObj:=ob_A057_Step;
+            ELSEIF i=n_Trigger THEN
+                TriggJ rt_Target,v_Speed,td_A057_Step,z_Zone,CTool()\WObj:=ob_A057_Step;
+            ELSEIF b_Linear THEN
+                MoveL rt_Target,v_Speed,z_Zone,CTool()\WObj:=ob_A057_Step;
+            ELSE
+                MoveJ rt_Target,v_Speed,z_Zone,CTool()\WObj:=ob_A057_Step;
+            ENDIF
+        ENDFOR
+
+        ! Feedback, once the last move is issued
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.Data.FeedbackLevel>0 THEN
+            IF b_Fine THEN
+                WaitRob\InPos;
+            ENDIF
+            r_RRC_FDone;
+        ENDIF
+    ENDPROC
+ENDMODULE
@@ -0,0 +1,86 @@
+MODULE A057_Trigger
+    !
+    ! Custom instruction r_A057_MoveToTrigg for mmec_fab.MoveToFrameTrigger
+    !
+    ! Moves like r_RRC_MoveTo and sets a digital output at a distance or time
+    ! along the path with TriggIO, so the output switches without a stop point
+    ! or a separate SetDigital instruction.
+    !
+    ! String values:  1  "FrameL" or "FrameJ"
+    !                 2  name of the digital output
+    ! Float values:   1-3  position, 4-7  orientation (q1-q4), 8-13  external
+    !                 axes, 14  speed, 15  zone (-1 for fine), 16  distance in
+    !                 mm or time in s, 17  value, 18  1 to measure the distance
+    !                 from the start of the path, 19  1 for a time
+    !
+    ! Load it into the robot task next to the RRC modules. The buffer access
+    ! follows the custom instruction template of compas_rrc.
+    !
+
+    VAR triggdata td_A057_Trigger;
+    VAR signaldo do_A057_Trigger;
+
+    PROC r_A057_MoveToTrigg()
+        VAR robtarget rt_Target;
+        VAR speeddata v_Speed;
+        VAR zonedata z_Zone;
+        VAR num n_Distance;
+        VAR num n_Value;
+        VAR bool b_Fine;
+
+        ! Instruction values
+        rt_Target:=CRobT(\Tool:=CTool()\WObj:=CWObj());
+        rt_Target.trans:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{1},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{2},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{3}];
+        rt_Target.rot:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{4},
+                        bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{5},
+                        bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{6},
+                        bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{7}];
+        rt_Target.extax:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{8},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{9},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{10},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{11},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{12},
+                          bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{13}];
+        v_Speed:=[bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{14},500,5000,1000];
+        b_Fine:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15}<0;
+        IF b_Fine THEN
+            z_Zone:=fine;
+        ELSE
+            z_Zone:=[FALSE,bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15},
+                     1.5*bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15},
+                     1.5*bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15},
+                     0.15*bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15},
+                     1.5*bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15},
+                     0.15*bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{15}];
+        ENDIF
+        n_Distance:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{16};
+        n_Value:=bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{17};
+
+        ! Trigger event
+        AliasIO bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.S{2},do_A057_Trigger;
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{19}=1 THEN
+            TriggIO td_A057_Trigger,n_Distance\Time\DOp:=do_A057_Trigger,n_Value;
+        ELSEIF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.F{18}=1 THEN
+            TriggIO td_A057_Trigger,n_Distance\Start\DOp:=do_A057_Trigger,n_Value;
+        ELSE
+            TriggIO td_A057_Trigger,n_Distance\DOp:=do_A057_Trigger,n_Value;
+        ENDIF
+
+        ! Movement
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.S{1}="FrameL" THEN
+            TriggL rt_Target,v_Speed,td_A057_Trigger,z_Zone,CTool()\WObj:=CWObj();
+        ELSE
+            TriggJ rt_Target,v_Speed,td_A057_Trigger,z_Zone,CTool()\WObj:=CWObj();
+        ENDIF
+
+        ! Feedback
+        IF bm_RRC_RecBufferRob{n_RRC_ReadPtrRecBuf}.Data.FeedbackLevel>0 THEN
+            IF b_Fine THEN
+                WaitRob\InPos;
+            ENDIF
+            r_RRC_FDone;
+        ENDIF
+    ENDPROC
+ENDMODULE
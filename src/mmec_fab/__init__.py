@@ -2,5 +2,32 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import compas
+
 from .utils import *  # noqa: F401,F403
+from .batching import *  # noqa: F401,F403
+from .encoding import *  # noqa: F401,F403
+from .timeouts import *  # noqa: F401,F403
 from .robot_client import *  # noqa: F401,F403
+from .telemetry import *  # noqa: F401,F403
+from .jobs import *  # noqa: F401,F403
+from .plan import *  # noqa: F401,F403
+from .sources import *  # noqa: F401,F403
+from .cutting import *  # noqa: F401,F403
+from .frame_channel import *  # noqa: F401,F403
+from .progress import *  # noqa: F401,F403
+from .schedule import *  # noqa: F401,F403
+from .executor import *  # noqa: F401,F403
+from .alerts import *  # noqa: F401,F403
+from .tuning import *  # noqa: F401,F403
+from .target_buffer import *  # noqa: F401,F403
+
+if not compas.IPY:
+    from .run_db import *  # noqa: F401,F403
+    from .lattice import *  # noqa: F401,F403
+    from .rapid_data import *  # noqa: F401,F403
+    from .kinematics import *  # noqa: F401,F403
+    from .exchange import *  # noqa: F401,F403
+    from .preview import *  # noqa: F401,F403
+    from .relocalize import *  # noqa: F401,F403
+    from .soak import *  # noqa: F401,F403
@@ -0,0 +1,48 @@
+"""Command line tools of mmec_fab.
+
+Usage::
+
+    python -m mmec_fab <command> [arguments]
+
+Run a command with ``--help`` for its arguments.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import importlib
+import sys
+
+COMMANDS = {
+    "buffer": "mmec_fab.target_buffer",
+    "cut": "mmec_fab.cutting",
+    "encoding": "mmec_fab.encoding",
+    "frames": "mmec_fab.frame_channel",
+    "generate": "mmec_fab.lattice",
+    "prepare": "mmec_fab.plan",
+    "preview": "mmec_fab.preview",
+    "reach": "mmec_fab.kinematics",
+    "relocalize": "mmec_fab.relocalize",
+    "replay": "mmec_fab.exchange",
+    "runs": "mmec_fab.run_db",
+    "schedule": "mmec_fab.schedule",
+    "setup": "mmec_fab.rapid_data",
+    "soak": "mmec_fab.soak",
+    "tune": "mmec_fab.tuning",
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not argv or argv[0] not in COMMANDS:
+        print(__doc__)
+        print("Commands: {}".format(", ".join(sorted(COMMANDS))))
+        return 1
+
+    module = importlib.import_module(COMMANDS[argv[0]])
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
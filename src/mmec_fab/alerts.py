@@ -0,0 +1,344 @@
+"""Alert the operator ahead of the robot's stops.
+
+:class:`OperatorAlerts` follows the estimated time to the next operator stop
+of a :class:`mmec_fab.ProgressTracker` and raises an alert ``lead`` seconds
+before the robot gets there, so the operator is at the station when it
+arrives::
+
+    with RobotClient() as client:
+        tracker = ProgressTracker(client)
+        with tracker, OperatorAlerts(tracker, lead=20, channels=[console_alert]):
+            client.run_plan(plan)
+
+Alerts can be printed, beeped or posted to an HTTP hook. A digital output of
+the controller can't be set from the client in time, as it would only be set
+after the motions already sent, so :func:`add_alert_outputs` adds it to the
+plan instead, at the point where about ``lead`` seconds of motion are left to
+the stop.
+
+For each stop the time the operator was warned ahead and the time the robot
+waited at the stop are recorded, and compared with the median wait of
+earlier runs when a :class:`mmec_fab.RunDatabase` is given.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import logging
+import sys
+import threading
+import time
+
+from mmec_fab.plan import Plan
+from mmec_fab.progress import STOP_PHASES
+from mmec_fab.robot_client import TCP_MAX_SPEED
+from mmec_fab.timeouts import STATION_TRANSITION
+from mmec_fab.timeouts import MotionEstimator
+from mmec_fab.utils import median
+
+__all__ = [
+    "OperatorAlerts",
+    "HttpAlert",
+    "console_alert",
+    "sound_alert",
+    "add_alert_outputs",
+    "stop_baseline",
+]
+
+LOGGER = logging.getLogger("mmec_fab")
+
+
+def console_alert(alert):
+    """Print an alert."""
+    print(
+        "Operator needed for {} of item {} in {:.0f} s".format(
+            alert["phase"], alert["item"], alert["eta"]
+        )
+    )
+
+
+def sound_alert(alert):
+    """Beep, with the speaker on Windows and the terminal bell elsewhere."""
+    try:
+        import winsound
+
+        winsound.Beep(880, 500)
+    except ImportError:
+        sys.stdout.write("\a")
+        sys.stdout.flush()
+
+
+class HttpAlert(object):
+    """Post alerts as JSON to a URL, e.g. a chat or a phone notification hook.
+
+    Parameters
+    ----------
+    url : :obj:`str`
+    timeout : :obj:`float`, optional
+        Seconds to wait for the hook to answer.
+    """
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, alert):
+        # Post on a thread, a slow hook shouldn't delay other alerts
+        thread = threading.Thread(target=self._post, args=(alert,))
+        thread.daemon = True
+        thread.start()
+
+    def _post(self, alert):
+        try:
+            from urllib.request import Request
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib2 import Request  # type: ignore
+            from urllib2 import urlopen  # type: ignore
+
+        request = Request(
+            self.url,
+            json.dumps(alert).encode("utf-8"),
+            {"Content-Type": "application/json"},
+        )
+        try:
+            urlopen(request, timeout=self.timeout).close()
+        except Exception:
+            LOGGER.exception("Could not post alert to %s", self.url)
+
+
+class OperatorAlerts(object):
+    """Alert the operator before the robot reaches a stop.
+
+    Parameters
+    ----------
+    tracker : :class:`mmec_fab.ProgressTracker`
+        Tracker of the running plan, which estimates the time to the next
+        stop.
+    lead : :obj:`float`, optional
+        Seconds ahead of a stop to alert.
+    channels : :obj:`list` of callable, optional
+        Called with the alert, a dictionary with ``item``, ``phase``, ``eta``
+        and ``time``. Defaults to :func:`console_alert`.
+    baseline : :obj:`dict` or :class:`mmec_fab.RunDatabase`, optional
+        Usual wait per stop phase in seconds, or a database to take the
+        median of earlier runs from.
+    path : :obj:`str`, optional
+        File to append a JSON line per stop to.
+    interval : :obj:`float`, optional
+        Seconds between checks of the estimate.
+
+    Attributes
+    ----------
+    records : :obj:`list` of :obj:`dict`
+        Per stop the ``item``, ``phase``, ``lead`` the operator was warned
+        ahead (``None`` without alert), ``wait`` at the stop and the wait
+        ``saved`` against the baseline, in seconds.
+    """
+
+    def __init__(
+        self, tracker, lead=20.0, channels=None, baseline=None, path=None, interval=0.5
+    ):
+        self.tracker = tracker
+        self.lead = lead
+        self.channels = channels if channels is not None else [console_alert]
+        self.baseline = baseline
+        self.path = path
+        self.interval = interval
+        self.records = []
+
+        self._alerted = {}
+        self._stop = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if not isinstance(self.baseline, (dict, type(None))):
+            self.baseline = stop_baseline(self.baseline)
+
+        self.tracker.client.add_listener(self)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+        self.tracker.client.remove_listener(self)
+        if self._stop is not None:
+            self._record(self._stop, time.time())
+            self._stop = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Alert if the next stop is due within the lead time."""
+        stop = self.tracker.state()["next_stop"]
+        if not stop or stop["eta"] is None or stop["eta"] > self.lead:
+            return
+
+        key = (stop["item"], stop["phase"])
+        if key in self._alerted:
+            return
+
+        now = time.time()
+        self._alerted[key] = now
+        alert = dict(stop, time=now)
+        for channel in self.channels:
+            try:
+                channel(alert)
+            except Exception:
+                LOGGER.exception("Alert channel %r failed", channel)
+
+    def plan_started(self, plan):
+        # Stops are keyed by the item indices of the plan
+        self._alerted.clear()
+
+    def phase_started(self, marker):
+        now = marker.executed_at
+        if self._stop is not None:
+            self._record(self._stop, now)
+            self._stop = None
+        if marker.phase in STOP_PHASES:
+            self._stop = marker
+
+    def _record(self, marker, now):
+        # The wait includes the operator's work at the stop
+        alerted_at = self._alerted.get((marker.item_index, marker.phase))
+        wait = now - marker.executed_at
+        usual = (self.baseline or {}).get(marker.phase)
+
+        record = {
+            "item": marker.item_index,
+            "workflow": marker.workflow,
+            "phase": marker.phase,
+            "arrived_at": marker.executed_at,
+            "lead": marker.executed_at - alerted_at if alerted_at else None,
+            "wait": wait,
+            "saved": usual - wait if usual is not None else None,
+        }
+        self.records.append(record)
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        """Average ``lead``, ``wait`` and ``saved`` time per stop and the
+        total ``saved`` per item, over the stops recorded so far."""
+
+        def mean(key):
+            values = [r[key] for r in self.records if r[key] is not None]
+            return sum(values) / len(values) if values else None
+
+        saved = [r["saved"] for r in self.records if r["saved"] is not None]
+        items = set(r["item"] for r in self.records if r["saved"] is not None)
+        return {
+            "stops": len(self.records),
+            "lead": mean("lead"),
+            "wait": mean("wait"),
+            "saved": mean("saved"),
+            "saved_per_item": sum(saved) / len(items) if items else None,
+        }
+
+
+def stop_baseline(database, workflows=None, last=20):
+    """Median wait per stop phase over the last runs in a run database.
+
+    Parameters
+    ----------
+    database : :class:`mmec_fab.RunDatabase`
+    workflows : :obj:`list` of :obj:`str`, optional
+        Workflows whose runs to use, those with operator stops by default.
+    last : :obj:`int`, optional
+        Number of runs per workflow.
+    """
+    if workflows is None:
+        workflows = ("slice_making", "base_making", "cap_making")
+
+    run_ids = set()
+    for workflow in workflows:
+        run_ids.update(run["id"] for run in database.runs(workflow, last))
+
+    baseline = {}
+    for phase in STOP_PHASES:
+        median_time = median(database.phase_times(sorted(run_ids), phase))
+        if median_time is not None:
+            baseline[phase] = median_time
+    return baseline
+
+
+def _move_times(steps):
+    # Estimated time of each step, the moves' time to reach their target
+    motion = MotionEstimator(TCP_MAX_SPEED, STATION_TRANSITION)
+    return [motion.step_duration(step) for step in steps]
+
+
+def add_alert_outputs(plan, signal, lead=20.0):
+    """Set a digital output ahead of each operator stop of a plan.
+
+    The output is set where about ``lead`` seconds of motion are left before
+    the stop, at the latest right after the previous stop, and reset when the
+    operator resumes the program.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    signal : :obj:`str`
+        Digital output of the controller, e.g. wired to a stack light.
+    lead : :obj:`float`, optional
+
+    Returns
+    -------
+    :class:`mmec_fab.Plan`
+    """
+    import compas_rrc
+
+    steps = plan.steps
+    times = _move_times(steps)
+    stops = [
+        index
+        for index, step in enumerate(steps)
+        if step.get("msg")
+        and step["msg"]["instruction"] == "r_RRC_Stop"
+        and step["phase"] in STOP_PHASES
+    ]
+
+    def output(step, value):
+        return {
+            "item": step["item"],
+            "phase": step["phase"],
+            "msg": compas_rrc.SetDigital(signal, value).msg,
+            "wait": False,
+        }
+
+    inserts = {}
+    previous = 0
+    for stop in stops:
+        index = stop
+        left = 0.0
+        while index > previous + 1 and left < lead:
+            index -= 1
+            left += times[index]
+        inserts.setdefault(index, []).append(output(steps[index - 1], 1))
+        inserts.setdefault(stop + 1, []).append(output(steps[stop], 0))
+        previous = stop + 1
+
+    new_steps = []
+    for index, step in enumerate(steps):
+        new_steps.extend(inserts.get(index, []))
+        new_steps.append(step)
+    new_steps.extend(inserts.get(len(steps), []))
+
+    job = dict(plan.job, alert_output={"signal": signal, "lead": lead})
+    return Plan(job, plan.items, new_steps)
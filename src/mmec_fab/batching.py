@@ -0,0 +1,142 @@
+"""Coalesce instructions sent to the controller.
+
+Every instruction is a message on the command topic. Sent one by one, each is
+a separate wake-up of the connection's network thread and a separate write to
+the socket. :class:`BatchedTopic` holds instructions sent without waiting and
+hands them to the network thread together, which writes them to the socket at
+once. A batch is sent when it is full, when its first message is
+``max_delay`` seconds old, or on :meth:`BatchedTopic.flush`, which
+:class:`mmec_fab.RobotClient` calls before waiting for feedback.
+
+Each instruction stays its own message, so the controller and the feedback
+of each instruction are unaffected.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import threading
+
+__all__ = ["BatchedTopic"]
+
+
+class BatchedTopic(object):
+    """Wrap a :class:`roslibpy.Topic` to publish its messages in batches.
+
+    Other attributes are those of the wrapped topic.
+
+    Parameters
+    ----------
+    topic : :class:`roslibpy.Topic`
+    max_messages : :obj:`int`, optional
+        Batch size, ``1`` publishes every message right away.
+    max_delay : :obj:`float`, optional
+        Seconds a message may wait for more to join it.
+
+    Attributes
+    ----------
+    messages : :obj:`int`
+        Number of messages published.
+    batches : :obj:`int`
+        Number of batches they were sent in.
+    """
+
+    def __init__(self, topic, max_messages=32, max_delay=0.005):
+        self.topic = topic
+        self.max_messages = max_messages
+        self.max_delay = max_delay
+        self.messages = 0
+        self.batches = 0
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._batch = 0
+
+    def __getattr__(self, name):
+        return getattr(self.topic, name)
+
+    def publish(self, message):
+        """Queue a message to publish, see :meth:`roslibpy.Topic.publish`."""
+        topic = self.topic
+        if not topic.is_advertised:
+            topic.advertise()
+
+        ros = topic.ros
+        message = {
+            "op": "publish",
+            "id": "publish:%s:%d" % (topic.name, ros.id_counter),
+            "topic": topic.name,
+            "msg": dict(message),
+            "latch": topic.latch,
+        }
+
+        with self._lock:
+            self._pending.append(message)
+            self.messages += 1
+            if len(self._pending) == 1 and self.max_messages > 1:
+                batch = self._batch
+                ros.call_later(self.max_delay, lambda: self._flush_batch(batch))
+            full = len(self._pending) >= self.max_messages
+
+        if full:
+            self.flush()
+
+    def _flush_batch(self, batch):
+        # Timer of a batch, which may have been sent already
+        with self._lock:
+            if batch != self._batch:
+                return
+        self.flush()
+
+    def flush(self):
+        """Send the queued messages now."""
+        with self._lock:
+            messages, self._pending = self._pending, []
+            if not messages:
+                return
+            self._batch += 1
+            self.batches += 1
+            # Hand over to the network thread under the lock, to keep the
+            # order of batches
+            _send_batch(self.topic.ros, messages)
+
+
+def _send_batch(ros, messages):
+    factory = getattr(ros, "factory", None)
+    if factory is None:
+        for message in messages:
+            ros.send_on_ready(message)
+        return
+
+    def send(proto):
+        from roslibpy.core import MessageEncoder
+
+        payloads = [
+            json.dumps(message, cls=MessageEncoder).encode("utf8")
+            for message in messages
+        ]
+        write = getattr(proto, "sendMessage", None)
+        reactor = _reactor() if write else None
+        if reactor is None:
+            for payload in payloads:
+                proto.send_message(payload)
+            return proto
+
+        def write_all():
+            # Frames written in one reactor call leave in one socket write
+            for payload in payloads:
+                write(payload, isBinary=False)
+
+        reactor.callFromThread(write_all)
+        return proto
+
+    factory.on_ready(send)
+
+
+def _reactor():
+    try:
+        from twisted.internet import reactor
+    except ImportError:
+        return None
+    return reactor
@@ -0,0 +1,345 @@
+"""Cut the members of a making job from standard stock.
+
+The making workflows pick a piece at ``pick_frame``, slide it to
+``measure_frame`` and stop for the operator to cut it, the piece as long as
+the slide. Each piece starts as a fresh stick. :func:`plan_stock` groups the
+lengths of a job into sticks of standard stock with best fit decreasing, the
+usual heuristic for the one-dimensional cutting stock problem, and
+:func:`plan_cuts` reorders the items so the pieces of a stick are cut one
+after another:
+
+* a stick is laid with its end at the pick frame of its longest piece,
+* each piece is slid by its length plus the kerf and cut off,
+* the rest of the stick stays in place for the next piece, and
+* the operator loads the next stick at the cut stop of the last piece.
+
+The new order is written to the run data with the sticks, and
+:func:`mmec_fab.prepare_job` adds the messages to load each stick::
+
+    cd 00_robotcontrol/02_run_data
+    python -m mmec_fab cut 01_slice_making_aa-01-01.json --stock 2400 3000
+
+Items are placed in the new order. Use it for members whose placing order
+doesn't matter, e.g. the ones of a single slice.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import compas_rrc
+from compas.geometry import Frame
+
+from mmec_fab.jobs import WORKFLOWS
+from mmec_fab.plan import Plan
+
+__all__ = [
+    "STOCK_LENGTHS",
+    "KERF",
+    "cut_lengths",
+    "plan_stock",
+    "plan_cuts",
+    "add_stock_prompts",
+]
+
+# Standard stock lengths and width of the saw cut, in mm
+STOCK_LENGTHS = (3000.0,)
+KERF = 3.0
+
+# Workflows cutting their members at the cutting station
+CUT_WORKFLOWS = ("slice_making", "base_making", "cap_making")
+
+
+def cut_lengths(data, workflow):
+    """Lengths of the pieces of a making workflow, in item order.
+
+    Parameters
+    ----------
+    data : :obj:`dict`
+        Run data with the frames decoded, see :func:`compas.json_load`.
+    workflow : :obj:`str`
+
+    Returns
+    -------
+    :obj:`list` of :obj:`float`
+        Distance from the pick to the measure frame of each item.
+    """
+    _check_workflow(workflow)
+    return [
+        pick.point.distance_to_point(measure.point)
+        for pick, measure in zip(data["pick_frames"], data["measure_frames"])
+    ]
+
+
+def _check_workflow(workflow):
+    if workflow not in CUT_WORKFLOWS:
+        raise ValueError(
+            "{} doesn't cut, use one of {}".format(workflow, ", ".join(CUT_WORKFLOWS))
+        )
+
+
+def plan_stock(lengths, stock_lengths=STOCK_LENGTHS, kerf=KERF):
+    """Group pieces into sticks of standard stock.
+
+    Pieces are assigned longest first to the stick they leave the least
+    rest of, opening a stick of the longest stock when none has room. Each
+    stick is then the shortest stock its pieces fit.
+
+    Parameters
+    ----------
+    lengths : :obj:`list` of :obj:`float`
+        Lengths of the pieces in mm.
+    stock_lengths : :obj:`list` of :obj:`float`, optional
+        Available stock lengths in mm.
+    kerf : :obj:`float`, optional
+        Material lost per cut in mm.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`dict`
+        Sticks in the order of their first piece, each with the ``stock``
+        length, the indices of its ``pieces`` in ascending order, and the
+        ``used`` and ``waste`` length in mm.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If a piece is longer than the longest stock.
+    """
+    longest = max(stock_lengths)
+    sticks = []
+    order = sorted(range(len(lengths)), key=lambda i: (-lengths[i], i))
+
+    for index in order:
+        need = lengths[index] + kerf
+        if need > longest:
+            raise ValueError(
+                "Item {} of {:.1f} mm is longer than the stock of {:.1f} mm".format(
+                    index, lengths[index], longest
+                )
+            )
+
+        fits = [stick for stick in sticks if longest - stick["used"] >= need]
+        if fits:
+            stick = min(fits, key=lambda stick: longest - stick["used"] - need)
+        else:
+            stick = {"pieces": [], "used": 0.0}
+            sticks.append(stick)
+        stick["pieces"].append(index)
+        stick["used"] += need
+
+    for stick in sticks:
+        stick["pieces"].sort()
+        stick["stock"] = min(s for s in stock_lengths if s >= stick["used"])
+        stick["waste"] = stick["stock"] - sum(lengths[i] for i in stick["pieces"])
+    sticks.sort(key=lambda stick: stick["pieces"][0])
+
+    return sticks
+
+
+def plan_cuts(data, workflow, stock_lengths=STOCK_LENGTHS, kerf=KERF):
+    """Reorder the items of a making workflow to cut them from standard stock.
+
+    Parameters
+    ----------
+    data : :obj:`dict`
+        Run data with the frames decoded, see :func:`compas.json_load`.
+    workflow : :obj:`str`
+        ``"slice_making"``, ``"base_making"`` or ``"cap_making"``.
+    stock_lengths : :obj:`list` of :obj:`float`, optional
+    kerf : :obj:`float`, optional
+
+    Returns
+    -------
+    :obj:`dict`
+        Run data with the items of the workflow in cutting order, new pick and
+        measure frames, and the sticks of :func:`plan_stock` as ``cut_plan``,
+        their ``pieces`` the new item indices and ``items`` the original ones.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the run data is already in cutting order.
+    """
+    if data.get("cut_plan"):
+        raise ValueError("Run data is already in cutting order")
+
+    lengths = cut_lengths(data, workflow)
+    sticks = plan_stock(lengths, stock_lengths, kerf)
+
+    order = [index for stick in sticks for index in stick["pieces"]]
+    result = dict(data)
+    for key in WORKFLOWS[workflow]:
+        result[key] = [data[key][index] for index in order]
+
+    picks = []
+    measures = []
+    position = 0
+    cut_plan = []
+    for stick in sticks:
+        # The longest piece slides furthest, the original frames keep it on
+        # the table
+        longest = max(stick["pieces"], key=lambda i: (lengths[i], -i))
+        end = data["pick_frames"][longest].point
+
+        for index in stick["pieces"]:
+            pick = data["pick_frames"][index]
+            measure = data["measure_frames"][index]
+            direction = measure.point - pick.point
+            direction.unitize()
+            picks.append(Frame(end, pick.xaxis, pick.yaxis))
+            measures.append(
+                Frame(
+                    end + direction * (lengths[index] + kerf),
+                    measure.xaxis,
+                    measure.yaxis,
+                )
+            )
+
+        count = len(stick["pieces"])
+        cut_plan.append(
+            {
+                "workflow": workflow,
+                "stock": stick["stock"],
+                "waste": stick["waste"],
+                "items": stick["pieces"],
+                "pieces": list(range(position, position + count)),
+            }
+        )
+        position += count
+
+    result["pick_frames"] = picks
+    result["measure_frames"] = measures
+    result["cut_plan"] = cut_plan
+    return result
+
+
+def add_stock_prompts(plan, cut_plan):
+    """Ask the operator to load each stick before its first piece.
+
+    The message is shown at the cut stop of the piece before, the operator
+    takes away the rest of the old stick and loads the new one while the
+    robot waits. The first stick is loaded at the stop before the job
+    starts.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    cut_plan : :obj:`list` of :obj:`dict`
+        Sticks, see :func:`plan_cuts`.
+
+    Returns
+    -------
+    :class:`mmec_fab.Plan`
+    """
+    # Plan item index of each item of a workflow
+    items = {}
+    for index, item in enumerate(plan.items):
+        items.setdefault(item["workflow"], []).append(index)
+
+    messages = {}
+    for number, stick in enumerate(cut_plan):
+        first = items[stick["workflow"]][stick["pieces"][0]]
+        text = "Load stick {} of {}, {:.0f} mm, for {} pieces.".format(
+            number + 1, len(cut_plan), stick["stock"], len(stick["pieces"])
+        )
+        messages[_stop_before(plan, first)] = text
+
+    steps = []
+    for position, step in enumerate(plan.steps):
+        text = messages.get(position)
+        if text is None:
+            steps.append(step)
+            continue
+
+        place = {"item": step["item"], "phase": step["phase"]}
+        steps.append(dict(place, msg=compas_rrc.PrintText(text).msg, wait=False))
+        steps.append(step)
+        steps.append(dict(place, prompt=text))
+
+    return Plan(dict(plan.job, cut_plan=cut_plan), plan.items, steps)
+
+
+def _stop_before(plan, item):
+    # Step of the operator stop to load the stick of an item at, the cut
+    # stop of the item before or the last stop before the item
+    stop = None
+    for position, step in enumerate(plan.steps):
+        if step["item"] == item:
+            break
+        if step.get("msg", {}).get("instruction") != "r_RRC_Stop":
+            continue
+        if step["item"] == item - 1 and step["phase"] == "cut":
+            return position
+        stop = position
+    if stop is None:
+        raise ValueError("No operator stop before item {}".format(item))
+    return stop
+
+
+def main(argv=None):
+    import argparse
+    import os
+
+    from compas import json_dump
+    from compas import json_load
+
+    from mmec_fab.jobs import job_for_file
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab cut", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="run data file of a making job")
+    parser.add_argument("--workflow", help="making workflow of the file")
+    parser.add_argument(
+        "--stock",
+        type=float,
+        nargs="+",
+        default=list(STOCK_LENGTHS),
+        help="stock lengths in mm",
+    )
+    parser.add_argument("--kerf", type=float, default=KERF, help="saw cut in mm")
+    parser.add_argument(
+        "--output", help="run data file to write, <name>_cut.json by default"
+    )
+    args = parser.parse_args(argv)
+
+    workflow = args.workflow
+    if workflow is None:
+        stages = [w for w, _ in job_for_file(args.path).stages if w in CUT_WORKFLOWS]
+        if not stages:
+            print("No making workflow for {}, pass --workflow".format(args.path))
+            return 1
+        workflow = stages[0]
+
+    data = json_load(args.path)
+    lengths = cut_lengths(data, workflow)
+    result = plan_cuts(data, workflow, args.stock, args.kerf)
+
+    # One fresh piece per item, the shortest stock it fits
+    fresh = sum(
+        min(s for s in args.stock if s >= length) - length for length in lengths
+    )
+    waste = sum(stick["waste"] for stick in result["cut_plan"])
+
+    row = "{:>5} {:>8} {:>8}  {}"
+    print(row.format("stick", "stock", "waste", "items"))
+    for number, stick in enumerate(result["cut_plan"]):
+        print(
+            row.format(
+                number + 1,
+                "{:.0f}".format(stick["stock"]),
+                "{:.0f}".format(stick["waste"]),
+                ", ".join(str(i) for i in stick["items"]),
+            )
+        )
+    print(
+        "{} pieces from {} sticks instead of {}, waste {:.0f} mm instead of "
+        "{:.0f} mm".format(
+            len(lengths), len(result["cut_plan"]), len(lengths), waste, fresh
+        )
+    )
+
+    output = args.output or "{}_cut.json".format(os.path.splitext(args.path)[0])
+    json_dump(result, output)
+    print("Written to {}".format(output))
+    return 0
@@ -0,0 +1,412 @@
+"""Compact encoding of the messages exchanged with the controller.
+
+rosbridge sends the messages of a subscription as CBOR, a binary encoding,
+when asked to with ``compression="cbor"``. Float arrays are then raw IEEE
+floats instead of decimal text. :class:`mmec_fab.RobotClient` subscribes to
+the feedback this way when the connection can receive binary frames, and
+stays with JSON otherwise, e.g. in IronPython. rosbridge only accepts JSON
+from clients, so instructions are sent as JSON with their float values
+rounded to ``float_precision`` decimals, ``445.0`` instead of
+``444.99999999999841``.
+
+Compare the encodings with the local controller stand-in::
+
+    cd 00_robotcontrol/02_run_data
+    python -m mmec_fab encoding 01_slice_making_aa-01-01.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import logging
+import struct
+
+__all__ = [
+    "Float32Array",
+    "CborMessage",
+    "cbor_dumps",
+    "cbor_loads",
+    "round_floats",
+    "accept_binary",
+]
+
+LOGGER = logging.getLogger("mmec_fab")
+
+# Struct codes of the typed array tags of RFC 8746 used by rosbridge
+TYPED_ARRAYS = {
+    64: "B",
+    65: ">H",
+    66: ">I",
+    67: ">Q",
+    68: "B",
+    69: "<H",
+    70: "<I",
+    71: "<Q",
+    72: "b",
+    73: ">h",
+    74: ">i",
+    75: ">q",
+    77: "<h",
+    78: "<i",
+    79: "<q",
+    81: ">f",
+    82: ">d",
+    85: "<f",
+    86: "<d",
+}
+
+FLOAT32_TAG = 85
+
+
+class Float32Array(list):
+    """List of floats encoded as a float32 typed array, like ``float32[]``
+    fields of ROS messages."""
+
+
+class CborMessage(dict):
+    """Message received in a binary CBOR frame.
+
+    Tells which encoding rosbridge actually used, as it falls back to JSON
+    when it does not support the compression asked for.
+    """
+
+
+def _head(major, n):
+    if n < 24:
+        return struct.pack(">B", major << 5 | n)
+    if n < 1 << 8:
+        return struct.pack(">BB", major << 5 | 24, n)
+    if n < 1 << 16:
+        return struct.pack(">BH", major << 5 | 25, n)
+    if n < 1 << 32:
+        return struct.pack(">BI", major << 5 | 26, n)
+    return struct.pack(">BQ", major << 5 | 27, n)
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(b"\xf6")
+    elif value is True:
+        out.append(b"\xf5")
+    elif value is False:
+        out.append(b"\xf4")
+    elif isinstance(value, Float32Array):
+        out.append(_head(6, FLOAT32_TAG))
+        out.append(_head(2, 4 * len(value)))
+        out.append(struct.pack("<{}f".format(len(value)), *value))
+    elif isinstance(value, float):
+        out.append(b"\xfb" + struct.pack(">d", value))
+    elif isinstance(value, (int, type(2**64))):
+        if value >= 0:
+            out.append(_head(0, value))
+        else:
+            out.append(_head(1, -1 - value))
+    elif isinstance(value, bytearray) or (
+        isinstance(value, bytes) and bytes is not str
+    ):
+        out.append(_head(2, len(value)))
+        out.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        out.append(_head(4, len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_head(5, len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        text = value.encode("utf-8")
+        out.append(_head(3, len(text)))
+        out.append(text)
+
+
+def cbor_dumps(value):
+    """Encode a value as CBOR.
+
+    Supports ``None``, booleans, numbers, strings, bytes, lists, dictionaries
+    and :class:`Float32Array`.
+    """
+    out = []
+    _encode(value, out)
+    return b"".join(out)
+
+
+def _half(bits):
+    exponent = (bits >> 10) & 0x1F
+    mantissa = bits & 0x3FF
+    if exponent == 0:
+        value = mantissa * 2.0**-24
+    elif exponent == 31:
+        value = float("nan") if mantissa else float("inf")
+    else:
+        value = (mantissa + 1024) * 2.0 ** (exponent - 25)
+    return -value if bits & 0x8000 else value
+
+
+def _length(data, info, offset):
+    if info < 24:
+        return info, offset
+    if info == 24:
+        return data[offset], offset + 1
+    if info == 25:
+        return struct.unpack_from(">H", data, offset)[0], offset + 2
+    if info == 26:
+        return struct.unpack_from(">I", data, offset)[0], offset + 4
+    if info == 27:
+        return struct.unpack_from(">Q", data, offset)[0], offset + 8
+    raise ValueError("Unsupported CBOR length {} at {}".format(info, offset - 1))
+
+
+def _decode(data, offset):
+    initial = data[offset]
+    offset += 1
+    major, info = initial >> 5, initial & 0x1F
+
+    if major == 7:
+        if info == 20:
+            return False, offset
+        if info == 21:
+            return True, offset
+        if info in (22, 23):
+            return None, offset
+        if info == 25:
+            return _half(struct.unpack_from(">H", data, offset)[0]), offset + 2
+        if info == 26:
+            return struct.unpack_from(">f", data, offset)[0], offset + 4
+        if info == 27:
+            return struct.unpack_from(">d", data, offset)[0], offset + 8
+        raise ValueError("Unsupported CBOR simple value {}".format(info))
+
+    n, offset = _length(data, info, offset)
+    if major == 0:
+        return n, offset
+    if major == 1:
+        return -1 - n, offset
+    if major == 2:
+        return bytes(data[offset : offset + n]), offset + n
+    if major == 3:
+        return bytes(data[offset : offset + n]).decode("utf-8"), offset + n
+    if major == 4:
+        items = []
+        for _ in range(n):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return items, offset
+    if major == 5:
+        items = {}
+        for _ in range(n):
+            key, offset = _decode(data, offset)
+            items[key], offset = _decode(data, offset)
+        return items, offset
+
+    # Tags, only typed arrays change the value
+    value, offset = _decode(data, offset)
+    code = TYPED_ARRAYS.get(n)
+    if code and isinstance(value, bytes):
+        order, code = (code[0], code[1:]) if len(code) == 2 else ("<", code)
+        count = len(value) // struct.calcsize(code)
+        value = list(struct.unpack("{}{}{}".format(order, count, code), value))
+    return value, offset
+
+
+def cbor_loads(data):
+    """Decode a CBOR encoded value.
+
+    Typed arrays are decoded to lists. Indefinite lengths are not supported,
+    rosbridge does not use them.
+    """
+    data = bytearray(data)
+    value, offset = _decode(data, 0)
+    if offset != len(data):
+        raise ValueError("Extra data after CBOR value at {}".format(offset))
+    return value
+
+
+def round_floats(values, digits):
+    """Round float values to a number of decimals, if not ``None``."""
+    if digits is None:
+        return values
+    return [round(value, digits) for value in values]
+
+
+def _binary_handler(proto):
+    # Let a rosbridge protocol decode binary frames as CBOR
+    text_handler = proto.onMessage
+
+    def onMessage(payload, isBinary):
+        if not isBinary:
+            return text_handler(payload, isBinary)
+        try:
+            message = cbor_loads(payload)
+            if isinstance(message.get("msg"), dict):
+                message["msg"] = CborMessage(message["msg"])
+        except Exception:
+            LOGGER.exception("Could not decode a binary message")
+            return
+        _handle(proto, message)
+
+    proto.onMessage = onMessage
+
+
+def _handle(proto, message):
+    # Dispatch a decoded message like roslibpy does for text frames. The
+    # handlers are private to roslibpy, without them the message takes the
+    # text path again.
+    handlers = getattr(proto, "_message_handlers", None)
+    if not isinstance(handlers, dict):
+        from roslibpy.core import MessageEncoder
+
+        payload = json.dumps(message, cls=MessageEncoder).encode("utf8")
+        return proto.on_message(payload)
+
+    handler = handlers.get(message.get("op"))
+    if handler:
+        from roslibpy import Message
+
+        handler(Message(message))
+
+
+def accept_binary(ros):
+    """Let a connection receive CBOR messages, return whether it can.
+
+    Needs the Twisted backend of :mod:`roslibpy`, the one used in CPython, or
+    a :class:`mmec_fab.FakeRos`.
+    """
+    if getattr(ros, "accepts_binary", False):
+        return True
+
+    factory = getattr(ros, "factory", None)
+    if factory is None or not hasattr(factory, "on"):
+        return False
+    try:
+        from autobahn.twisted.websocket import WebSocketClientProtocol
+    except ImportError:
+        return False
+
+    def patch(proto):
+        if isinstance(proto, WebSocketClientProtocol):
+            _binary_handler(proto)
+        return proto
+
+    # Also the protocols of later reconnections
+    factory.on("ready", patch)
+    if getattr(factory, "_proto", None) is not None:
+        patch(factory._proto)
+    return True
+
+
+def benchmark_encoding(plan, encoding="cbor", float_precision=6, repeat=20):
+    """Run a plan against a :class:`mmec_fab.FakeRos` and measure the messages.
+
+    Returns
+    -------
+    :obj:`dict`
+        Number of ``moves``, and per move the ``sent`` and ``received`` bytes
+        and the CPU time in microseconds to ``encode`` an instruction and
+        ``decode`` its feedback.
+    """
+    import time
+
+    from compas_fab.backends.ros.messages import ROSmsg
+
+    from mmec_fab.exchange import FakeRos
+    from mmec_fab.robot_client import RobotClient
+
+    clock = getattr(time, "process_time", None) or time.clock
+
+    ros = FakeRos()
+    client = RobotClient(ros=ros, encoding=encoding, float_precision=float_precision)
+    client.prompt = lambda text: None
+    ros.bytes_received = 0
+
+    moves = [
+        step["msg"]
+        for step in plan.steps
+        if step.get("msg") and step["msg"]["instruction"] == "r_RRC_MoveTo"
+    ]
+    with client:
+        for msg in moves:
+            msg = dict(msg, feedback_level=1)
+            client.send(ROSmsg(**msg))
+        client.send_and_wait(ROSmsg(**dict(moves[-1], feedback_level=1)))
+
+    # Encoding and decoding alone, as the connection does it
+    publishes = [
+        {
+            "op": "publish",
+            "id": "publish:/robot_command:{}".format(index),
+            "topic": "/robot_command",
+            "msg": dict(
+                msg,
+                float_values=round_floats(msg["float_values"], float_precision),
+            ),
+            "latch": False,
+        }
+        for index, msg in enumerate(moves)
+    ]
+    feedback = [ros.encode_feedback(dict(msg, feedback_id=1)) for msg in moves]
+    decode = cbor_loads if encoding == "cbor" else json.loads
+
+    started = clock()
+    for _ in range(repeat):
+        for message in publishes:
+            json.dumps(message).encode("utf8")
+    encode_time = clock() - started
+
+    started = clock()
+    for _ in range(repeat):
+        for payload in feedback:
+            decode(payload)
+    decode_time = clock() - started
+
+    n = len(moves) or 1
+    return {
+        "moves": len(moves),
+        "sent": ros.bytes_received / (n + 1),
+        "received": ros.bytes_sent / (n + 1),
+        "encode": encode_time * 1e6 / (n * repeat),
+        "decode": decode_time * 1e6 / (n * repeat),
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    from mmec_fab.plan import prepare_job
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab encoding", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="run data file")
+    parser.add_argument("--job", help="job of the file")
+    parser.add_argument(
+        "--precision", type=int, default=6, help="decimals of the float values"
+    )
+    args = parser.parse_args(argv)
+
+    plan = prepare_job(args.path, args.job)
+    row = "{:<16} {:>9} {:>11} {:>10} {:>10}"
+    print(
+        row.format("per MoveToFrame", "sent B", "received B", "encode us", "decode us")
+    )
+    for encoding, precision in (
+        ("json", None),
+        ("json", args.precision),
+        ("cbor", args.precision),
+    ):
+        result = benchmark_encoding(plan, encoding, precision)
+        label = "{} {}".format(
+            encoding, "full" if precision is None else "{} dec".format(precision)
+        )
+        print(
+            row.format(
+                label,
+                "{:.0f}".format(result["sent"]),
+                "{:.0f}".format(result["received"]),
+                "{:.1f}".format(result["encode"]),
+                "{:.1f}".format(result["decode"]),
+            )
+        )
+    return 0
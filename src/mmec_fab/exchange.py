@@ -0,0 +1,522 @@
+"""Record and replay the exchange between client and controller.
+
+:class:`ExchangeRecorder` appends every instruction sent by a
+:class:`mmec_fab.RobotClient` and every feedback message it receives to a
+memory-mapped binary log, with monotonic timestamps::
+
+    with RobotClient() as client, ExchangeRecorder(client, "session.log"):
+        client.run_plan(plan)
+
+:func:`replay_exchange` sends a recorded session again through a client
+connected to a :class:`FakeRos` controller, which answers with the recorded
+feedback at the recorded times. Slow runs on the cell can then be reproduced
+and profiled without a robot::
+
+    python -m mmec_fab replay session.log
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import mmap
+import struct
+import threading
+import time
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue  # type: ignore
+
+__all__ = [
+    "ExchangeLog",
+    "ExchangeRecorder",
+    "read_exchange",
+    "FakeRos",
+    "replay_exchange",
+    "SENT",
+    "FEEDBACK",
+]
+
+FILE_MAGIC = b"MMECXCH1"
+
+# Magic, bytes used and wall clock time of the start
+HEADER = struct.Struct("<8sQd")
+
+# Seconds since the start, direction and payload size
+RECORD = struct.Struct("<dBI")
+
+SENT = 0
+FEEDBACK = 1
+
+COMMAND_TOPIC = "robot_command"
+RESPONSE_TOPIC = "robot_response"
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class ExchangeLog(object):
+    """Append-only, memory-mapped log of messages.
+
+    Appending copies the encoded message into the mapping, the operating
+    system writes it to disk. The header tracks the bytes used, so the log
+    stays readable if the process dies.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File to create.
+    size : :obj:`int`, optional
+        Initial file size in bytes, doubled whenever it is full.
+    """
+
+    def __init__(self, path, size=1 << 24):
+        self.path = path
+        self.start = _clock()
+
+        self._lock = threading.Lock()
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._size = size
+        self._used = HEADER.size
+        HEADER.pack_into(self._map, 0, FILE_MAGIC, self._used, time.time())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, direction, message):
+        """Add a message.
+
+        Parameters
+        ----------
+        direction : :obj:`int`
+            :data:`SENT` or :data:`FEEDBACK`.
+        message : :obj:`dict`
+            JSON serializable message.
+        """
+        now = _clock() - self.start
+        payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+        with self._lock:
+            end = self._used + RECORD.size + len(payload)
+            if end > self._size:
+                self._grow(end)
+
+            RECORD.pack_into(self._map, self._used, now, direction, len(payload))
+            start = self._used + RECORD.size
+            self._map[start:end] = payload
+            self._used = end
+            struct.pack_into("<Q", self._map, 8, end)
+
+    def _grow(self, needed):
+        size = self._size
+        while size < needed:
+            size *= 2
+
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._size = size
+
+    def close(self):
+        with self._lock:
+            if self._map is None:
+                return
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.truncate(self._used)
+            self._file.close()
+
+
+def read_exchange(path):
+    """Read a log written by :class:`ExchangeLog`.
+
+    Returns
+    -------
+    :obj:`tuple`
+        Wall clock time of the start, and a list of records as tuples of
+        seconds since the start, direction and message.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, used, started_at = HEADER.unpack_from(data, 0)
+    if magic != FILE_MAGIC:
+        raise ValueError("Not an exchange log: {}".format(path))
+
+    records = []
+    offset = HEADER.size
+    while offset < used:
+        seconds, direction, size = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        message = json.loads(data[offset : offset + size].decode("utf-8"))
+        records.append((seconds, direction, message))
+        offset += size
+
+    return started_at, records
+
+
+class ExchangeRecorder(object):
+    """Log the instructions and feedback of a client to an :class:`ExchangeLog`.
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+    path : :obj:`str`
+        Output file.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.log = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.log = ExchangeLog(self.path)
+        self.client.add_listener(self)
+
+    def stop(self):
+        self.client.remove_listener(self)
+        self.log.close()
+
+    def instruction_sent(self, instruction):
+        self.log.append(SENT, instruction.msg)
+
+    def feedback_received(self, message):
+        self.log.append(FEEDBACK, dict(message))
+
+
+class FakeRos(object):
+    """Local stand-in for the ROS connection to an RRC controller.
+
+    Pass it to :class:`mmec_fab.RobotClient` as ``ros``. Instructions are
+    executed one after another on a background thread, and feedback is sent
+    when requested, so clients can run without a robot.
+
+    Parameters
+    ----------
+    execution_time : callable, optional
+        Seconds the controller takes for an instruction message, none by
+        default.
+    feedback : :obj:`list`, optional
+        Recorded feedback per instruction in send order, either ``None`` or
+        a pair of seconds since the start and feedback message. Overrides
+        ``execution_time`` for those instructions.
+    speed : :obj:`float`, optional
+        Factor applied to the recorded times.
+    protocol_version : :obj:`str`, optional
+        Version reported to the client, the one it expects by default.
+    supports_cbor : :obj:`bool`, optional
+        Send feedback as CBOR to subscriptions asking for it, like rosbridge.
+        Otherwise it is always sent as JSON, like older versions.
+
+    Attributes
+    ----------
+    bytes_received : :obj:`int`
+        Size of the JSON messages received from the client.
+    bytes_sent : :obj:`int`
+        Size of the feedback messages sent.
+    """
+
+    accepts_binary = True
+
+    def __init__(
+        self,
+        execution_time=None,
+        feedback=None,
+        speed=1.0,
+        protocol_version=None,
+        supports_cbor=True,
+    ):
+        if protocol_version is None:
+            from compas_rrc.common import CLIENT_PROTOCOL_VERSION
+
+            protocol_version = CLIENT_PROTOCOL_VERSION
+
+        self.execution_time = execution_time
+        self.feedback = feedback or []
+        self.speed = speed
+        self.params = {"protocol_version": protocol_version}
+        self.supports_cbor = supports_cbor
+        self.received = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.start_time = _clock()
+        self.is_connected = True
+
+        self._counter = 0
+        self._handlers = {}
+        self._compression = {}
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def id_counter(self):
+        self._counter += 1
+        return self._counter
+
+    def run(self, timeout=None):
+        pass
+
+    def on(self, event, callback):
+        self._handlers.setdefault(event, []).append(callback)
+
+    def off(self, event, callback=None):
+        if callback is None:
+            self._handlers.pop(event, None)
+        elif callback in self._handlers.get(event, []):
+            self._handlers[event].remove(callback)
+
+    def emit(self, event, *args):
+        for callback in list(self._handlers.get(event, [])):
+            callback(*args)
+
+    def on_ready(self, callback, run_in_thread=True):
+        callback()
+
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+
+    def call_sync_service(self, message, timeout=None):
+        name = message["args"].get("name", "").strip("/")
+        return {"result": {"value": json.dumps(self.params.get(name))}}
+
+    def call_async_service(self, message, callback, errback=None):
+        callback(self.call_sync_service(message)["result"])
+
+    def send_on_ready(self, message):
+        self.bytes_received += len(json.dumps(dict(message)).encode("utf-8"))
+        if message["op"] == "subscribe":
+            self._compression[message["topic"]] = message.get("compression")
+        if message["op"] == "publish" and message["topic"].endswith(COMMAND_TOPIC):
+            self._queue.put((_clock(), self.received, message["msg"]))
+            self.received += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def terminate(self):
+        pass
+
+    def _run(self):
+        ready = self.start_time
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            received_at, index, msg = entry
+
+            recorded = self.feedback[index] if index < len(self.feedback) else None
+            if recorded is not None:
+                done = self.start_time + recorded[0] / self.speed
+            else:
+                duration = self.execution_time(msg) if self.execution_time else 0.0
+                done = max(received_at, ready) + duration
+            ready = max(ready, done)
+
+            delay = done - _clock()
+            if delay > 0:
+                time.sleep(delay)
+
+            if msg["feedback_level"] > 0:
+                feedback = dict(recorded[1]) if recorded else {"feedback": "Done"}
+                feedback.update(msg)
+                feedback["feedback_id"] = msg["sequence_id"]
+                self._publish_feedback(feedback)
+
+    def _response_topic(self):
+        for topic in self._compression:
+            if topic.endswith(RESPONSE_TOPIC):
+                return topic
+        return "/" + RESPONSE_TOPIC
+
+    def encode_feedback(self, feedback):
+        """Encode a feedback message as rosbridge sends it to the client.
+
+        Float values are ``float32`` in the message definition.
+        """
+        from mmec_fab.encoding import Float32Array
+        from mmec_fab.encoding import cbor_dumps
+
+        topic = self._response_topic()
+        values = feedback.get("float_values") or []
+        values = struct.unpack(
+            "<{}f".format(len(values)), struct.pack("<{}f".format(len(values)), *values)
+        )
+        message = {"op": "publish", "topic": topic}
+
+        if self.supports_cbor and self._compression.get(topic) == "cbor":
+            message["msg"] = dict(feedback, float_values=Float32Array(values))
+            return cbor_dumps(message)
+
+        message["msg"] = dict(feedback, float_values=list(values))
+        return json.dumps(message).encode("utf-8")
+
+    def _publish_feedback(self, feedback):
+        from mmec_fab.encoding import CborMessage
+        from mmec_fab.encoding import cbor_loads
+
+        # Through the encoding the client asked for, as it is decoded there
+        payload = self.encode_feedback(feedback)
+        self.bytes_sent += len(payload)
+        if payload[:1] == b"{":
+            message = json.loads(payload.decode("utf-8"))
+        else:
+            message = cbor_loads(payload)
+            message["msg"] = CborMessage(message["msg"])
+
+        for event, callbacks in list(self._handlers.items()):
+            if event == message["topic"] or event.endswith(RESPONSE_TOPIC):
+                for callback in list(callbacks):
+                    callback(message["msg"])
+
+
+def replay_exchange(path, speed=1.0, timeout=60, listeners=()):
+    """Send a recorded session again to a :class:`FakeRos` controller.
+
+    Instructions are sent at their recorded times and the controller answers
+    with the recorded feedback at the recorded times.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Log written by :class:`ExchangeRecorder`.
+    speed : :obj:`float`, optional
+        Factor to run faster than recorded.
+    timeout : :obj:`float`, optional
+        Seconds to wait for outstanding feedback at the end.
+    listeners : :obj:`list`, optional
+        Client listeners to add, e.g. a profiler.
+
+    Returns
+    -------
+    :obj:`dict`
+        ``instructions`` sent, ``recorded`` and ``replayed`` duration, and
+        the largest ``lag`` of a send behind its recorded time, in seconds.
+    """
+    from compas_fab.backends.ros.messages import ROSmsg
+
+    from mmec_fab.robot_client import RobotClient
+
+    _, records = read_exchange(path)
+    sent = [
+        (seconds, message)
+        for seconds, direction, message in records
+        if direction == SENT
+    ]
+    feedback = dict(
+        (message["feedback_id"], (seconds, message))
+        for seconds, direction, message in records
+        if direction == FEEDBACK
+    )
+    schedule = [feedback.get(message["sequence_id"]) for _, message in sent]
+
+    ros = FakeRos(feedback=schedule, speed=speed)
+    client = RobotClient(ros=ros)
+    for listener in listeners:
+        client.add_listener(listener)
+
+    futures = []
+    lag = 0.0
+    with client:
+        ros.start_time = start = _clock()
+        for seconds, message in sent:
+            due = start + seconds / speed
+            delay = due - _clock()
+            if delay > 0:
+                time.sleep(delay)
+            lag = max(lag, _clock() - due)
+
+            message = dict(message)
+            message.pop("sequence_id", None)
+            future = client.send(ROSmsg(**message))
+            if future is not None:
+                futures.append(future)
+
+        for future in futures:
+            future.result(timeout)
+        replayed = _clock() - start
+
+    return {
+        "instructions": len(sent),
+        "recorded": records[-1][0] if records else 0.0,
+        "replayed": replayed,
+        "lag": lag,
+    }
+
+
+def _latencies(records):
+    sent = dict(
+        (message["sequence_id"], seconds)
+        for seconds, direction, message in records
+        if direction == SENT
+    )
+    return sorted(
+        seconds - sent[message["feedback_id"]]
+        for seconds, direction, message in records
+        if direction == FEEDBACK and message.get("feedback_id") in sent
+    )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab replay", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="exchange log")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument(
+        "--info", action="store_true", help="only summarize the recorded session"
+    )
+    args = parser.parse_args(argv)
+
+    started_at, records = read_exchange(args.path)
+    latencies = _latencies(records)
+
+    print(
+        "recorded {}: {} messages over {:.1f} s".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started_at)),
+            len(records),
+            records[-1][0] if records else 0.0,
+        )
+    )
+    if latencies:
+        print(
+            "feedback after {:.3f} s median, {:.3f} s max".format(
+                latencies[len(latencies) // 2], latencies[-1]
+            )
+        )
+
+    if not args.info:
+        result = replay_exchange(args.path, args.speed)
+        print(
+            "replayed {instructions} instructions in {replayed:.1f} s, "
+            "sends up to {lag:.3f} s late".format(**result)
+        )
+
+    return 0
@@ -0,0 +1,329 @@
+"""Run robot jobs in the background, e.g. from Grasshopper.
+
+Sending a plan blocks until its last motion is done, which freezes Rhino when
+called from a component. A :class:`BackgroundExecutor` runs submitted jobs one
+after another on a worker thread with its own :class:`mmec_fab.RobotClient`,
+and components poll its state instead::
+
+    executor = get_executor()
+    job = executor.submit_plan(prepare_job(path))
+
+    # In a component triggered by a timer
+    state = executor.state()
+
+    # In a component with a cancel button
+    job.cancel()
+
+Works in IronPython and CPython.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+import traceback
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue  # type: ignore
+
+from mmec_fab.progress import ProgressTracker
+
+__all__ = ["BackgroundExecutor", "ExecutorJob", "JobCancelled", "get_executor"]
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Executors shared between the components of a session
+_executors = {}  # type: dict
+
+
+class JobCancelled(Exception):
+    """Raised on the worker thread to stop a cancelled job."""
+
+
+class ExecutorJob(object):
+    """A job submitted to a :class:`BackgroundExecutor`.
+
+    Attributes
+    ----------
+    id : :obj:`int`
+    name : :obj:`str`
+    status : :obj:`str`
+        ``"queued"``, ``"running"``, ``"done"``, ``"failed"`` or
+        ``"cancelled"``.
+    result
+        Return value of the job once done.
+    error : :obj:`str`
+        Traceback of a failed job.
+    """
+
+    def __init__(self, id, name, target, args, kwargs, plan=None):
+        self.id = id
+        self.name = name
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.plan = plan
+
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.instructions = 0
+        self.tracker = None
+
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return "ExecutorJob({}, {!r}, {})".format(self.id, self.name, self.status)
+
+    @property
+    def cancelled(self):
+        """Whether cancelling was requested."""
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        """Stop the job before its next instruction.
+
+        Instructions already sent are executed by the controller, a queued job
+        is never started.
+        """
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """Block until the job is finished, return whether it is."""
+        self._done.wait(timeout)
+        return self.finished
+
+    # Listener of the worker client, sends happen on the worker thread
+
+    def instruction_sending(self, instruction):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def instruction_sent(self, instruction):
+        self.instructions += 1
+
+    def state(self):
+        """Return the job's state as a JSON serializable dictionary.
+
+        Keys are ``id``, ``name``, ``status``, ``error``, the number of
+        ``instructions`` sent, the ``elapsed`` seconds and, for plans, the
+        ``progress`` of :meth:`mmec_fab.ProgressTracker.state`.
+        """
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "error": self.error,
+            "instructions": self.instructions,
+            "elapsed": elapsed,
+            "progress": self.tracker.state() if self.tracker else None,
+        }
+
+
+class BackgroundExecutor(object):
+    """Run jobs on a worker thread with its own robot connection.
+
+    The connection is opened by the first job and kept for the following
+    ones. It is opened again after a job failed.
+
+    Parameters
+    ----------
+    client_factory : callable, optional
+        Returns a new client, :class:`mmec_fab.RobotClient` by default.
+    keep : :obj:`int`, optional
+        Number of finished jobs kept for :meth:`state`.
+    """
+
+    def __init__(self, client_factory=None, keep=20):
+        if client_factory is None:
+            from mmec_fab.robot_client import RobotClient
+
+            client_factory = RobotClient
+
+        self.client_factory = client_factory
+        self.keep = keep
+        self.client = None
+        self.jobs = []
+
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, target, *args, **kwargs):
+        """Queue a function to call with the worker's client.
+
+        Parameters
+        ----------
+        target : callable
+            Called as ``target(client, *args, **kwargs)``, e.g. a
+            :class:`mmec_fab.RobotClient` method like
+            ``RobotClient.stop_to_measure``.
+
+        Returns
+        -------
+        :class:`ExecutorJob`
+        """
+        name = getattr(target, "__name__", "job")
+        return self._submit(name, target, args, kwargs)
+
+    def submit_plan(self, plan, name=None):
+        """Queue a prepared plan, see :meth:`mmec_fab.RobotClient.run_plan`.
+
+        Returns
+        -------
+        :class:`ExecutorJob`
+        """
+        if name is None:
+            name = plan.job.get("name", "plan")
+        return self._submit(name, _run_plan, (plan,), {}, plan)
+
+    def _submit(self, name, target, args, kwargs, plan=None):
+        with self._lock:
+            self._counter += 1
+            job = ExecutorJob(self._counter, name, target, args, kwargs, plan)
+            self.jobs.append(job)
+
+            finished = [j for j in self.jobs if j.finished]
+            for old in finished[: max(len(finished) - self.keep, 0)]:
+                self.jobs.remove(old)
+
+        self._queue.put(job)
+        return job
+
+    def cancel(self):
+        """Cancel all queued and running jobs."""
+        with self._lock:
+            for job in self.jobs:
+                job.cancel()
+
+    @property
+    def busy(self):
+        with self._lock:
+            return any(not job.finished for job in self.jobs)
+
+    def state(self):
+        """Return the states of the jobs, see :meth:`ExecutorJob.state`.
+
+        Returns
+        -------
+        :obj:`dict`
+            ``connected``, ``busy`` and the ``jobs`` in submission order.
+        """
+        with self._lock:
+            jobs = list(self.jobs)
+
+        return {
+            "connected": self.client is not None,
+            "busy": any(not job.finished for job in jobs),
+            "jobs": [job.state() for job in jobs],
+        }
+
+    def close(self, cancel=True):
+        """Stop the worker after the running job and close the connection."""
+        if cancel:
+            self.cancel()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            self._execute(job)
+        self._disconnect()
+
+    def _execute(self, job):
+        job.started_at = time.time()
+        try:
+            if job.cancelled:
+                raise JobCancelled()
+
+            if self.client is None:
+                client = self.client_factory()
+                client.__enter__()
+                self.client = client
+
+            job.status = RUNNING
+            if job.plan is not None:
+                job.tracker = ProgressTracker(self.client, job.plan)
+
+            self.client.add_listener(job)
+            if job.tracker:
+                job.tracker.start()
+            try:
+                job.result = job.target(self.client, *job.args, **job.kwargs)
+            finally:
+                self.client.remove_listener(job)
+                if job.tracker:
+                    job.tracker.stop()
+            job.status = DONE
+
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception:
+            job.status = FAILED
+            job.error = traceback.format_exc()
+            self._disconnect()
+        finally:
+            job.finished_at = time.time()
+            job._done.set()
+
+    def _disconnect(self):
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                client.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+def _run_plan(client, plan):
+    client.run_plan(plan)
+
+
+def get_executor(key="mmec_fab", client_factory=None):
+    """Return the executor shared under a key, creating it if needed.
+
+    In Rhino the executors are kept in ``scriptcontext.sticky``, so they
+    survive recomputes of the Grasshopper components using them.
+    """
+    try:
+        import scriptcontext  # type: ignore
+
+        executors = scriptcontext.sticky.setdefault("mmec_fab.executors", {})
+    except ImportError:
+        executors = _executors
+
+    executor = executors.get(key)
+    if executor is None:
+        executor = executors[key] = BackgroundExecutor(client_factory)
+    return executor
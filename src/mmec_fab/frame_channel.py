@@ -0,0 +1,325 @@
+"""Exchange frames between processes through a memory-mapped file.
+
+A :class:`FrameChannel` is a file holding a fixed-layout array of frames, each
+its origin, x axis and y axis as doubles, behind a small header. Grasshopper
+writes planes into it and a fabrication process on the same computer reads
+them, without exporting or parsing JSON::
+
+    # Grasshopper, in a GhPython component
+    channel = FrameChannel(r"C:\\temp\\place_frames.frames")
+    channel.write(planes)
+
+    # Fabrication process
+    channel = FrameChannel(r"C:\\temp\\place_frames.frames")
+    version, frames = channel.read()
+    version, changed, count = channel.changes(version)
+
+The header holds a version counter used as a sequence lock: the writer makes
+it odd while it writes and even when done, and readers copy the data again if
+the version was odd or changed meanwhile. Each frame records the version it
+was last changed in, so readers can pick out changed frames. There must be a
+single writer per channel.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import mmap
+import os
+import struct
+import time
+
+from compas.geometry import Frame
+
+from mmec_fab.utils import ensure_frame
+
+__all__ = ["FrameChannel", "ChannelSource"]
+
+FILE_MAGIC = b"MMECFRM1"
+
+# Magic, capacity, count, version and wall clock time of the last write
+HEADER = struct.Struct("<8sIIQd")
+VERSION_OFFSET = 16
+
+# Version the frame last changed in, origin, x axis and y axis
+RECORD = struct.Struct("<Q9d")
+
+DEFAULT_CAPACITY = 1024
+
+
+def _values(frame):
+    frame = ensure_frame(frame)
+    return tuple(frame.point) + tuple(frame.xaxis) + tuple(frame.yaxis)
+
+
+def _frame(values):
+    return Frame(values[0:3], values[3:6], values[6:9])
+
+
+class FrameChannel(object):
+    """Array of frames in a memory-mapped file shared between processes.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File of the channel, created if it doesn't exist.
+    capacity : :obj:`int`, optional
+        Number of frames a new file holds.
+
+    Attributes
+    ----------
+    capacity : :obj:`int`
+        Number of frames the file holds.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+
+        if not os.path.exists(path) or not os.path.getsize(path):
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(FILE_MAGIC, capacity, 0, 0, 0.0))
+                f.write(b"\0" * (capacity * RECORD.size))
+
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, _, _, _ = HEADER.unpack(self._map[: HEADER.size])
+        if magic != FILE_MAGIC:
+            self.close()
+            raise ValueError("Not a frame channel: {}".format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def _record_offset(self, index):
+        return HEADER.size + index * RECORD.size
+
+    def _set_version(self, version):
+        self._map[VERSION_OFFSET : VERSION_OFFSET + 8] = struct.pack("<Q", version)
+
+    def write(self, frames):
+        """Replace the frames of the channel.
+
+        Only frames that differ from the ones in the channel are marked as
+        changed.
+
+        Parameters
+        ----------
+        frames : :obj:`list`
+            :class:`compas.geometry.Frame` or :class:`Rhino.Geometry.Plane`.
+
+        Returns
+        -------
+        :obj:`int`
+            Version of the channel after the write.
+        """
+        values = [_values(frame) for frame in frames]
+        if len(values) > self.capacity:
+            raise ValueError(
+                "{} frames don't fit into the channel of {}".format(
+                    len(values), self.capacity
+                )
+            )
+
+        _, _, count, version, _ = HEADER.unpack(self._map[: HEADER.size])
+        # Odd while writing
+        self._set_version(version + 1)
+        version += 2
+
+        for index, frame in enumerate(values):
+            offset = self._record_offset(index)
+            stored = RECORD.unpack(self._map[offset : offset + RECORD.size])
+            if index < count and stored[1:] == frame:
+                continue
+            self._map[offset : offset + RECORD.size] = RECORD.pack(version, *frame)
+
+        self._map[: HEADER.size] = HEADER.pack(
+            FILE_MAGIC, self.capacity, len(values), version - 1, time.time()
+        )
+        self._set_version(version)
+        return version
+
+    def _snapshot(self, start=0, stop=None, timeout=1.0):
+        # Copy the header and records from start to stop consistently
+        deadline = time.time() + timeout
+        while True:
+            header = HEADER.unpack(self._map[: HEADER.size])
+            version, count = header[3], header[2]
+            end = count if stop is None else min(stop, count)
+            data = self._map[self._record_offset(start) : self._record_offset(end)]
+
+            if not version % 2 and self._version() == version:
+                return header, data
+            if time.time() > deadline:
+                raise RuntimeError("Writer of {} doesn't finish".format(self.path))
+
+    def _version(self):
+        return struct.unpack("<Q", self._map[VERSION_OFFSET : VERSION_OFFSET + 8])[0]
+
+    @property
+    def version(self):
+        """Version of the channel, increased by every write."""
+        return self._version()
+
+    def read(self):
+        """Read all frames.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Version of the channel and list of frames.
+        """
+        header, data = self._snapshot()
+        frames = [
+            _frame(RECORD.unpack_from(data, offset)[1:])
+            for offset in range(0, len(data), RECORD.size)
+        ]
+        return header[3], frames
+
+    def frame(self, index):
+        """Read a single frame, ``None`` if the channel has fewer frames."""
+        _, data = self._snapshot(index, index + 1)
+        if not data:
+            return None
+        return _frame(RECORD.unpack(data)[1:])
+
+    def changes(self, since):
+        """Read the frames changed since a version.
+
+        Parameters
+        ----------
+        since : :obj:`int`
+            Version returned by an earlier read.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Version of the channel, dictionary of the changed frames by
+            index, and the number of frames in the channel.
+        """
+        header, data = self._snapshot()
+        changed = {}
+        for index, offset in enumerate(range(0, len(data), RECORD.size)):
+            values = RECORD.unpack_from(data, offset)
+            if values[0] > since:
+                changed[index] = _frame(values[1:])
+        return header[3], changed, header[2]
+
+    def wait(self, since, timeout=None, poll=0.001):
+        """Wait for a write after a version.
+
+        Returns
+        -------
+        :obj:`int`
+            Version of the channel, ``since`` if it timed out.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            version = self._version()
+            if version > since and not version % 2:
+                return version
+            if deadline is not None and time.time() > deadline:
+                return since
+            time.sleep(poll)
+
+    @property
+    def updated_at(self):
+        """Wall clock time of the last write."""
+        return HEADER.unpack(self._map[: HEADER.size])[4]
+
+
+class ChannelSource(object):
+    """Frames of the items of a workflow read live from frame channels.
+
+    Each item's frames are read as the item is sent, so frames changed in
+    Grasshopper during a run are used for the items not sent yet. The items
+    end with the shortest channel.
+
+    Parameters
+    ----------
+    workflow : :obj:`str`
+        A key of :data:`mmec_fab.WORKFLOWS`.
+    channels : :obj:`dict`
+        Per run data key of the workflow, a :class:`FrameChannel` or the
+        path of one.
+    """
+
+    def __init__(self, workflow, channels):
+        from mmec_fab.jobs import WORKFLOWS
+
+        self.workflow = workflow
+        self.keys = WORKFLOWS[workflow]
+        missing = [key for key in self.keys if key not in channels]
+        if missing:
+            raise ValueError(
+                "No channels given for {} of {}".format(", ".join(missing), workflow)
+            )
+        self.channels = dict(
+            (key, c if isinstance(c, FrameChannel) else FrameChannel(c))
+            for key, c in channels.items()
+        )
+
+    def items(self, workflow):
+        """Yield the frames of each item of a workflow, in the order of the
+        workflow's arguments, see :data:`mmec_fab.WORKFLOWS`."""
+        if workflow != self.workflow:
+            return
+
+        index = 0
+        while True:
+            frames = [self.channels[key].frame(index) for key in self.keys]
+            if any(frame is None for frame in frames):
+                return
+            yield tuple(frames)
+            index += 1
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab frames", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="frame channel file")
+    parser.add_argument(
+        "--watch", action="store_true", help="print the frames changed by writes"
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print("No frame channel at {}".format(args.path))
+        return 1
+
+    with FrameChannel(args.path) as channel:
+        version, frames = channel.read()
+        print(
+            "{} of {} frames, version {}".format(len(frames), channel.capacity, version)
+        )
+        if not args.watch:
+            return 0
+
+        try:
+            while True:
+                if channel.wait(version, timeout=1.0) == version:
+                    continue
+                version, changed, count = channel.changes(version)
+                print(
+                    "version {}: {} of {} frames changed, {:.1f} ms after the "
+                    "write".format(
+                        version,
+                        len(changed),
+                        count,
+                        (time.time() - channel.updated_at) * 1e3,
+                    )
+                )
+        except KeyboardInterrupt:
+            pass
+    return 0
@@ -0,0 +1,216 @@
+"""Job definitions for the run data files.
+
+A job is one or more stages, each running a :class:`mmec_fab.RobotClient`
+workflow method over the items of a run data file, between a setup and a
+teardown method.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from compas_rrc import Zone
+
+__all__ = [
+    "WORKFLOWS",
+    "JOBS",
+    "Job",
+    "job_for_file",
+    "job_items",
+    "run_job",
+    "with_gripper_trigger",
+]
+
+# Run data keys holding the frames of each workflow argument, in order
+WORKFLOWS = {
+    "pick_place": ["pick_frames", "place_frames"],
+    "base_making": [
+        "pick_frames",
+        "measure_frames",
+        "safeb1_frames",
+        "safeb2_frames",
+        "place_frames",
+    ],
+    "slice_making": ["pick_frames", "measure_frames", "safe_frames", "place_frames"],
+    "slice_placing": [
+        "pick_slice_frames",
+        "safe2_frames",
+        "rotated_safe2_frames",
+        "place_offset_frames",
+        "place_slice_frames",
+    ],
+    "cap_making": ["pick_frames", "measure_frames", "safe_frames", "place_frames"],
+    "point_go": ["pick_frames", "place_frames"],
+    "marking": ["marking_frames", "dummy_frames"],
+    "rolling": ["rolling_frames", "saferight_frames"],
+}
+
+
+class Job(object):
+    """Stages of workflows run on a run data file.
+
+    Parameters
+    ----------
+    name : :obj:`str`
+    stages : :obj:`list` of :obj:`tuple`
+        Pairs of workflow name (a key of :data:`WORKFLOWS`) and keyword
+        arguments for the workflow method.
+    setup : :obj:`str`, optional
+        Client method called before the first stage.
+    teardown : :obj:`str`, optional
+        Client method called after the last stage.
+    """
+
+    def __init__(self, name, stages, setup="pre", teardown="post"):
+        self.name = name
+        self.stages = stages
+        self.setup = setup
+        self.teardown = teardown
+
+    def __repr__(self):
+        return "Job({!r})".format(self.name)
+
+    @property
+    def data(self):
+        return {
+            "name": self.name,
+            "stages": self.stages,
+            "setup": self.setup,
+            "teardown": self.teardown,
+        }
+
+
+def _params(travel_speed=250, offset_distance=150, gripper_trigger=None):
+    params = {
+        "travel_speed": travel_speed,
+        "travel_zone": Zone.Z10,
+        "precise_speed": 100,
+        "precise_zone": Zone.FINE,
+        "offset_distance": offset_distance,
+    }
+    # Gripper switched as part of the pick and retract moves, see
+    # RobotClient.move_and_grip
+    if gripper_trigger is not None:
+        params["gripper_trigger"] = gripper_trigger
+    return params
+
+
+# Workflows switching the gripper with triggers in with_gripper_trigger, the
+# placing workflows keep separate instructions for precise placements
+TRIGGER_WORKFLOWS = ("base_making", "cap_making", "slice_making")
+
+
+def with_gripper_trigger(job, distance=0):
+    """Switch the gripper of a job's making stages as part of the moves.
+
+    Needs the custom instruction in ``00_robotcontrol/03_rapid/A057_Trigger.mod``
+    on the controller.
+
+    Parameters
+    ----------
+    job : :class:`Job`
+    distance : :obj:`float`, optional
+        Distance in mm before the end of the pick move, and after the start
+        of the retract move, where the gripper is switched. ``0`` switches it
+        at the pick frame and on leaving the place frame.
+
+    Returns
+    -------
+    :class:`Job`
+        Job named after the job with ``_trigger`` appended.
+    """
+    stages = []
+    for workflow, params in job.stages:
+        if workflow in TRIGGER_WORKFLOWS:
+            params = dict(params, gripper_trigger=distance)
+        stages.append((workflow, params))
+    return Job(job.name + "_trigger", stages, job.setup, job.teardown)
+
+
+JOBS = {
+    "pick_place": Job("pick_place", [("pick_place", _params())]),
+    "point_go": Job("point_go", [("point_go", _params())]),
+    "marking": Job("marking", [("marking", _params())]),
+    "base_making": Job("base_making", [("base_making", _params())]),
+    "cap_making": Job("cap_making", [("cap_making", _params())]),
+    "slice_making": Job("slice_making", [("slice_making", _params(1000))]),
+    "slice_placing": Job("slice_placing", [("slice_placing", _params())]),
+    "making_placing": Job(
+        "making_placing",
+        [("slice_making", _params(1000)), ("slice_placing", _params())],
+    ),
+    "rolling": Job(
+        "rolling",
+        [("rolling", _params(offset_distance=8))],
+        setup="preroll",
+        teardown="postroll",
+    ),
+}
+
+# Making jobs with gripper triggers, opted into by name
+for _name in ("base_making", "cap_making", "slice_making", "making_placing"):
+    _job = with_gripper_trigger(JOBS[_name])
+    JOBS[_job.name] = _job
+
+# Job used for a run data file, by file name
+JOB_PATTERNS = [
+    ("making_placing", "making_placing"),
+    ("slice_making", "slice_making"),
+    ("slice_placing", "slice_placing"),
+    ("base_making", "base_making"),
+    ("cap_making", "cap_making"),
+    ("rolling", "rolling"),
+    ("location", "marking"),
+    ("pp_frames", "pick_place"),
+]
+
+
+def job_for_file(path):
+    """Find the job of a run data file from its name.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the file name matches no known job.
+    """
+    name = os.path.basename(path).lower()
+    for pattern, job in JOB_PATTERNS:
+        if pattern in name:
+            return JOBS[job]
+
+    raise ValueError("No job known for file {}".format(path))
+
+
+def job_items(data, workflow):
+    """Return the frame tuples of a workflow's items in run data."""
+    return list(zip(*[data[key] for key in WORKFLOWS[workflow]]))
+
+
+def run_job(client, data, job):
+    """Run all stages of a job with a client.
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+    data : :obj:`dict` or :obj:`str` or source
+        Run data, path to a run data file or source of the items' frames, see
+        :func:`mmec_fab.as_source`. Items are taken from the source one by
+        one as they are sent.
+    job : :class:`Job` or :obj:`str`
+        Job or name of a job in :data:`JOBS`.
+    """
+    from mmec_fab.sources import as_source
+
+    source = as_source(data)
+    if not isinstance(job, Job):
+        job = JOBS[job]
+
+    getattr(client, job.setup)()
+
+    for workflow, params in job.stages:
+        method = getattr(client, workflow)
+        for frames in source.items(workflow):
+            method(*frames, **params)
+
+    getattr(client, job.teardown)()
@@ -0,0 +1,616 @@
+"""Batched inverse kinematics and reachability of jobs.
+
+The arm of the cell is an ABB IRB 4600-40/2.55, whose kinematics follow the
+ortho-parallel basis with spherical wrist (OPW) model, so all eight inverse
+kinematics solutions of a pose are found in closed form. Solving is
+vectorized over every target of a job::
+
+    python -m mmec_fab reach 00_robotcontrol/02_run_data/01_slice_making_aa-01-01.json
+
+For each :class:`mmec_fab.Plan` the report lists unreachable targets and
+configuration changes, and estimates the time of each travel move as a joint
+and as a linear move. :func:`choose_motion_types` rewrites travel moves to
+the faster one.
+
+Targets are in work objects, whose position in world is read from a
+controller backup with ``--backup``. Moves in work objects that the backup
+doesn't fix in world are reported as unknown, not checked.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import logging
+import math
+
+import numpy as np
+
+from mmec_fab.rapid_data import quaternion_matrix
+from mmec_fab.rapid_data import slerp
+from mmec_fab.robot_client import SAFE_JOINT_POSITION
+from mmec_fab.robot_client import TRIGGER_INSTRUCTION
+
+__all__ = [
+    "IRB4600_40_255",
+    "forward_kinematics",
+    "inverse_kinematics",
+    "IKSolver",
+    "analyze_plan",
+    "choose_motion_types",
+]
+
+LOGGER = logging.getLogger("mmec_fab")
+
+# OPW parameters in millimetres, joint offsets in radians, limits in degrees
+# and maximum joint speeds in degrees per second
+IRB4600_40_255 = {
+    "a1": 175.0,
+    "a2": -175.0,
+    "b": 0.0,
+    "c1": 495.0,
+    "c2": 1095.0,
+    "c3": 1270.0,
+    "c4": 135.0,
+    "offsets": (0.0, 0.0, -math.pi / 2, 0.0, 0.0, 0.0),
+    "limits": (
+        (-180.0, 180.0),
+        (-90.0, 150.0),
+        (-180.0, 75.0),
+        (-400.0, 400.0),
+        (-125.0, 120.0),
+        (-400.0, 400.0),
+    ),
+    "speeds": (175.0, 175.0, 175.0, 250.0, 250.0, 360.0),
+}
+
+# Default reorientation speed of the controller, in degrees per second
+ORIENTATION_SPEED = 500.0
+
+# Instructions moving to a frame, with the speed and zone at index 13 and 14
+MOVE_INSTRUCTIONS = ("r_RRC_MoveTo", TRIGGER_INSTRUCTION)
+
+
+def _rotation_y(angles):
+    c, s = np.cos(angles), np.sin(angles)
+    zero, one = np.zeros_like(angles), np.ones_like(angles)
+    return np.stack(
+        [
+            np.stack([c, zero, s], -1),
+            np.stack([zero, one, zero], -1),
+            np.stack([-s, zero, c], -1),
+        ],
+        -2,
+    )
+
+
+def _rotation_z(angles):
+    c, s = np.cos(angles), np.sin(angles)
+    zero, one = np.zeros_like(angles), np.ones_like(angles)
+    return np.stack(
+        [
+            np.stack([c, -s, zero], -1),
+            np.stack([s, c, zero], -1),
+            np.stack([zero, zero, one], -1),
+        ],
+        -2,
+    )
+
+
+def forward_kinematics(joints, params=IRB4600_40_255):
+    """Flange poses of joint positions.
+
+    Parameters
+    ----------
+    joints : array-like
+        Joint positions in radians, shape ``(..., 6)``.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Homogeneous transformations, shape ``(..., 4, 4)``.
+    """
+    theta = np.asarray(joints, dtype=float) - params["offsets"]
+    t1, t2, t3, t4, t5, t6 = np.moveaxis(theta, -1, 0)
+
+    psi3 = math.atan2(params["a2"], params["c3"])
+    k = math.hypot(params["a2"], params["c3"])
+
+    cx1 = params["c2"] * np.sin(t2) + k * np.sin(t2 + t3 + psi3) + params["a1"]
+    cy1 = params["b"]
+    cz1 = params["c2"] * np.cos(t2) + k * np.cos(t2 + t3 + psi3)
+
+    center = np.stack(
+        [
+            cx1 * np.cos(t1) - cy1 * np.sin(t1),
+            cx1 * np.sin(t1) + cy1 * np.cos(t1),
+            cz1 + params["c1"],
+        ],
+        -1,
+    )
+
+    rotation = np.matmul(
+        np.matmul(_rotation_z(t1), _rotation_y(t2 + t3)),
+        np.matmul(np.matmul(_rotation_z(t4), _rotation_y(t5)), _rotation_z(t6)),
+    )
+
+    matrix = np.zeros(theta.shape[:-1] + (4, 4))
+    matrix[..., :3, :3] = rotation
+    matrix[..., :3, 3] = center + params["c4"] * rotation[..., :, 2]
+    matrix[..., 3, 3] = 1.0
+    return matrix
+
+
+def inverse_kinematics(matrices, params=IRB4600_40_255):
+    """All eight inverse kinematics solutions of flange poses.
+
+    Parameters
+    ----------
+    matrices : array-like
+        Flange poses in the robot base frame, shape ``(n, 4, 4)``.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Joint positions in radians, shape ``(n, 8, 6)``. Solutions out of
+        reach are ``nan``, joint limits are not applied.
+    """
+    matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+    a1, a2, b = params["a1"], params["a2"], params["b"]
+    c1, c2, c3, c4 = params["c1"], params["c2"], params["c3"], params["c4"]
+
+    rotation = matrices[:, :3, :3]
+    center = matrices[:, :3, 3] - c4 * rotation[:, :, 2]
+    cx, cy, cz = center.T
+
+    with np.errstate(invalid="ignore"):
+        nx1 = np.sqrt(cx**2 + cy**2 - b**2) - a1
+        tmp1 = np.arctan2(cy, cx)
+        tmp2 = np.arctan2(b, nx1 + a1)
+        theta1 = [tmp1 - tmp2, tmp1 + tmp2 - np.pi]
+
+        s1_2 = nx1**2 + (cz - c1) ** 2
+        s2_2 = (nx1 + 2 * a1) ** 2 + (cz - c1) ** 2
+        k_2 = a2**2 + c3**2
+        s1, s2 = np.sqrt(s1_2), np.sqrt(s2_2)
+
+        acos1 = np.arccos((s1_2 + c2**2 - k_2) / (2 * s1 * c2))
+        acos2 = np.arccos((s2_2 + c2**2 - k_2) / (2 * s2 * c2))
+        atan1 = np.arctan2(nx1, cz - c1)
+        atan2 = np.arctan2(nx1 + 2 * a1, cz - c1)
+        theta2 = [-acos1 + atan1, acos1 + atan1, -acos2 - atan2, acos2 - atan2]
+
+        acos3 = np.arccos((s1_2 - c2**2 - k_2) / (2 * c2 * math.sqrt(k_2)))
+        acos4 = np.arccos((s2_2 - c2**2 - k_2) / (2 * c2 * math.sqrt(k_2)))
+        psi = math.atan2(a2, c3)
+        theta3 = [acos3 - psi, -acos3 - psi, acos4 - psi, -acos4 - psi]
+
+    e = rotation
+    solutions = np.full((len(matrices), 8, 6), np.nan)
+
+    for i in range(4):
+        t1 = theta1[i // 2]
+        t2, t3 = theta2[i], theta3[i]
+        sin1, cos1 = np.sin(t1), np.cos(t1)
+        s23, c23 = np.sin(t2 + t3), np.cos(t2 + t3)
+
+        m = e[:, 0, 2] * s23 * cos1 + e[:, 1, 2] * s23 * sin1 + e[:, 2, 2] * c23
+        t5 = np.arctan2(np.sqrt(np.clip(1 - m**2, 0, None)), m)
+        t4 = np.arctan2(
+            e[:, 1, 2] * cos1 - e[:, 0, 2] * sin1,
+            e[:, 0, 2] * c23 * cos1 + e[:, 1, 2] * c23 * sin1 - e[:, 2, 2] * s23,
+        )
+        t6 = np.arctan2(
+            e[:, 0, 1] * s23 * cos1 + e[:, 1, 1] * s23 * sin1 + e[:, 2, 1] * c23,
+            -e[:, 0, 0] * s23 * cos1 - e[:, 1, 0] * s23 * sin1 - e[:, 2, 0] * c23,
+        )
+
+        solutions[:, i] = np.stack([t1, t2, t3, t4, t5, t6], -1)
+        solutions[:, i + 4] = np.stack([t1, t2, t3, t4 + np.pi, -t5, t6 - np.pi], -1)
+
+    solutions += params["offsets"]
+    # Wrap to [-pi, pi), other turns of joints 4 and 6 are chosen later
+    return (solutions + np.pi) % (2 * np.pi) - np.pi
+
+
+def _pose_matrices(points, quaternions):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    matrices = np.zeros((len(points), 4, 4))
+    matrices[:, :3, :3] = quaternion_matrix(np.reshape(quaternions, (-1, 4)))
+    matrices[:, :3, 3] = points
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+class IKSolver(object):
+    """Inverse kinematics of TCP poses, cached per pose.
+
+    Parameters
+    ----------
+    params : :obj:`dict`, optional
+        Robot parameters, see :data:`IRB4600_40_255`.
+    base : array-like, optional
+        Pose of the robot base in world coordinates, a 4x4 matrix.
+    tool : array-like, optional
+        Pose of the TCP in the flange frame, a 4x4 matrix.
+    wobjs : :obj:`dict`, optional
+        Work object name to its pose in world coordinates. Only ``"wobj0"``,
+        the world itself, is known without it.
+    """
+
+    def __init__(self, params=IRB4600_40_255, base=None, tool=None, wobjs=None):
+        self.params = params
+        self.base_inverse = np.linalg.inv(base) if base is not None else np.identity(4)
+        self.tool_inverse = np.linalg.inv(tool) if tool is not None else np.identity(4)
+        self.wobjs = wobjs or {}
+        self.limits = np.radians(params["limits"])
+        self._cache = {}
+
+    def has_wobj(self, wobj):
+        """Whether the position of a work object in world is known."""
+        return wobj == "wobj0" or wobj in self.wobjs
+
+    def flange_matrices(self, points, quaternions, wobj="wobj0"):
+        """Flange poses in the robot base frame of TCP poses in a work object.
+
+        Raises
+        ------
+        :exc:`KeyError`
+            If the position of the work object is not known.
+        """
+        if not self.has_wobj(wobj):
+            raise KeyError("Work object {} has no known position in world".format(wobj))
+
+        matrices = _pose_matrices(points, quaternions)
+        if wobj != "wobj0":
+            matrices = np.matmul(self.wobjs[wobj], matrices)
+        return np.matmul(np.matmul(self.base_inverse, matrices), self.tool_inverse)
+
+    def solve(self, points, quaternions, wobj="wobj0"):
+        """Return all solutions of TCP poses, see :func:`inverse_kinematics`.
+
+        Parameters
+        ----------
+        points : array-like
+            TCP positions in the work object, shape ``(n, 3)``.
+        quaternions : array-like
+            TCP orientations as ``w, x, y, z``, shape ``(n, 4)``.
+        wobj : :obj:`str`, optional
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 3)
+        quaternions = np.asarray(quaternions, dtype=float).reshape(-1, 4)
+        keys = [
+            (wobj,) + tuple(row)
+            for row in np.round(np.hstack([points, quaternions]), 6).tolist()
+        ]
+
+        missing = [i for i, key in enumerate(keys) if key not in self._cache]
+        if missing:
+            # Solve every new pose in one batch
+            unique = list(dict((keys[i], i) for i in missing).values())
+            matrices = self.flange_matrices(points[unique], quaternions[unique], wobj)
+            for i, solutions in zip(unique, inverse_kinematics(matrices, self.params)):
+                self._cache[keys[i]] = solutions
+
+        return np.array([self._cache[key] for key in keys])
+
+    def nearest(self, solutions, previous):
+        """Pick the solution closest to the previous joint positions.
+
+        Other turns of joints 4 and 6 are considered, solutions outside the
+        joint limits are not.
+
+        Parameters
+        ----------
+        solutions : :class:`numpy.ndarray`
+            Solutions of one pose, shape ``(8, 6)``.
+        previous : :class:`numpy.ndarray`
+            Joint positions in radians.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Index of the solution and its joint positions, or ``None`` and
+            ``None`` if no solution is within the limits.
+        """
+        solutions = solutions.copy()
+        for axis in (3, 5):
+            turns = np.round((previous[axis] - solutions[:, axis]) / (2 * np.pi))
+            solutions[:, axis] += turns * 2 * np.pi
+
+        with np.errstate(invalid="ignore"):
+            valid = np.all(
+                (solutions >= self.limits[:, 0]) & (solutions <= self.limits[:, 1]),
+                axis=1,
+            )
+        if not valid.any():
+            return None, None
+
+        speeds = np.radians(self.params["speeds"])
+        cost = np.nanmax(np.abs(solutions - previous) / speeds, axis=1)
+        cost[~valid] = np.inf
+        index = int(np.argmin(cost))
+        return index, solutions[index]
+
+    def joint_time(self, start, end):
+        """Shortest time of a joint move, limited by the slowest joint."""
+        speeds = np.radians(self.params["speeds"])
+        return float(np.max(np.abs(np.asarray(end) - start) / speeds))
+
+
+def _moves(plan):
+    # Move instructions of a plan with the work object they are in
+    wobj = "wobj0"
+    for index, step in enumerate(plan.steps):
+        msg = step.get("msg")
+        if not msg:
+            continue
+        if msg["instruction"] == "r_RRC_SetWorkObject":
+            wobj = msg["string_values"][0]
+        elif msg["instruction"] == "r_RRC_MoveToJoints":
+            yield index, wobj, "joints", msg["float_values"]
+        elif msg["instruction"] in MOVE_INSTRUCTIONS:
+            yield index, wobj, msg["string_values"][0], msg["float_values"]
+
+
+def analyze_plan(plan, solver=None, samples=8):
+    """Check reachability and estimate move times of a plan.
+
+    Joint positions are followed from the safe joint position, choosing for
+    each target the solution closest to the previous one. Linear moves are
+    also checked at intermediate poses. Moves in work objects the solver has
+    no position of are not checked, their ``reachable`` is ``None``.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    solver : :class:`IKSolver`, optional
+    samples : :obj:`int`, optional
+        Intermediate poses checked per linear move.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`dict`
+        One entry per move with the plan ``step`` index, ``motion`` (``"J"``,
+        ``"L"`` or ``"joints"``), ``travel`` (not a fine point),
+        ``reachable``, ``solution`` index, ``joints`` in degrees,
+        ``config_change`` from the previous move, ``joint_time`` and
+        ``linear_time`` estimates in seconds, and ``linear_ok`` if a linear
+        move would keep its configuration.
+    """
+    solver = solver or IKSolver()
+    moves = list(_moves(plan))
+
+    # Solve all frame targets and the intermediate poses of every move in
+    # one batch per work object
+    targets = [m for m in moves if m[2] != "joints" and solver.has_wobj(m[1])]
+    by_wobj = {}
+    for move in targets:
+        by_wobj.setdefault(move[1], []).append(move)
+
+    solutions = {}
+    for wobj, group in by_wobj.items():
+        values = np.array([move[3][:7] for move in group])
+        result = solver.solve(values[:, :3], values[:, 3:7], wobj)
+        for move, solution in zip(group, result):
+            solutions[move[0]] = solution
+
+    report = []
+    previous_joints = np.radians(SAFE_JOINT_POSITION)
+    previous_pose = None
+    previous_solution = None
+
+    for index, wobj, motion, values in moves:
+        entry = {"step": index, "motion": motion[-1] if motion != "joints" else motion}
+
+        if motion == "joints":
+            joints = np.radians(values[:6])
+            entry.update(
+                travel=True,
+                reachable=True,
+                solution=None,
+                joints=values[:6],
+                config_change=False,
+                joint_time=solver.joint_time(previous_joints, joints),
+                linear_time=None,
+                linear_ok=False,
+            )
+            previous_joints, previous_pose, previous_solution = joints, None, None
+            report.append(entry)
+            continue
+
+        speed, zone = values[13], values[14]
+        entry["travel"] = zone >= 0
+        if index not in solutions:
+            entry.update(
+                reachable=None,
+                solution=None,
+                joints=None,
+                config_change=False,
+                joint_time=None,
+                linear_time=None,
+                linear_ok=False,
+            )
+            previous_pose, previous_solution = None, None
+            report.append(entry)
+            continue
+
+        solution, joints = solver.nearest(solutions[index], previous_joints)
+        entry["reachable"] = solution is not None
+        entry["solution"] = solution
+        entry["joints"] = np.degrees(joints).tolist() if joints is not None else None
+        entry["config_change"] = (
+            solution is not None
+            and previous_solution is not None
+            and solution != previous_solution
+        )
+        entry["joint_time"] = (
+            solver.joint_time(previous_joints, joints) if joints is not None else None
+        )
+
+        pose = (wobj, np.array(values[:3]), np.array(values[3:7]))
+        entry["linear_time"] = None
+        entry["linear_ok"] = False
+        if (
+            previous_pose is not None
+            and previous_pose[0] == wobj
+            and joints is not None
+        ):
+            distance = np.linalg.norm(pose[1] - previous_pose[1])
+            angle = 2 * np.arccos(min(abs(np.dot(pose[2], previous_pose[2])), 1.0))
+            entry["linear_time"] = max(
+                distance / speed, np.degrees(angle) / ORIENTATION_SPEED
+            )
+
+            # Intermediate poses must stay in the same configuration
+            t = np.linspace(0, 1, samples + 2)[1:-1]
+            points = previous_pose[1] + t[:, None] * (pose[1] - previous_pose[1])
+            quaternions = slerp(previous_pose[2], pose[2], t)
+            path = solver.solve(points, quaternions, wobj)
+            linear_ok = previous_solution == solution
+            current = previous_joints
+            for pose_solutions in path:
+                step_solution, current = solver.nearest(pose_solutions, current)
+                if step_solution != solution:
+                    linear_ok = False
+                    break
+            entry["linear_ok"] = bool(linear_ok)
+
+            # Linear moves also cannot be faster than the joints allow
+            if entry["joint_time"] is not None:
+                entry["linear_time"] = max(entry["linear_time"], entry["joint_time"])
+
+        if joints is not None:
+            previous_joints = joints
+            previous_solution = solution
+        previous_pose = pose
+        report.append(entry)
+
+    return report
+
+
+def choose_motion_types(plan, report, margin=0.1):
+    """Return a copy of a plan with the faster motion type for travel moves.
+
+    Travel moves become linear if that keeps the configuration and is not
+    slower than a joint move, and joint moves if those are faster by more
+    than ``margin`` (relative). Fine point moves are not changed.
+
+    Returns
+    -------
+    :obj:`tuple`
+        The new :class:`mmec_fab.Plan` and the number of moves changed.
+    """
+    from mmec_fab.plan import Plan
+
+    steps = copy.deepcopy(plan.steps)
+    changed = 0
+
+    for entry in report:
+        if not entry["travel"] or entry["motion"] not in ("J", "L"):
+            continue
+        if entry["joint_time"] is None or entry["linear_time"] is None:
+            continue
+
+        linear = entry["linear_ok"] and entry["linear_time"] <= entry["joint_time"]
+        joint = entry["joint_time"] < entry["linear_time"] * (1 - margin)
+        motion = entry["motion"]
+        if motion == "J" and linear:
+            motion = "L"
+        elif motion == "L" and (joint or not entry["linear_ok"]):
+            motion = "J"
+
+        if motion != entry["motion"]:
+            steps[entry["step"]]["msg"]["string_values"][0] = "Frame" + motion
+            changed += 1
+
+    return Plan(plan.job, plan.items, steps), changed
+
+
+def _summary(report):
+    moves = [entry for entry in report if entry["motion"] != "joints"]
+    return {
+        "moves": len(moves),
+        "unreachable": sum(1 for entry in moves if entry["reachable"] is False),
+        "unknown": sum(1 for entry in moves if entry["reachable"] is None),
+        "config_changes": sum(1 for entry in moves if entry["config_change"]),
+        "linear_config_changes": sum(
+            1 for entry in moves if entry["config_change"] and entry["motion"] == "L"
+        ),
+        "joint_time": sum(entry["joint_time"] or 0 for entry in report),
+    }
+
+
+def _solver(backup=None, tool=None):
+    if backup is None:
+        return IKSolver()
+
+    from mmec_fab.rapid_data import load_setup
+
+    setup = load_setup(backup)
+    wobjs = {}
+    for name in setup.wobjs:
+        try:
+            wobjs[name] = setup.wobj_matrix(name)
+        except ValueError as error:
+            LOGGER.warning("%s, its moves are not checked", error)
+    return IKSolver(tool=setup.tool_matrix(tool) if tool else None, wobjs=wobjs)
+
+
+def main(argv=None):
+    import argparse
+    import os
+
+    from mmec_fab.plan import prepare_job
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab reach", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("paths", nargs="+", help="run data files")
+    parser.add_argument("--job", help="job for all files")
+    parser.add_argument("--backup", help="controller backup with the work objects")
+    parser.add_argument("--tool", help="tool of the backup to use")
+    parser.add_argument(
+        "--output",
+        help="directory to write plans with the faster motion type for travel moves",
+    )
+    args = parser.parse_args(argv)
+
+    solver = _solver(args.backup, args.tool)
+    errors = 0
+
+    for path in args.paths:
+        plan = prepare_job(path, args.job)
+        report = analyze_plan(plan, solver)
+        summary = _summary(report)
+
+        print(path)
+        print(
+            "  {moves} moves, {unreachable} unreachable, {config_changes} "
+            "configuration changes ({linear_config_changes} in linear moves), "
+            "{joint_time:.1f} s of joint motion".format(**summary)
+        )
+        if summary["unknown"]:
+            print(
+                "  {unknown} moves not checked, their work objects have no known "
+                "position in world".format(**summary)
+            )
+        for entry in report:
+            if entry["reachable"] is False:
+                print("  step {step}: unreachable".format(**entry))
+            elif entry["config_change"] and entry["motion"] == "L":
+                print(
+                    "  step {step}: configuration change in linear move".format(**entry)
+                )
+
+        new_plan, changed = choose_motion_types(plan, report)
+        print("  {} travel moves would change motion type".format(changed))
+        if args.output:
+            if not os.path.isdir(args.output):
+                os.makedirs(args.output)
+            name = os.path.splitext(os.path.basename(path))[0] + ".plan.json"
+            new_plan.to_json(os.path.join(args.output, name))
+
+        errors += summary["unreachable"] + summary["linear_config_changes"]
+
+    return 1 if errors else 0
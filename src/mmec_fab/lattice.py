@@ -0,0 +1,638 @@
+"""Generate run data from a lattice description, without Grasshopper.
+
+Lattices are stacks of identical slices. Each slice is two rails with rungs
+and diagonals nailed on top, and the slices are joined by rolling connectors.
+Members are held as arrays and all frames of a workflow are computed at once::
+
+    python -m mmec_fab generate out --slices 12 --rung-count 4
+    python -m mmec_fab generate out --dae "01_Setup/01_3D_object/3D Lattice.dae"
+    python -m mmec_fab prepare out
+
+Station positions default to the ones of the files in
+``00_robotcontrol/02_run_data``.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+__all__ = [
+    "Members",
+    "LatticeSpec",
+    "making_run_data",
+    "placing_run_data",
+    "rolling_run_data",
+    "write_run_data",
+    "generate_run_data",
+]
+
+COLLADA_NS = {"c": "http://www.collada.org/2005/11/COLLADASchema"}
+
+# Members are cut centred on this point of the cutting table, the pick frame at
+# one end and the measure frame at the other
+CUT_CENTER = (1206.5, 400.0, 9.0)
+
+# Frames of the cutting table and safe positions, as x and y axis
+DOWN_AXES = ((0.0, 1.0, 0.0), (1.0, 0.0, 0.0))
+
+# Safe positions of the files aa-01-02 to aa-01-08, aa-01-01 of slice making
+# is 300 mm higher
+SAFE_POINTS = {
+    "slice_making": [(1492.36, -753.33, 50.0)],
+    "cap_making": [(1071.38, -143.24, 50.0)],
+    "base_making": [(1071.38, -143.24, 50.0), (1062.67, 1262.06, 50.0)],
+}
+
+ROLLING_SAFE_POINT = (-250.0, 445.0, 750.0)
+ROLLING_END_POINT = (-250.0, 445.0, 1981.0)
+ROLLING_AXES = ((0.0, -1.0, 0.0), (0.0, 0.0, -1.0))
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=float)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _frames(points, xaxes, yaxes):
+    # Encode frames the way compas.json_dump does, without building objects
+    points, xaxes, yaxes = np.broadcast_arrays(points, xaxes, yaxes)
+    return [
+        {
+            "dtype": "compas.geometry/Frame",
+            "value": {"point": point, "xaxis": xaxis, "yaxis": yaxis},
+        }
+        for point, xaxis, yaxis in zip(points.tolist(), xaxes.tolist(), yaxes.tolist())
+    ]
+
+
+class Members(object):
+    """Straight members of a lattice.
+
+    Parameters
+    ----------
+    centers : array-like
+        Centre points, shape ``(n, 3)``.
+    directions : array-like
+        Unit vectors along the length of the members, shape ``(n, 3)``.
+    normals : array-like
+        Unit vectors normal to the face the members are nailed on, shape
+        ``(n, 3)``.
+    lengths : array-like
+        Lengths, shape ``(n,)``.
+    """
+
+    def __init__(self, centers, directions, normals, lengths):
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        self.directions = _unit(directions).reshape(-1, 3)
+        self.normals = _unit(normals).reshape(-1, 3)
+        self.lengths = np.asarray(lengths, dtype=float).reshape(-1)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, index):
+        """Select members by index, slice or boolean mask."""
+        return Members(
+            self.centers[index],
+            self.directions[index],
+            self.normals[index],
+            self.lengths[index],
+        )
+
+    @classmethod
+    def concatenate(cls, members):
+        return cls(
+            np.concatenate([m.centers for m in members]),
+            np.concatenate([m.directions for m in members]),
+            np.concatenate([m.normals for m in members]),
+            np.concatenate([m.lengths for m in members]),
+        )
+
+    @classmethod
+    def from_dae(cls, path):
+        """Read members from a COLLADA file exported from Rhino.
+
+        Each geometry is one member. Its length and axes are the extents and
+        principal axes of its vertices, the normal being the axis of the
+        smallest extent.
+        """
+        root = ET.parse(path).getroot()
+        meshes = []
+        for mesh in root.iterfind("c:library_geometries/c:geometry/c:mesh", COLLADA_NS):
+            source = mesh.find("c:vertices/c:input[@semantic='POSITION']", COLLADA_NS)
+            source = source.get("source").lstrip("#")
+            for node in mesh.iterfind("c:source", COLLADA_NS):
+                if node.get("id") == source:
+                    values = node.find("c:float_array", COLLADA_NS).text.split()
+                    meshes.append(np.array(values, dtype=float).reshape(-1, 3))
+
+        count = len(meshes)
+        centers = np.empty((count, 3))
+        axes = np.empty((count, 3, 3))
+        extents = np.empty((count, 3))
+
+        # Batch the decompositions of meshes with the same vertex count
+        sizes = np.array([len(mesh) for mesh in meshes])
+        for size in np.unique(sizes):
+            indices = np.flatnonzero(sizes == size)
+            vertices = np.stack([meshes[i] for i in indices])
+            mean = vertices.mean(axis=1)
+            _, _, vt = np.linalg.svd(vertices - mean[:, None, :])
+            projected = np.einsum("nvk,nak->nva", vertices - mean[:, None, :], vt)
+            low, high = projected.min(axis=1), projected.max(axis=1)
+
+            centers[indices] = mean + np.einsum("na,nak->nk", (low + high) / 2, vt)
+            axes[indices] = vt
+            extents[indices] = high - low
+
+        # Point directions along the positive side of their main component
+        directions = axes[:, 0]
+        main = np.abs(directions).argmax(axis=1)
+        directions *= np.sign(directions[np.arange(count), main])[:, None]
+
+        return cls(centers, directions, axes[:, 2], extents[:, 0])
+
+    def transformed(self, matrix):
+        """Return the members transformed by a 4x4 matrix."""
+        matrix = np.asarray(matrix, dtype=float)
+        rotation, translation = matrix[:3, :3], matrix[:3, 3]
+        return Members(
+            self.centers.dot(rotation.T) + translation,
+            self.directions.dot(rotation.T),
+            self.normals.dot(rotation.T),
+            self.lengths,
+        )
+
+    def place_frames(self):
+        """Frames of the members, y axis along and z axis normal to them.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Points, x axes and y axes, each of shape ``(n, 3)``.
+        """
+        xaxes = _unit(np.cross(self.normals, self.directions))
+        return self.centers, xaxes, self.directions
+
+    def group(self, axis, tolerance=1.0):
+        """Split members into groups with the same centre position along an axis.
+
+        Returns
+        -------
+        :obj:`list` of :class:`Members`
+            Groups in ascending order along the axis.
+        """
+        values = self.centers.dot(_unit(axis))
+        order = np.argsort(values, kind="mergesort")
+        breaks = np.flatnonzero(np.diff(values[order]) > tolerance) + 1
+        return [self[indices] for indices in np.split(order, breaks)]
+
+
+class LatticeSpec(object):
+    """Parametric lattice.
+
+    Slices are laid out at the making station around ``station_center``: two
+    rails along y, with ``rung_count`` rungs across them and diagonals between
+    consecutive rungs. Dimensions are in millimetres.
+
+    Parameters
+    ----------
+    slices : :obj:`int`
+        Number of slices.
+    rung_count : :obj:`int`
+        Rungs per slice.
+    rung_pitch : :obj:`float`
+        Distance between rungs.
+    rail_spacing : :obj:`float`
+        Distance between the rail centre lines.
+    rung_length : :obj:`float`
+    member_width : :obj:`float`
+        Width of the members, rails overhang the outer rungs by half of it.
+    diagonal_clearance : :obj:`float`
+        Gap between diagonals and rungs along the rails.
+    rail_z, top_z : :obj:`float`
+        Height of the rail and top layer frames at the making station.
+    station_center : :obj:`tuple`
+        Centre of the slice at the making station.
+    slice_origin : :obj:`tuple`
+        Placing frame of the first slice in the lattice.
+    slice_step : :obj:`tuple`
+        Offset between the placing frames of consecutive slices.
+    slice_axes : :obj:`tuple`
+        X and y axis of the placing frames.
+    rolling_origin : :obj:`tuple`
+        First rolling connector node.
+    rolling_slice_step : :obj:`tuple`
+        Offset between the nodes of consecutive slices in a row.
+    rolling_row_step : :obj:`tuple`
+        Offset between rows of rolling connectors.
+    rolling_rows : :obj:`int`
+        Number of rows of rolling connectors.
+    """
+
+    def __init__(
+        self,
+        slices=11,
+        rung_count=3,
+        rung_pitch=731.0,
+        rail_spacing=180.0,
+        rung_length=250.0,
+        member_width=20.0,
+        diagonal_clearance=25.0,
+        rail_z=9.0,
+        top_z=18.0,
+        station_center=(195.0, 767.0),
+        slice_origin=(0.0, 2050.47, 1130.0),
+        slice_step=(0.0, -98.2, 0.0),
+        slice_axes=((-0.3569, 0.0, -0.9341), (-0.9341, 0.0, 0.3569)),
+        rolling_origin=(20.0, 693.07, 131.46),
+        rolling_slice_step=(0.0, -97.43, 0.0),
+        rolling_row_step=(0.0, 0.0, 112.46),
+        rolling_rows=12,
+    ):
+        self.slices = slices
+        self.rung_count = rung_count
+        self.rung_pitch = rung_pitch
+        self.rail_spacing = rail_spacing
+        self.rung_length = rung_length
+        self.member_width = member_width
+        self.diagonal_clearance = diagonal_clearance
+        self.rail_z = rail_z
+        self.top_z = top_z
+        self.station_center = station_center
+        self.slice_origin = slice_origin
+        self.slice_step = slice_step
+        self.slice_axes = slice_axes
+        self.rolling_origin = rolling_origin
+        self.rolling_slice_step = rolling_slice_step
+        self.rolling_row_step = rolling_row_step
+        self.rolling_rows = rolling_rows
+
+    def slice_members(self):
+        """Members of one slice at the making station, in building order."""
+        cx, cy = self.station_center
+        span = (self.rung_count - 1) * self.rung_pitch
+        up = (0.0, 0.0, 1.0)
+
+        rails = Members(
+            [
+                (cx - self.rail_spacing / 2, cy, self.rail_z),
+                (cx + self.rail_spacing / 2, cy, self.rail_z),
+            ],
+            [(0.0, 1.0, 0.0)] * 2,
+            [up] * 2,
+            [span + self.member_width] * 2,
+        )
+
+        # Rungs and diagonals alternate along the rails
+        rung_y = cy - span / 2 + self.rung_pitch * np.arange(self.rung_count)
+        rungs = Members(
+            np.column_stack(
+                [np.full_like(rung_y, cx), rung_y, np.full_like(rung_y, self.top_z)]
+            ),
+            np.tile([1.0, 0.0, 0.0], (len(rung_y), 1)),
+            np.tile(up, (len(rung_y), 1)),
+            np.full_like(rung_y, self.rung_length),
+        )
+
+        middle_y = (rung_y[:-1] + rung_y[1:]) / 2
+        sign = np.where(np.arange(len(middle_y)) % 2, 1.0, -1.0)
+        rise = self.rung_pitch - 2 * self.diagonal_clearance
+        directions = np.column_stack(
+            [np.full_like(middle_y, self.rail_spacing), sign * rise, 0 * middle_y]
+        )
+        diagonals = Members(
+            np.column_stack(
+                [
+                    np.full_like(middle_y, cx),
+                    middle_y,
+                    np.full_like(middle_y, self.top_z),
+                ]
+            ),
+            directions,
+            np.tile(up, (len(middle_y), 1)),
+            np.linalg.norm(directions, axis=1),
+        )
+
+        top = Members.concatenate([rungs, diagonals])
+        order = np.argsort(top.centers[:, 1], kind="mergesort")
+        return Members.concatenate([rails, top[order]])
+
+    def slice_frames(self):
+        """Placing frames of the slices in the lattice.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Points, x axes and y axes.
+        """
+        steps = np.arange(self.slices)[:, None] * np.asarray(self.slice_step)
+        xaxis, yaxis = _unit(self.slice_axes)
+        return np.asarray(self.slice_origin) + steps, xaxis, yaxis
+
+    def rolling_nodes(self):
+        """Rolling connector nodes, one row across the slices per height.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Shape ``(rolling_rows, slices, 3)``.
+        """
+        rows = np.arange(self.rolling_rows)[:, None, None]
+        slices = np.arange(self.slices)[None, :, None]
+        return (
+            np.asarray(self.rolling_origin)
+            + rows * np.asarray(self.rolling_row_step)
+            + slices * np.asarray(self.rolling_slice_step)
+        )
+
+
+def making_run_data(members, workflow="slice_making", safe_points=None):
+    """Run data of a making workflow.
+
+    Parameters
+    ----------
+    members : :class:`Members`
+        Members at the making station, in building order.
+    workflow : :obj:`str`, optional
+        ``"slice_making"``, ``"cap_making"`` or ``"base_making"``.
+    safe_points : :obj:`list`, optional
+        Safe positions, defaults to the ones in :data:`SAFE_POINTS`.
+
+    Returns
+    -------
+    :obj:`dict`
+    """
+    safe_points = safe_points or SAFE_POINTS[workflow]
+    count = len(members)
+    xaxis, yaxis = DOWN_AXES
+
+    ends = np.tile(CUT_CENTER, (count, 1))
+    half = members.lengths / 2
+    pick = ends - np.column_stack([half, 0 * half, 0 * half])
+    measure = ends + np.column_stack([half, 0 * half, 0 * half])
+
+    data = {
+        "pick_frames": _frames(pick, xaxis, yaxis),
+        "measure_frames": _frames(measure, xaxis, yaxis),
+        "place_frames": _frames(*members.place_frames()),
+    }
+
+    if workflow == "base_making":
+        names = ["safeb1_frames", "safeb2_frames"]
+    else:
+        names = ["safe_frames"]
+    for name, point in zip(names, safe_points):
+        data[name] = _frames(np.tile(point, (count, 1)), xaxis, yaxis)
+
+    return data
+
+
+def placing_run_data(
+    points,
+    xaxes,
+    yaxes,
+    pick_frame=(
+        (1750.0, 500.0, 158.0),
+        (-0.3569, -0.9341, 0.0),
+        (-0.9341, 0.3569, 0.0),
+    ),
+    lift=1200.0,
+    approach=(0.0, 50.0, 200.0),
+):
+    """Run data of the slice placing workflow.
+
+    Parameters
+    ----------
+    points, xaxes, yaxes : array-like
+        Placing frames of the slices in the lattice.
+    pick_frame : :obj:`tuple`, optional
+        Point, x and y axis of the slice at the making station.
+    lift : :obj:`float`, optional
+        Height of the safe frame above the pick frame.
+    approach : :obj:`tuple`, optional
+        Offset of the approach frame from the placing frame.
+    """
+    points, xaxes, yaxes = np.broadcast_arrays(
+        np.asarray(points, dtype=float).reshape(-1, 3), _unit(xaxes), _unit(yaxes)
+    )
+    count = len(points)
+
+    pick_point, pick_x, pick_y = [np.asarray(v, dtype=float) for v in pick_frame]
+    pick_x, pick_y = _unit(pick_x), _unit(pick_y)
+    pick_points = np.tile(pick_point, (count, 1))
+    safe_points = pick_points + (0.0, 0.0, lift)
+
+    return {
+        "pick_slice_frames": _frames(pick_points, pick_x, pick_y),
+        "safe2_frames": _frames(safe_points, pick_x, pick_y),
+        "rotated_safe2_frames": _frames(safe_points, xaxes, yaxes),
+        "place_offset_frames": _frames(points + approach, xaxes, yaxes),
+        "place_slice_frames": _frames(points, xaxes, yaxes),
+    }
+
+
+def rolling_run_data(
+    nodes, safe_point=ROLLING_SAFE_POINT, end_point=ROLLING_END_POINT, axes=ROLLING_AXES
+):
+    """Run data of the rolling workflow.
+
+    Each row of nodes is rolled in turn from the safe position, then the robot
+    leaves the lattice to the end position.
+
+    Parameters
+    ----------
+    nodes : array-like
+        Rolling nodes, shape ``(rows, nodes, 3)``.
+    """
+    nodes = np.asarray(nodes, dtype=float)
+    rows, count = nodes.shape[:2]
+
+    safe = np.tile(safe_point, (rows, 1, 1))
+    points = np.concatenate([safe, nodes], axis=1).reshape(-1, 3)
+    points = np.concatenate([points, [end_point]])
+
+    frames = _frames(points, *axes)
+    return {"rolling_frames": frames, "saferight_frames": list(frames)}
+
+
+def write_run_data(data, path):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def _slices_from_dae(path, stack_axis, connector_length, spec):
+    members = Members.from_dae(path)
+    connectors = members[members.lengths < connector_length]
+    slices = members[members.lengths >= connector_length].group(stack_axis)
+
+    making = []
+    frames = []
+    stack_axis = _unit(stack_axis)
+    for group in slices:
+        # Slice frame: centred, y along the rails and normal along the stack
+        center = group.centers.mean(axis=0)
+        yaxis = group.directions[np.argmax(group.lengths)]
+        yaxis = _unit(yaxis - yaxis.dot(stack_axis) * stack_axis)
+        xaxis = np.cross(yaxis, stack_axis)
+        frames.append((center, xaxis, yaxis))
+
+        to_local = np.identity(4)
+        to_local[:3, :3] = [xaxis, yaxis, stack_axis]
+        to_local[:3, 3] = -to_local[:3, :3].dot(center)
+        # Members are laid flat at the making station
+        local = group.transformed(to_local)
+        local.directions[:, 2] = 0
+        local.normals[:] = (0.0, 0.0, 1.0)
+        local.centers += tuple(spec.station_center) + (spec.rail_z,)
+        making.append(
+            Members(local.centers, local.directions, local.normals, local.lengths)
+        )
+
+    points, xaxes, yaxes = [np.array(values) for values in zip(*frames)]
+
+    rows = connectors.group(stack_axis)
+    width = min(len(row) for row in rows) if rows else 0
+    nodes = np.array([row.centers[:width] for row in rows]).reshape(-1, width, 3)
+
+    return making, (points, xaxes, yaxes), nodes
+
+
+def generate_run_data(directory, name="gen", spec=None, dae=None, **dae_options):
+    """Write the run data files of a lattice.
+
+    Writes a making and a placing file per slice, the placing of all slices
+    and the rolling file. The first slice is made as the base and the last
+    one as the cap.
+
+    Parameters
+    ----------
+    directory : :obj:`str`
+    name : :obj:`str`, optional
+        Suffix of the file names.
+    spec : :class:`LatticeSpec`, optional
+        Parametric lattice, the default if neither this nor ``dae`` is given.
+        With ``dae``, only its making station position is used.
+    dae : :obj:`str`, optional
+        COLLADA file to read members from instead.
+    dae_options
+        ``stack_axis`` and ``connector_length`` for reading a COLLADA file.
+        Members shorter than ``connector_length`` are rolling connectors, the
+        others are grouped into slices along ``stack_axis``.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`str`
+        Paths of the written files.
+    """
+    spec = spec or LatticeSpec()
+    if dae:
+        making, placing, nodes = _slices_from_dae(
+            dae,
+            dae_options.get("stack_axis", (0.0, 0.0, 1.0)),
+            dae_options.get("connector_length", 400.0),
+            spec,
+        )
+    else:
+        making = [spec.slice_members()] * spec.slices
+        placing = spec.slice_frames()
+        nodes = spec.rolling_nodes()
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    paths = []
+
+    def write(data, filename):
+        path = os.path.join(directory, filename)
+        write_run_data(data, path)
+        paths.append(path)
+
+    points, xaxes, yaxes = placing
+    xaxes, yaxes = np.broadcast_to(xaxes, points.shape), np.broadcast_to(
+        yaxes, points.shape
+    )
+
+    # The first slice is built at the base station and the last one is the cap
+    for i, members in enumerate(making):
+        if i == 0:
+            workflow, filename = "base_making", "00_Base_making_{}.json"
+        elif i == len(making) - 1:
+            workflow, filename = "cap_making", "00_Cap_making_{}.json"
+        else:
+            workflow, filename = "slice_making", "01_slice_making_{}-{:02d}.json"
+
+        write(making_run_data(members, workflow), filename.format(name, i + 1))
+        write(
+            placing_run_data(points[i], xaxes[i], yaxes[i]),
+            "02_slice_placing_{}-{:02d}.json".format(name, i + 1),
+        )
+
+    write(
+        placing_run_data(points, xaxes, yaxes), "02_slice_placing_{}.json".format(name)
+    )
+    if len(nodes):
+        write(rolling_run_data(nodes), "04_rolling_{}.json".format(name))
+
+    return paths
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab generate", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("directory", help="output directory")
+    parser.add_argument("--name", default="gen", help="suffix of the file names")
+    parser.add_argument("--dae", help="read members from a COLLADA file")
+    parser.add_argument(
+        "--stack-axis",
+        type=float,
+        nargs=3,
+        default=(0.0, 0.0, 1.0),
+        help="axis slices are stacked along in the COLLADA file",
+    )
+    parser.add_argument(
+        "--connector-length",
+        type=float,
+        default=400.0,
+        help="members shorter than this are rolling connectors",
+    )
+    defaults = LatticeSpec()
+    for option in ("slices", "rung_count", "rolling_rows"):
+        parser.add_argument(
+            "--" + option.replace("_", "-"), type=int, default=getattr(defaults, option)
+        )
+    for option in ("rung_pitch", "rail_spacing", "rung_length"):
+        parser.add_argument(
+            "--" + option.replace("_", "-"),
+            type=float,
+            default=getattr(defaults, option),
+        )
+    args = parser.parse_args(argv)
+
+    spec = LatticeSpec(
+        slices=args.slices,
+        rung_count=args.rung_count,
+        rung_pitch=args.rung_pitch,
+        rail_spacing=args.rail_spacing,
+        rung_length=args.rung_length,
+        rolling_rows=args.rolling_rows,
+    )
+    paths = generate_run_data(
+        args.directory,
+        args.name,
+        spec=spec,
+        dae=args.dae,
+        stack_axis=args.stack_axis,
+        connector_length=args.connector_length,
+    )
+    for path in paths:
+        print("wrote    {}".format(path))
+    return 0
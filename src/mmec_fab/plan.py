@@ -0,0 +1,607 @@
+"""Prepared instruction plans and their on-disk cache.
+
+Preparing a job parses its run data and computes every frame and instruction
+once. The resulting :class:`Plan` is stored in a cache keyed by the hash of the
+run data, the job and the code compiling it, see :data:`CODE_MODULES`, so
+running the same job again starts immediately::
+
+    python -m mmec_fab prepare 00_robotcontrol/02_run_data
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+
+import compas_rrc
+from compas import json_loads
+
+from mmec_fab.jobs import JOBS
+from mmec_fab.jobs import WORKFLOWS
+from mmec_fab.jobs import Job
+from mmec_fab.jobs import job_for_file
+from mmec_fab.jobs import job_items
+from mmec_fab.jobs import run_job
+from mmec_fab.robot_client import RobotClient
+from mmec_fab.utils import file_hash
+
+__all__ = [
+    "Plan",
+    "PlanClient",
+    "PlanCache",
+    "DEFAULT_CACHE_DIR",
+    "compile_job",
+    "compile_job_incremental",
+    "diff_run_data",
+    "prepare_job",
+    "prepare_files",
+]
+
+LOGGER = logging.getLogger("mmec_fab")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mmec_fab", "plans")
+
+# Bump when the plan layout changes to invalidate cached plans
+PLAN_VERSION = 1
+
+# Modules whose code changes compiled plans, cached plans are compiled again
+# when one changes
+CODE_MODULES = ("robot_client", "jobs", "utils", "plan", "sources", "cutting", "tuning")
+
+
+class Plan(object):
+    """Instructions of a job, ready to send with :meth:`RobotClient.run_plan`.
+
+    Parameters
+    ----------
+    job : :obj:`dict`
+        Description of the job, see :attr:`mmec_fab.Job.data`.
+    items : :obj:`list` of :obj:`dict`
+        Workflow name and parameters of each item.
+    steps : :obj:`list` of :obj:`dict`
+        Steps in send order. Each has the ``item`` index (``-1`` outside of
+        items) and ``phase``, and either an instruction ``msg`` with a ``wait``
+        flag or an operator ``prompt``. The first step of each phase has
+        ``new_phase`` set.
+    """
+
+    def __init__(self, job, items, steps):
+        self.job = job
+        self.items = items
+        self.steps = steps
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def data(self):
+        return {
+            "version": PLAN_VERSION,
+            "job": self.job,
+            "items": self.items,
+            "steps": self.steps,
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data["job"], data["items"], data["steps"])
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.data, f, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls.from_data(json.load(f))
+
+
+class PlanClient(RobotClient):
+    """Client recording instructions into a :class:`Plan` instead of sending them.
+
+    Runs the same workflow methods as :class:`RobotClient` without a
+    connection to a controller.
+    """
+
+    def __init__(self):
+        self._init_state()
+        # Waits are recorded with the timeouts of a client without adaptive
+        # timeouts, run_plan uses the adaptive ones where none is recorded
+        self.timeouts = None
+        self.items = []
+        self.steps = []
+        self._new_phase = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def plan(self, job):
+        """Return the recorded plan.
+
+        Parameters
+        ----------
+        job : :class:`mmec_fab.Job`
+        """
+        return Plan(job.data, self.items, self.steps)
+
+    def send(self, instruction):
+        self._record({"msg": instruction.msg, "wait": False})
+
+    def send_and_wait(self, instruction, timeout=None):
+        self._record({"msg": instruction.msg, "wait": True, "timeout": timeout})
+
+    def prompt(self, text):
+        self._record({"prompt": text})
+
+    def set_phase(self, phase):
+        super(PlanClient, self).set_phase(phase)
+        self._new_phase = True
+
+    def _start_item(self, workflow, **params):
+        super(PlanClient, self)._start_item(workflow, **params)
+        self.items.append({"workflow": workflow, "params": params})
+
+    def _record(self, step):
+        step["item"] = self.item_index if self.workflow else -1
+        step["phase"] = self.phase
+
+        if self._new_phase:
+            step["new_phase"] = True
+            self._new_phase = False
+
+        self.steps.append(step)
+
+
+def compile_job(data, job):
+    """Compile the plan of a job.
+
+    Parameters
+    ----------
+    data : :obj:`dict` or :obj:`str`
+        Run data or path to a run data file.
+    job : :class:`mmec_fab.Job` or :obj:`str`
+        Job or name of a job in :data:`mmec_fab.JOBS`.
+
+    Returns
+    -------
+    :class:`Plan`
+    """
+    if not isinstance(job, Job):
+        job = JOBS[job]
+
+    client = PlanClient()
+    run_job(client, data, job)
+    return _add_cut_plan(client.plan(job), data)
+
+
+def _add_cut_plan(plan, data):
+    # Run data reordered for cutting from stock, see mmec_fab.plan_cuts
+    if not isinstance(data, dict) or not data.get("cut_plan"):
+        return plan
+
+    from mmec_fab.cutting import add_stock_prompts
+
+    return add_stock_prompts(plan, data["cut_plan"])
+
+
+def _code_hash():
+    # Hash of the code compiling plans, the client's instructions come from
+    # compas_rrc
+    sha = hashlib.sha1(compas_rrc.__version__.encode("utf-8"))
+    for name in CODE_MODULES:
+        module = importlib.import_module("mmec_fab." + name)
+        sha.update(file_hash(module.__file__.replace(".pyc", ".py")).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _element_hash(element):
+    return hashlib.sha1(json.dumps(element, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def item_key(elements, workflow, params, code_hash=None):
+    """Cache key of the compiled steps of a single item.
+
+    Parameters
+    ----------
+    elements : :obj:`tuple`
+        Undecoded run data of the item, one element per workflow argument.
+    workflow : :obj:`str`
+    params : :obj:`dict`
+    """
+    sha = hashlib.sha1()
+    for element in elements:
+        sha.update(_element_hash(element).encode("utf-8"))
+    sha.update(json.dumps([workflow, params], sort_keys=True).encode("utf-8"))
+    sha.update("{}:{}".format(PLAN_VERSION, code_hash or _code_hash()).encode("utf-8"))
+    return "item-" + sha.hexdigest()
+
+
+def _item_hashes(data, job):
+    return {
+        workflow: [
+            [_element_hash(element) for element in elements]
+            for elements in job_items(data, workflow)
+        ]
+        for workflow, _ in job.stages
+    }
+
+
+def _diff_hashes(old, new, job):
+    diff = {}
+    for workflow, _ in job.stages:
+        keys = WORKFLOWS[workflow]
+        old_items = old.get(workflow, [])
+        new_items = new[workflow]
+
+        changed = []
+        for index, (old_item, new_item) in enumerate(zip(old_items, new_items)):
+            roles = [key for key, a, b in zip(keys, old_item, new_item) if a != b]
+            if roles:
+                changed.append((index, roles))
+
+        diff[workflow] = {
+            "changed": changed,
+            "added": list(range(len(old_items), len(new_items))),
+            "removed": list(range(len(new_items), len(old_items))),
+        }
+    return diff
+
+
+def diff_run_data(old, new, job):
+    """Compare two versions of undecoded run data item by item.
+
+    Parameters
+    ----------
+    old : :obj:`dict`
+    new : :obj:`dict`
+    job : :class:`mmec_fab.Job` or :obj:`str`
+        Job or name of a job in :data:`mmec_fab.JOBS`.
+
+    Returns
+    -------
+    :obj:`dict`
+        Per workflow of the job, a dictionary with the ``changed`` items as
+        pairs of index and list of changed run data keys, and the indices of
+        ``added`` and ``removed`` items.
+    """
+    if not isinstance(job, Job):
+        job = JOBS[job]
+    return _diff_hashes(_item_hashes(old, job), _item_hashes(new, job), job)
+
+
+def _compile_steps(method, *args, **kwargs):
+    client = PlanClient()
+    getattr(client, method)(*args, **kwargs)
+    return client.items, client.steps
+
+
+def compile_job_incremental(data, job, cache):
+    """Compile the plan of a job, reusing cached items.
+
+    Items compile independently of each other, so only items whose run data
+    or parameters changed since they were last compiled are computed again.
+
+    Parameters
+    ----------
+    data : :obj:`dict`
+        Undecoded run data, as read with :func:`json.load`.
+    job : :class:`mmec_fab.Job`
+    cache : :class:`PlanCache`
+
+    Returns
+    -------
+    :obj:`tuple`
+        The :class:`Plan` and the number of items compiled.
+    """
+    code_hash = _code_hash()
+    items = []
+    steps = []
+    compiled = 0
+
+    def add(block_items, block_steps):
+        offset = len(items)
+        items.extend(block_items)
+        for step in block_steps:
+            step = dict(step)
+            if step["item"] >= 0:
+                step["item"] += offset
+            steps.append(step)
+
+    add(*_compile_steps(job.setup))
+
+    for workflow, params in job.stages:
+        for elements in job_items(data, workflow):
+            key = item_key(elements, workflow, params, code_hash)
+            block = cache.get_data(key)
+
+            if block is None:
+                frames = json_loads(json.dumps(list(elements)))
+                block_items, block_steps = _compile_steps(workflow, *frames, **params)
+                block = {"items": block_items, "steps": block_steps}
+                cache.put_data(key, block)
+                compiled += 1
+
+            add(block["items"], block["steps"])
+
+    add(*_compile_steps(job.teardown))
+
+    return _add_cut_plan(Plan(job.data, items, steps), data), compiled
+
+
+def plan_key(content, job):
+    """Cache key of the plan of a job on run data.
+
+    Parameters
+    ----------
+    content : :obj:`bytes`
+        Content of the run data file.
+    job : :class:`mmec_fab.Job`
+    """
+    sha = hashlib.sha1()
+    sha.update(content)
+    sha.update(json.dumps(job.data, sort_keys=True).encode("utf-8"))
+    sha.update("{}:{}".format(PLAN_VERSION, _code_hash()).encode("utf-8"))
+    return sha.hexdigest()
+
+
+class PlanCache(object):
+    """Directory of plans keyed by :func:`plan_key`.
+
+    Also holds the compiled steps of single items, see
+    :func:`compile_job_incremental`, and the last item keys of each prepared
+    file.
+
+    Parameters
+    ----------
+    directory : :obj:`str`, optional
+        Defaults to :data:`DEFAULT_CACHE_DIR`.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        """Return the cached plan, or ``None``."""
+        data = self.get_data(key)
+        if data is None or data.get("version") != PLAN_VERSION:
+            return None
+        return Plan.from_data(data)
+
+    def put(self, key, plan):
+        self.put_data(key, plan.data)
+
+    def get_data(self, key):
+        """Return cached JSON data, or ``None``."""
+        try:
+            with open(self.path(key), "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put_data(self, key, data, replace=False):
+        # Write to a temporary file first so readers never see partial data
+        path = self.path(key)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+        if not replace and os.path.exists(path):
+            os.remove(tmp_path)
+            return
+        _replace(tmp_path, path)
+
+
+def _replace(src, dst):
+    # Atomic where available, IronPython's os has no replace
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def prepare_job(path, job=None, cache=None, profile=None):
+    """Return the plan of a run data file, from the cache if possible.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        Run data file.
+    job : :class:`mmec_fab.Job` or :obj:`str`, optional
+        Job or name of a job in :data:`mmec_fab.JOBS`. Found from the file
+        name if not given, see :func:`mmec_fab.job_for_file`.
+    cache : :class:`PlanCache`, optional
+        Defaults to a cache in :data:`DEFAULT_CACHE_DIR`.
+    profile : :obj:`dict`, optional
+        Speed profile to apply, see :func:`mmec_fab.apply_profile`. Defaults
+        to the profile saved for the job, ``False`` for none. The profile
+        applied is logged.
+
+    Returns
+    -------
+    :class:`Plan`
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the profile is outside its limits, see :func:`mmec_fab.check_profile`.
+    """
+    from mmec_fab.tuning import apply_profile
+    from mmec_fab.tuning import load_profile
+    from mmec_fab.tuning import profile_path
+
+    plan, _ = _prepare(path, job, cache)
+    source = "given"
+    if profile is None:
+        profile = load_profile(plan.job["name"])
+        source = profile_path(plan.job["name"])
+    if profile:
+        plan = apply_profile(plan, profile)
+        LOGGER.warning(
+            "Running %s with the speed profile of %s (%s): %s",
+            path,
+            profile.get("job"),
+            source,
+            _format_profile(profile),
+        )
+    return plan
+
+
+def _format_profile(profile):
+    phases = [
+        "{} {} {} mm/s {} %".format(
+            workflow, phase, setting["tcp_max_speed"], setting["accel"]
+        )
+        for workflow, settings in sorted(profile.get("phases", {}).items())
+        for phase, setting in sorted(settings.items())
+    ]
+    return ", ".join(phases) or "no changes"
+
+
+def _file_key(path):
+    path = os.path.normcase(os.path.abspath(path))
+    return "file-" + hashlib.sha1(path.encode("utf-8")).hexdigest()
+
+
+def _prepare(path, job=None, cache=None):
+    # Return the plan and the diff to the previous version of the file, or
+    # None if the whole plan was cached
+    if job is None:
+        job = job_for_file(path)
+    elif not isinstance(job, Job):
+        job = JOBS[job]
+    cache = cache or PlanCache()
+
+    with open(path, "rb") as f:
+        content = f.read()
+
+    key = plan_key(content, job)
+    plan = cache.get(key)
+    if plan is not None:
+        return plan, None
+
+    data = json.loads(content.decode("utf-8"))
+    plan, _ = compile_job_incremental(data, job, cache)
+    cache.put(key, plan)
+
+    hashes = _item_hashes(data, job)
+    previous = cache.get_data(_file_key(path)) or {}
+    cache.put_data(_file_key(path), hashes, replace=True)
+
+    return plan, _diff_hashes(previous, hashes, job)
+
+
+def _prepare_worker(args):
+    path, job_name, cache_dir = args
+    try:
+        _, diff = _prepare(path, job_name, PlanCache(cache_dir))
+    except Exception as e:
+        return path, None, None, str(e)
+    return path, diff is None, diff, None
+
+
+def prepare_files(paths, job=None, cache_dir=DEFAULT_CACHE_DIR, processes=None):
+    """Prepare run data files in parallel.
+
+    Parameters
+    ----------
+    paths : :obj:`list` of :obj:`str`
+        Run data files.
+    job : :obj:`str`, optional
+        Name of the job for all files, found from each file name otherwise.
+    cache_dir : :obj:`str`, optional
+    processes : :obj:`int`, optional
+        Number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`tuple`
+        File path, whether it was a cache hit, the changes since the file
+        was last prepared (see :func:`diff_run_data`) and an error message
+        (``None`` if prepared).
+    """
+    import multiprocessing
+
+    PlanCache(cache_dir)
+    tasks = [(path, job, cache_dir) for path in paths]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_prepare_worker, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _format_diff(diff):
+    changes = []
+    for workflow in sorted(diff):
+        counts = [
+            "{} {}".format(len(diff[workflow][key]), key)
+            for key in ("changed", "added", "removed")
+            if diff[workflow][key]
+        ]
+        if counts:
+            changes.append("{}: {}".format(workflow, ", ".join(counts)))
+    return " ({})".format("; ".join(changes)) if changes else ""
+
+
+def main(argv=None):
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab prepare", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("paths", nargs="+", help="run data files or directories")
+    parser.add_argument("--job", choices=sorted(JOBS), help="job for all files")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_DIR, help="cache directory")
+    parser.add_argument("--processes", type=int, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            paths.append(path)
+
+    if not args.job:
+        known = []
+        for path in paths:
+            try:
+                job_for_file(path)
+            except ValueError:
+                print("skipped  {} (unknown job)".format(path))
+            else:
+                known.append(path)
+        paths = known
+
+    errors = 0
+    results = prepare_files(paths, args.job, args.cache, args.processes)
+    for path, hit, diff, error in results:
+        if error:
+            errors += 1
+            print("failed   {}: {}".format(path, error))
+        elif hit:
+            print("cached   {}".format(path))
+        else:
+            print("prepared {}{}".format(path, _format_diff(diff)))
+
+    return 1 if errors else 0
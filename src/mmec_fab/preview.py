@@ -0,0 +1,313 @@
+"""Motion preview of prepared plans.
+
+TCP poses are interpolated at a fixed time step over all moves of a
+:class:`mmec_fab.Plan`, from the speeds and zones of its instructions, and
+written as a columnar file (see :class:`mmec_fab.ColumnarWriter`) that can be
+scrubbed in Rhino with :func:`mmec_fab.read_columnar`::
+
+    python -m mmec_fab preview 00_robotcontrol/02_run_data/04_rolling_left.json
+
+Positions move along straight lines between targets and cut the corner of
+fly-by points with a quadratic blend within the zone radius. Orientations are
+interpolated with slerp. Accelerations and the joint space paths of joint
+moves are not modelled.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from mmec_fab.kinematics import MOVE_INSTRUCTIONS
+from mmec_fab.kinematics import ORIENTATION_SPEED
+from mmec_fab.rapid_data import matrix_quaternion
+from mmec_fab.rapid_data import slerp
+from mmec_fab.robot_client import PHASES
+from mmec_fab.robot_client import TCP_MAX_SPEED
+from mmec_fab.telemetry import ColumnarWriter
+
+__all__ = ["PREVIEW_COLUMNS", "plan_targets", "preview_plan", "write_preview"]
+
+PREVIEW_COLUMNS = [
+    ("time", "d"),
+    ("item", "i"),
+    ("phase", "b"),
+    ("wobj", "b"),
+    ("x", "f"),
+    ("y", "f"),
+    ("z", "f"),
+    ("qw", "f"),
+    ("qx", "f"),
+    ("qy", "f"),
+    ("qz", "f"),
+]
+
+
+def plan_targets(plan):
+    """Collect the frame targets of a plan.
+
+    Returns
+    -------
+    :obj:`dict`
+        Arrays ``points`` (n, 3), ``quaternions`` (n, 4), ``speeds``,
+        ``speed_caps`` (the TCP speed limit of the last ``SetMaxSpeed``),
+        ``zones``, ``items``, ``phases`` (index into
+        :data:`mmec_fab.PHASES`) and ``wobjs`` (index into the ``wobj_names``
+        list, also returned).
+    """
+    wobj = "wobj0"
+    wobj_names = []
+    speed_cap = TCP_MAX_SPEED
+    rows = []
+    meta = []
+
+    for step in plan.steps:
+        msg = step.get("msg")
+        if not msg:
+            continue
+        if msg["instruction"] == "r_RRC_SetWorkObject":
+            wobj = msg["string_values"][0]
+        elif msg["instruction"] == "r_RRC_SetMaxSpeed":
+            speed_cap = msg["float_values"][1]
+        elif msg["instruction"] in MOVE_INSTRUCTIONS:
+            if wobj not in wobj_names:
+                wobj_names.append(wobj)
+            rows.append(list(msg["float_values"][:15]) + [speed_cap])
+            meta.append(
+                (step["item"], PHASES.index(step["phase"]), wobj_names.index(wobj))
+            )
+
+    values = np.array(rows, dtype=float).reshape(-1, 16)
+    meta = np.array(meta, dtype=int).reshape(-1, 3)
+    return {
+        "points": values[:, :3],
+        "quaternions": values[:, 3:7],
+        "speeds": values[:, 13],
+        "speed_caps": values[:, 15],
+        "zones": values[:, 14],
+        "items": meta[:, 0],
+        "phases": meta[:, 1],
+        "wobjs": meta[:, 2],
+        "wobj_names": wobj_names,
+    }
+
+
+def preview_plan(plan, dt=0.05, setup=None):
+    """Interpolate the TCP poses of a plan at a fixed time step.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    dt : :obj:`float`, optional
+        Time step in seconds.
+    setup : :class:`mmec_fab.KinematicSetup`, optional
+        Work object positions. Poses are in world coordinates with a setup,
+        in the coordinates of their work object without. Work objects the
+        setup has no fixed position of are left in their coordinates too, and
+        moves between those and other work objects are jumps.
+
+    Returns
+    -------
+    :obj:`dict`
+        One array per column of :data:`PREVIEW_COLUMNS`, the ``wobj_names``
+        and the ``missing_wobjs`` left in work object coordinates although a
+        setup was given.
+    """
+    targets = plan_targets(plan)
+    points = targets["points"]
+    quaternions = targets["quaternions"]
+    quaternions = quaternions / np.linalg.norm(quaternions, axis=1)[:, None]
+    wobjs = targets["wobjs"]
+    targets["missing_wobjs"] = []
+
+    if setup is not None:
+        names = targets["wobj_names"]
+        world = names.index("wobj0") if "wobj0" in names else len(names)
+        transformed = np.zeros(len(wobjs), dtype=bool)
+        for index, name in enumerate(names):
+            mask = wobjs == index
+            if name == "wobj0":
+                continue
+            try:
+                matrix = setup.wobj_matrix(name)
+            except (KeyError, ValueError):
+                targets["missing_wobjs"].append(name)
+                continue
+            points[mask] = points[mask].dot(matrix[:3, :3].T) + matrix[:3, 3]
+            quaternions[mask] = _rotate_quaternions(matrix[:3, :3], quaternions[mask])
+            transformed |= mask
+
+        if transformed.any():
+            if world == len(names):
+                names.append("wobj0")
+            wobjs = np.where(transformed, world, wobjs)
+
+    n = len(points)
+    if n < 2:
+        return _columns(
+            np.zeros(0), targets, np.zeros(0, dtype=int), points, quaternions, wobjs
+        )
+
+    # Segment lengths and durations, the speed of a move is the speed of its
+    # target up to the TCP speed limit
+    speeds = np.minimum(targets["speeds"], targets["speed_caps"])[1:]
+    delta = np.diff(points, axis=0)
+    lengths = np.linalg.norm(delta, axis=1)
+    dots = np.abs(np.sum(quaternions[:-1] * quaternions[1:], axis=1))
+    angles = np.degrees(2 * np.arccos(np.clip(dots, 0.0, 1.0)))
+    durations = np.maximum(lengths / speeds, angles / ORIENTATION_SPEED)
+    jumps = wobjs[1:] != wobjs[:-1]
+    durations[jumps] = 0.0
+    lengths[jumps] = 0.0
+
+    starts = np.concatenate([[0.0], np.cumsum(durations)])
+    times = np.arange(0.0, starts[-1] + dt * 0.5, dt)
+
+    # Segment of each sample and the fraction of it done
+    segment = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, n - 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = (times - starts[segment]) / durations[segment]
+    fraction = np.nan_to_num(fraction, nan=1.0, posinf=1.0)
+    fraction = np.clip(fraction, 0.0, 1.0)
+
+    position = points[segment] + fraction[:, None] * delta[segment]
+    orientation = slerp(quaternions[segment], quaternions[segment + 1], fraction)
+
+    # Blend the corners of fly-by points: within the zone radius of a corner
+    # the position follows a quadratic curve from the entry to the exit point
+    radius = np.zeros(n)
+    fly_by = targets["zones"][1:-1] >= 0
+    inner = np.minimum(lengths[:-1], lengths[1:]) / 2
+    radius[1:-1] = np.where(
+        fly_by & ~jumps[:-1] & ~jumps[1:],
+        np.minimum(targets["zones"][1:-1], inner),
+        0.0,
+    )
+
+    arc = np.concatenate([[0.0], np.cumsum(lengths)])
+    s = arc[segment] + fraction * lengths[segment]
+    corner = np.where(s - arc[segment] < arc[segment + 1] - s, segment, segment + 1)
+    r = radius[corner]
+    blended = (r > 0) & (np.abs(s - arc[corner]) < r)
+
+    if blended.any():
+        c = corner[blended]
+        rb = r[blended]
+        direction_in = _unit(points[c] - points[c - 1])
+        direction_out = _unit(points[c + 1] - points[c])
+        entry = points[c] - rb[:, None] * direction_in
+        leave = points[c] + rb[:, None] * direction_out
+        u = ((s[blended] - arc[c]) / rb + 1) / 2
+        u = u[:, None]
+        position[blended] = (
+            (1 - u) ** 2 * entry + 2 * (1 - u) * u * points[c] + u**2 * leave
+        )
+
+    return _columns(times, targets, segment + 1, position, orientation, wobjs)
+
+
+def _unit(vectors):
+    norms = np.linalg.norm(vectors, axis=1)[:, None]
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def _rotate_quaternions(rotation, quaternions):
+    # Quaternions of a rotation matrix applied to orientations
+    a, b = matrix_quaternion(rotation), quaternions.T
+    return np.stack(
+        [
+            a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3],
+            a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2],
+            a[0] * b[2] - a[1] * b[3] + a[2] * b[0] + a[3] * b[1],
+            a[0] * b[3] + a[1] * b[2] - a[2] * b[1] + a[3] * b[0],
+        ],
+        axis=1,
+    )
+
+
+def _columns(times, targets, target, position, orientation, wobjs):
+    return {
+        "time": times,
+        "item": targets["items"][target],
+        "phase": targets["phases"][target],
+        "wobj": wobjs[target],
+        "x": position[:, 0],
+        "y": position[:, 1],
+        "z": position[:, 2],
+        "qw": orientation[:, 0],
+        "qx": orientation[:, 1],
+        "qy": orientation[:, 2],
+        "qz": orientation[:, 3],
+        "wobj_names": targets["wobj_names"],
+        "missing_wobjs": targets["missing_wobjs"],
+    }
+
+
+def write_preview(path, preview, metadata=None):
+    """Write a preview to a columnar file.
+
+    The header metadata holds the ``wobjs`` names, the ``phases`` and any
+    extra ``metadata``.
+    """
+    header = {"wobjs": preview["wobj_names"], "phases": list(PHASES)}
+    header.update(metadata or {})
+
+    writer = ColumnarWriter(path, PREVIEW_COLUMNS, header)
+    try:
+        writer.write(
+            [
+                np.ascontiguousarray(preview[name], dtype=np.dtype(code))
+                for name, code in PREVIEW_COLUMNS
+            ]
+        )
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    import argparse
+    import os
+    import time
+
+    from mmec_fab.plan import prepare_job
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab preview", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="run data file")
+    parser.add_argument("--job", help="job of the file")
+    parser.add_argument("--dt", type=float, default=0.05, help="time step in s")
+    parser.add_argument("--backup", help="controller backup with the work objects")
+    parser.add_argument(
+        "--output", help="preview file, next to the run data by default"
+    )
+    args = parser.parse_args(argv)
+
+    setup = None
+    if args.backup:
+        from mmec_fab.rapid_data import load_setup
+
+        setup = load_setup(args.backup)
+
+    plan = prepare_job(args.path, args.job)
+    started = time.time()
+    preview = preview_plan(plan, args.dt, setup)
+    if preview["missing_wobjs"]:
+        print(
+            "Work objects without a world position in {}, left in their own "
+            "coordinates: {}".format(args.backup, ", ".join(preview["missing_wobjs"]))
+        )
+    output = args.output or os.path.splitext(args.path)[0] + ".preview"
+    write_preview(
+        output, preview, {"source": os.path.basename(args.path), "dt": args.dt}
+    )
+
+    print(
+        "{}: {} poses over {:.1f} s in {:.3f} s".format(
+            output,
+            len(preview["time"]),
+            preview["time"][-1] if len(preview["time"]) else 0.0,
+            time.time() - started,
+        )
+    )
+    return 0
@@ -0,0 +1,294 @@
+"""Live progress of a running job.
+
+A :class:`ProgressTracker` follows the phases executed by the controller and
+estimates the time left from the phase durations seen so far in the run.
+:class:`ProgressServer` publishes its state as JSON over HTTP, by default to
+this computer only, so the operator can see when the next stop is due::
+
+    with RobotClient() as client, ProgressServer(ProgressTracker(client)):
+        client.run_plan(plan)
+
+    curl http://localhost:8765/
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import threading
+import time
+from collections import deque
+
+from mmec_fab.robot_client import TCP_MAX_SPEED
+from mmec_fab.timeouts import STATION_TRANSITION
+from mmec_fab.timeouts import MotionEstimator
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler  # type: ignore
+    from BaseHTTPServer import HTTPServer  # type: ignore
+
+__all__ = ["ProgressTracker", "ProgressServer", "STOP_PHASES"]
+
+# Phases starting with a stop for the operator, see RobotClient.stop_to_cut
+STOP_PHASES = ("cut", "nail", "measure")
+
+
+class ProgressTracker(object):
+    """Follow the progress of a plan run by a client.
+
+    Only bookkeeping happens when the controller reports a new phase, the
+    estimates are computed when :meth:`state` is called. Phases not seen yet
+    are estimated from the lengths and speeds of their moves, except the ones
+    waiting for the operator.
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+    plan : :class:`mmec_fab.Plan`, optional
+        Plan being run, needed for the estimates. Taken from
+        :meth:`mmec_fab.RobotClient.run_plan` if not given.
+    window : :obj:`int`, optional
+        Number of recent durations averaged per workflow and phase.
+    """
+
+    def __init__(self, client, plan=None, window=10):
+        self.client = client
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._sequence = []
+        self._motion_times = []
+        self._items = None
+        self._position = -1
+        self._marker = None
+        self._item = None
+        self._items_done = 0
+        self._started_at = None
+        self._phase_times = {}
+        self._cycle_times = {}
+
+        if plan is not None:
+            self.plan_started(plan)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.client.add_listener(self)
+
+    def stop(self):
+        self.client.remove_listener(self)
+
+    def plan_started(self, plan):
+        with self._lock:
+            # Phases of the plan in order, to locate reported phases in it
+            self._sequence = [
+                (
+                    step["item"],
+                    plan.items[step["item"]]["workflow"] if step["item"] >= 0 else None,
+                    step["phase"],
+                )
+                for step in plan.steps
+                if step.get("new_phase")
+            ]
+            self._motion_times = _phase_motion_times(plan)
+            self._items = len(plan.items)
+            self._position = -1
+
+    def phase_started(self, marker):
+        now = marker.executed_at
+
+        with self._lock:
+            if self._started_at is None:
+                self._started_at = now
+
+            previous = self._marker
+            if previous is not None:
+                key = (previous.workflow, previous.phase)
+                self._record(self._phase_times, key, now - previous.executed_at)
+
+            if self._item and self._item.item_index != marker.item_index:
+                item = self._item
+                self._record(self._cycle_times, item.workflow, now - item.executed_at)
+                self._items_done += 1
+                self._item = None
+            if self._item is None and marker.item_index >= 0:
+                self._item = marker
+
+            self._marker = marker
+            self._advance(marker)
+
+    def _record(self, times, key, duration):
+        if key not in times:
+            times[key] = deque(maxlen=self.window)
+        times[key].append(duration)
+
+    def _advance(self, marker):
+        for position in range(self._position + 1, len(self._sequence)):
+            item, _, phase = self._sequence[position]
+            if item == marker.item_index and phase == marker.phase:
+                self._position = position
+                return
+
+    def _phase_estimate(self, position):
+        _, workflow, phase = self._sequence[position]
+        times = self._phase_times.get((workflow, phase))
+        if not times:
+            times = [
+                t
+                for (_, other), values in self._phase_times.items()
+                if other == phase
+                for t in values
+            ]
+        if not times:
+            if phase in STOP_PHASES:
+                return None
+            return self._motion_times[position]
+        return sum(times) / len(times)
+
+    def state(self):
+        """Return the progress as a JSON serializable dictionary.
+
+        Keys are ``item``, ``workflow`` and ``phase`` being executed,
+        ``items_done``, ``items_total``, ``items_per_hour``, average
+        ``cycle_times`` per workflow, and the ``eta`` to completion and
+        ``next_stop`` with its ``item``, ``phase`` and ``eta``. Times are in seconds,
+        estimates are ``None`` until enough phases have been seen.
+        """
+        now = time.time()
+
+        with self._lock:
+            marker = self._marker
+            state = {
+                "time": now,
+                "item": marker.item_index if marker else None,
+                "workflow": marker.workflow if marker else None,
+                "phase": marker.phase if marker else None,
+                "items_done": self._items_done,
+                "items_total": self._items,
+                "items_per_hour": None,
+                "cycle_times": dict(
+                    (workflow, sum(times) / len(times))
+                    for workflow, times in self._cycle_times.items()
+                ),
+                "eta": None,
+                "next_stop": None,
+            }
+
+            if self._started_at is not None and self._items_done:
+                elapsed = now - self._started_at
+                state["items_per_hour"] = self._items_done * 3600 / elapsed
+
+            if marker is None or self._position < 0:
+                return state
+
+            # Time left in the current phase, then the remaining phases in turn
+            current = self._phase_estimate(self._position)
+            remaining = None
+            if current is not None:
+                remaining = max(current - (now - marker.executed_at), 0.0)
+
+            for position in range(self._position + 1, len(self._sequence)):
+                item, _, phase = self._sequence[position]
+                if phase in STOP_PHASES and state["next_stop"] is None:
+                    state["next_stop"] = {
+                        "item": item,
+                        "phase": phase,
+                        "eta": remaining,
+                    }
+
+                estimate = self._phase_estimate(position)
+                if estimate is None and item < 0:
+                    # Setup and teardown moves are short next to the items
+                    estimate = 0.0
+                if remaining is None or estimate is None:
+                    remaining = None
+                else:
+                    remaining += estimate
+
+            state["eta"] = remaining
+
+        return state
+
+
+def _phase_motion_times(plan):
+    # Estimated time of the moves of each phase of a plan, in plan order
+    times = []
+    motion = MotionEstimator(TCP_MAX_SPEED, STATION_TRANSITION)
+    for step in plan.steps:
+        if step.get("new_phase"):
+            times.append(0.0)
+        duration = motion.step_duration(step)
+        if times:
+            times[-1] += duration
+    return times
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.tracker.state()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.allow_origin:
+            self.send_header("Access-Control-Allow-Origin", self.server.allow_origin)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProgressServer(object):
+    """Serve the state of a :class:`ProgressTracker` as JSON over HTTP.
+
+    The server runs on a background thread and starts and stops the tracker
+    with it.
+
+    Parameters
+    ----------
+    tracker : :class:`ProgressTracker`
+    host : :obj:`str`, optional
+        Interface to listen on, only this computer by default. ``""`` serves
+        the progress to the network.
+    port : :obj:`int`, optional
+    allow_origin : :obj:`str`, optional
+        Web pages of this origin, ``"*"`` for all, may read the progress.
+        None by default.
+    """
+
+    def __init__(self, tracker, host="127.0.0.1", port=8765, allow_origin=None):
+        self.tracker = tracker
+        self.address = (host, port)
+        self.allow_origin = allow_origin
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._server = HTTPServer(self.address, _Handler)
+        self._server.tracker = self.tracker
+        self._server.allow_origin = self.allow_origin
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self.tracker.start()
+
+    def stop(self):
+        self.tracker.stop()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,443 @@
+"""Tool and work object data from controller backups.
+
+The tool centre points and work object frames used by :class:`RobotClient`
+are defined in RAPID modules on the controller. :func:`load_setup` parses them
+from a backup in ``00_robotcontrol/xx_RobotBackup`` once and caches the result,
+and :class:`KinematicSetup` transforms batches of points and frames from a work
+object into world coordinates::
+
+    setup = load_setup("path/to/backup")
+    points = setup.to_world("ob_A057_WobjCutST", points)
+
+    python -m mmec_fab setup path/to/backup
+
+The backups in ``00_robotcontrol/xx_RobotBackup`` only hold the RFL system
+modules, without the station work objects ``ob_A057_WobjSliceST``,
+``ob_A057_WobjCutST`` and ``ob_A057_WobjLatticeST``, so :func:`load_setup`
+finds none of them there. Take a backup with the modules declaring them
+loaded to transform station coordinates into world.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+
+import numpy as np
+
+from mmec_fab.robot_client import WOBJ_CT
+from mmec_fab.robot_client import WOBJ_LT
+from mmec_fab.robot_client import WOBJ_SL
+
+__all__ = [
+    "KinematicSetup",
+    "parse_rapid",
+    "read_backup",
+    "load_setup",
+    "DEFAULT_SETUP_CACHE_DIR",
+    "quaternion_matrix",
+    "matrix_quaternion",
+    "pose_matrix",
+    "slerp",
+]
+
+DEFAULT_SETUP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".mmec_fab", "setup")
+
+# Bump when the setup file layout changes to invalidate cached setups
+SETUP_VERSION = 1
+
+# Work objects of the stations, declared outside the RFL system modules
+STATION_WOBJS = (WOBJ_SL, WOBJ_CT, WOBJ_LT)
+
+DECLARATION = re.compile(
+    r"\b(?:PERS|CONST|VAR)\s+(tooldata|wobjdata)\s+(\w+)\s*:=\s*(\[[^;]*\])\s*;",
+    re.IGNORECASE,
+)
+
+
+def _strip_comments(text):
+    lines = []
+    for line in text.splitlines():
+        in_string = False
+        for i, char in enumerate(line):
+            if char == '"':
+                in_string = not in_string
+            elif char == "!" and not in_string:
+                line = line[:i]
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _parse_value(text):
+    # RAPID aggregates are JSON arrays once the booleans are lower case
+    text = re.sub(r"\bTRUE\b", "true", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bFALSE\b", "false", text, flags=re.IGNORECASE)
+    text = re.sub(r"(?<![\w.])\.(\d)", r"0.\1", text)
+    return json.loads(text)
+
+
+def parse_rapid(text):
+    """Extract tooldata and wobjdata declarations from RAPID code.
+
+    Commented declarations are ignored.
+
+    Returns
+    -------
+    :obj:`dict`
+        ``"tools"`` and ``"wobjs"``, each a dictionary of name to data.
+        Tools have ``robhold``, ``tframe`` (point and quaternion) and
+        ``load``, work objects have ``robhold``, ``ufprog``, ``ufmec``,
+        ``uframe`` and ``oframe``.
+    """
+    data = {"tools": {}, "wobjs": {}}
+
+    for kind, name, value in DECLARATION.findall(_strip_comments(text)):
+        value = _parse_value(value)
+        if kind.lower() == "tooldata":
+            data["tools"][name] = {
+                "robhold": value[0],
+                "tframe": value[1],
+                "load": value[2],
+            }
+        else:
+            data["wobjs"][name] = {
+                "robhold": value[0],
+                "ufprog": value[1],
+                "ufmec": value[2],
+                "uframe": value[3],
+                "oframe": value[4],
+            }
+
+    return data
+
+
+def _module_paths(backup, task):
+    task_dir = os.path.join(backup, "RAPID", task)
+
+    # Load order of the task's modules, later declarations win
+    paths = []
+    info = os.path.join(backup, "BACKINFO", "backinfo.txt")
+    if os.path.exists(info):
+        with open(info, "r") as f:
+            current = None
+            for line in f:
+                line = line.strip()
+                if line.startswith(">>"):
+                    current = line[2:].split(":")[0]
+                elif current == task and "@" in line:
+                    paths.append(os.path.join(task_dir, line.split("@")[0].strip()))
+
+    found = set(
+        glob.glob(os.path.join(task_dir, "*", "*.sys"))
+        + glob.glob(os.path.join(task_dir, "*", "*.mod"))
+        + glob.glob(os.path.join(task_dir, "*", "*.modx"))
+    )
+    paths = [path for path in paths if path in found]
+    return paths + sorted(found.difference(paths))
+
+
+def read_backup(backup, task="TASK1"):
+    """Parse the tool and work object data of a task in a controller backup.
+
+    Parameters
+    ----------
+    backup : :obj:`str`
+        Backup directory.
+    task : :obj:`str`, optional
+        Task directory of the robot in ``RAPID``.
+
+    Returns
+    -------
+    :class:`KinematicSetup`
+    """
+    tools = {}
+    wobjs = {}
+    for path in _module_paths(backup, task):
+        # Controllers write modules in Latin-1
+        with io.open(path, "r", encoding="latin-1") as f:
+            data = parse_rapid(f.read())
+        tools.update(data["tools"])
+        wobjs.update(data["wobjs"])
+
+    return KinematicSetup(tools, wobjs, source=os.path.abspath(backup))
+
+
+def _backup_key(backup, task):
+    sha = hashlib.sha1("{}:{}".format(SETUP_VERSION, task).encode("utf-8"))
+    for path in _module_paths(backup, task):
+        with open(path, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def load_setup(backup, task="TASK1", cache_dir=DEFAULT_SETUP_CACHE_DIR):
+    """Return the setup of a backup, parsing it only if not cached.
+
+    The cache is keyed by the contents of the task's RAPID modules.
+    """
+    path = os.path.join(cache_dir, _backup_key(backup, task) + ".json")
+    if os.path.exists(path):
+        return KinematicSetup.from_json(path)
+
+    setup = read_backup(backup, task)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    setup.to_json(path)
+    return setup
+
+
+def quaternion_matrix(q):
+    """Rotation matrix of a quaternion ``[w, x, y, z]``, normalized first.
+
+    Also takes an array of quaternions along its last axis and returns the
+    matrices along its last two axes.
+    """
+    q = np.asarray(q, dtype=float)
+    w, x, y, z = np.moveaxis(q / np.linalg.norm(q, axis=-1, keepdims=True), -1, 0)
+    return np.stack(
+        [
+            np.stack(
+                [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], -1
+            ),
+            np.stack(
+                [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], -1
+            ),
+            np.stack(
+                [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], -1
+            ),
+        ],
+        -2,
+    )
+
+
+def slerp(q0, q1, t):
+    """Spherical linear interpolation of quaternions ``[w, x, y, z]``.
+
+    Quaternions are along the last axis of ``q0`` and ``q1``, and ``t``
+    broadcasts against their other axes, e.g. rows of quaternions with one
+    fraction each, or a pair of quaternions with several fractions. The
+    results are normalized.
+    """
+    q0 = np.asarray(q0, dtype=float)
+    q1 = np.asarray(q1, dtype=float)
+    t = np.asarray(t, dtype=float)[..., None]
+
+    # Along the shorter arc
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    angle = np.arccos(np.clip(np.abs(dot), 0.0, 1.0))
+    sin = np.sin(angle)
+    small = sin < 1e-6
+    sin = np.where(small, 1.0, sin)
+
+    w0 = np.where(small, 1 - t, np.sin((1 - t) * angle) / sin)
+    w1 = np.where(small, t, np.sin(t * angle) / sin)
+    q = w0 * q0 + w1 * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def pose_matrix(pose):
+    """Transformation matrix of a RAPID pose, its position and quaternion."""
+    matrix = np.identity(4)
+    matrix[:3, :3] = quaternion_matrix(pose[1])
+    matrix[:3, 3] = pose[0]
+    return matrix
+
+
+def matrix_quaternion(m):
+    """Quaternion ``[w, x, y, z]`` of a 3x3 rotation matrix."""
+    # From its largest diagonal term
+    trace = np.trace(m)
+    if trace > 0:
+        w = np.sqrt(1.0 + trace) * 2
+        q = [
+            w / 4,
+            (m[2, 1] - m[1, 2]) / w,
+            (m[0, 2] - m[2, 0]) / w,
+            (m[1, 0] - m[0, 1]) / w,
+        ]
+    elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+        w = np.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2]) * 2
+        q = [
+            (m[2, 1] - m[1, 2]) / w,
+            w / 4,
+            (m[0, 1] + m[1, 0]) / w,
+            (m[0, 2] + m[2, 0]) / w,
+        ]
+    elif m[1, 1] > m[2, 2]:
+        w = np.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2]) * 2
+        q = [
+            (m[0, 2] - m[2, 0]) / w,
+            (m[0, 1] + m[1, 0]) / w,
+            w / 4,
+            (m[1, 2] + m[2, 1]) / w,
+        ]
+    else:
+        w = np.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1]) * 2
+        q = [
+            (m[1, 0] - m[0, 1]) / w,
+            (m[0, 2] + m[2, 0]) / w,
+            (m[1, 2] + m[2, 1]) / w,
+            w / 4,
+        ]
+    return np.array(q)
+
+
+class KinematicSetup(object):
+    """Tool and work object data of a robot task.
+
+    Parameters
+    ----------
+    tools : :obj:`dict`
+        Tool name to data, as returned by :func:`parse_rapid`.
+    wobjs : :obj:`dict`
+        Work object name to data, as returned by :func:`parse_rapid`.
+    source : :obj:`str`, optional
+        Backup the data was read from.
+    """
+
+    def __init__(self, tools, wobjs, source=None):
+        self.tools = tools
+        self.wobjs = wobjs
+        self.source = source
+        self._matrices = {}
+
+    @property
+    def data(self):
+        return {
+            "version": SETUP_VERSION,
+            "source": self.source,
+            "tools": self.tools,
+            "wobjs": self.wobjs,
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data["tools"], data["wobjs"], data.get("source"))
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.data, f, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r") as f:
+            return cls.from_data(json.load(f))
+
+    def _get(self, table, kind, name):
+        try:
+            return table[name]
+        except KeyError:
+            raise KeyError(
+                "{} {} not found in {}".format(kind, name, self.source or "setup")
+            )
+
+    def tool_matrix(self, name):
+        """Transformation of a tool's TCP in the flange frame, a 4x4 array."""
+        return pose_matrix(self._get(self.tools, "tooldata", name)["tframe"])
+
+    def tool_frame(self, name):
+        """Return the TCP of a tool as a :class:`compas.geometry.Frame`."""
+        from compas.geometry import Frame
+
+        matrix = self.tool_matrix(name)
+        return Frame(matrix[:3, 3], matrix[:3, 0], matrix[:3, 1])
+
+    def wobj_matrix(self, name):
+        """Transformation from a work object into world coordinates.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If the work object is held by the robot or moved by a mechanical
+            unit, as it has no fixed world position then.
+        """
+        if name not in self._matrices:
+            wobj = self._get(self.wobjs, "wobjdata", name)
+            if wobj["robhold"] or not wobj["ufprog"] or wobj["ufmec"]:
+                raise ValueError("Work object {} is not fixed in world".format(name))
+
+            matrix = pose_matrix(wobj["uframe"]).dot(pose_matrix(wobj["oframe"]))
+            self._matrices[name] = matrix
+
+        return self._matrices[name]
+
+    def to_world(self, wobj, points):
+        """Transform points from a work object into world coordinates.
+
+        Parameters
+        ----------
+        wobj : :obj:`str`
+            Work object name, ``"wobj0"`` is the world itself.
+        points : array-like
+            Points of shape ``(n, 3)``.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+        """
+        points = np.asarray(points, dtype=float)
+        if wobj == "wobj0":
+            return points.copy()
+
+        matrix = self.wobj_matrix(wobj)
+        return points.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+    def frames_to_world(self, wobj, points, xaxes, yaxes):
+        """Transform frames, given as arrays of points and axes, into world.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Points, x axes and y axes as :class:`numpy.ndarray`.
+        """
+        points = self.to_world(wobj, points)
+        if wobj == "wobj0":
+            return points, np.array(xaxes, dtype=float), np.array(yaxes, dtype=float)
+
+        rotation = self.wobj_matrix(wobj)[:3, :3]
+        xaxes = np.asarray(xaxes, dtype=float).dot(rotation.T)
+        yaxes = np.asarray(yaxes, dtype=float).dot(rotation.T)
+        return points, xaxes, yaxes
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab setup", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("backup", help="controller backup directory")
+    parser.add_argument("--task", default="TASK1", help="RAPID task of the robot")
+    parser.add_argument("--output", help="also write the setup to this file")
+    parser.add_argument(
+        "--cache", default=DEFAULT_SETUP_CACHE_DIR, help="cache directory"
+    )
+    args = parser.parse_args(argv)
+
+    setup = load_setup(args.backup, args.task, args.cache)
+    if args.output:
+        setup.to_json(args.output)
+
+    for name in sorted(setup.tools):
+        tcp, rotation = setup.tools[name]["tframe"]
+        print("tooldata {}: tcp {} rot {}".format(name, tcp, rotation))
+    for name in sorted(setup.wobjs):
+        wobj = setup.wobjs[name]
+        print(
+            "wobjdata {}: uframe {} oframe {}".format(
+                name, wobj["uframe"][0], wobj["oframe"][0]
+            )
+        )
+
+    missing = [name for name in STATION_WOBJS if name not in setup.wobjs]
+    if missing:
+        print("Station work objects not in the backup: {}".format(", ".join(missing)))
+
+    return 0
@@ -0,0 +1,326 @@
+"""Relocalization of the station work objects from measured points.
+
+Reference points of each station, given in the coordinates of its work
+object, are visited with the calibration needle in one run and the TCP
+position at each is read back in world coordinates. The rigid transformation
+fitting the reference points to the measured ones best is the new position
+of the work object::
+
+    python -m mmec_fab relocalize reference_points.json --output measured.json
+    python -m mmec_fab relocalize reference_points.json --measured measured.json \
+        --backup path/to/backup --module A057_WobjData.mod
+
+The reference file maps work object names to lists of points, e.g.
+``{"ob_A057_WobjSliceST": [[0, 0, 0], [1200, 0, 0], [0, 800, 0]]}``. At least
+three points per station, not on a line, are needed.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import numpy as np
+
+from mmec_fab.rapid_data import matrix_quaternion
+from mmec_fab.rapid_data import pose_matrix
+
+__all__ = [
+    "fit_transform",
+    "fit_wobj",
+    "measure_points",
+    "wobj_data",
+    "format_wobjdata",
+]
+
+
+def fit_transform(points, measured):
+    """Best fit rigid transformation from points to their measured positions.
+
+    Uses the Kabsch algorithm, minimizing the sum of squared distances.
+
+    Parameters
+    ----------
+    points : array-like
+        Reference points, shape ``(n, 3)``.
+    measured : array-like
+        Measured positions of the points, shape ``(n, 3)``.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The 4x4 transformation.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If there are fewer than three points or they are on a line.
+    """
+    points = np.asarray(points, dtype=float)
+    measured = np.asarray(measured, dtype=float)
+    if points.shape != measured.shape or len(points) < 3:
+        raise ValueError("At least three pairs of points are needed")
+
+    center = points.mean(axis=0)
+    measured_center = measured.mean(axis=0)
+    covariance = (points - center).T.dot(measured - measured_center)
+
+    u, s, vt = np.linalg.svd(covariance)
+    if s[1] < 1e-6 * max(s[0], 1e-12):
+        raise ValueError("Points are on a line")
+
+    # Avoid a reflection
+    d = np.sign(np.linalg.det(vt.T.dot(u.T))) or 1.0
+    rotation = vt.T.dot(np.diag([1.0, 1.0, d])).dot(u.T)
+
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = measured_center - rotation.dot(center)
+    return matrix
+
+
+def fit_wobj(points, measured):
+    """Fit a work object to measured points and report the residuals.
+
+    Parameters
+    ----------
+    points : array-like
+        Reference points in the work object, shape ``(n, 3)``.
+    measured : array-like
+        Measured positions in world coordinates, shape ``(n, 3)``.
+
+    Returns
+    -------
+    :obj:`dict`
+        ``matrix`` from the work object to world, ``residuals`` as the
+        distance of each fitted point to its measurement, and their ``rms``
+        and ``max``, in millimetres.
+    """
+    matrix = fit_transform(points, measured)
+    points = np.asarray(points, dtype=float)
+    fitted = points.dot(matrix[:3, :3].T) + matrix[:3, 3]
+    residuals = np.linalg.norm(fitted - np.asarray(measured, dtype=float), axis=1)
+
+    return {
+        "matrix": matrix,
+        "residuals": residuals.tolist(),
+        "rms": float(np.sqrt(np.mean(residuals**2))),
+        "max": float(residuals.max()),
+    }
+
+
+def measure_points(
+    client, points, wobj, speed=50, travel_speed=250, offset_distance=50, jog=True
+):
+    """Visit reference points with the calibration needle and record them.
+
+    The needle approaches each point from above in the current definition of
+    the work object. With ``jog`` the program stops at each point, once, for
+    the operator to jog the needle onto the mark, and the TCP is read where
+    it was jogged to. The stop is ``r_A057_StopNoRegain`` of
+    ``00_robotcontrol/03_rapid/A057_Measure.mod``, as after a plain stop the
+    robot regains the stop position when restarted.
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+        Connected client.
+    points : array-like
+        Reference points in the work object.
+    wobj : :obj:`str`
+        Work object name.
+    speed : :obj:`float`, optional
+        Speed of the last approach and the retract, in mm/s.
+    travel_speed : :obj:`float`, optional
+    offset_distance : :obj:`float`, optional
+        Approach distance above the points.
+    jog : :obj:`bool`, optional
+        Stop at each point. Without, the recorded positions are the commanded
+        points in the current work object, which only tries the approach to
+        the points and doesn't measure them.
+
+    Returns
+    -------
+    :obj:`list`
+        TCP positions in world coordinates.
+    """
+    import compas_rrc
+    from compas.geometry import Frame
+    from compas_rrc import Motion
+    from compas_rrc import MoveToFrame
+    from compas_rrc import Zone
+
+    from mmec_fab.robot_client import TOOL_CN
+    from mmec_fab.robot_client import WOBJ
+    from mmec_fab.timeouts import STOP_NO_REGAIN
+    from mmec_fab.utils import offset_frame
+
+    client.send(compas_rrc.SetTool(TOOL_CN))
+    client.send(compas_rrc.SetWorkObject(wobj))
+    measured = []
+
+    for index, point in enumerate(points):
+        # Needle pointing down
+        frame = Frame(point, [1, 0, 0], [0, -1, 0])
+        above = offset_frame(frame, -offset_distance)
+
+        client.set_phase("approach")
+        client.send(MoveToFrame(above, travel_speed, Zone.Z10))
+        client.send(MoveToFrame(frame, speed, Zone.FINE, Motion.LINEAR))
+        if jog:
+            client.set_phase("measure")
+            client.send(compas_rrc.PrintText("jog onto the mark, press play."))
+            client.send(compas_rrc.CustomInstruction(STOP_NO_REGAIN))
+            client.prompt(
+                "jog the needle onto point {} of {}, press play on pendant to "
+                "record it".format(index, wobj)
+            )
+
+        client.send(compas_rrc.SetWorkObject(WOBJ))
+        tcp = client.send_and_wait(compas_rrc.GetFrame())
+        measured.append([float(value) for value in tcp.point])
+
+        client.send(compas_rrc.SetWorkObject(wobj))
+        client.send(MoveToFrame(above, speed, Zone.Z10, Motion.LINEAR))
+
+    return measured
+
+
+def _matrix_pose(matrix):
+    q = matrix_quaternion(matrix[:3, :3])
+    if q[0] < 0:
+        q = -q
+    return [matrix[:3, 3].tolist(), (q / np.linalg.norm(q)).tolist()]
+
+
+def wobj_data(matrix, previous=None):
+    """Work object data placing a work object at a transformation.
+
+    Parameters
+    ----------
+    matrix : array-like
+        Transformation from the work object to world, 4x4.
+    previous : :obj:`dict`, optional
+        Current data of the work object, see :func:`mmec_fab.parse_rapid`.
+        Its object frame is kept and the user frame solved for.
+
+    Returns
+    -------
+    :obj:`dict`
+    """
+    oframe = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]]
+    if previous:
+        oframe = previous["oframe"]
+
+    uframe = np.asarray(matrix, dtype=float).dot(np.linalg.inv(pose_matrix(oframe)))
+    return {
+        "robhold": False,
+        "ufprog": True,
+        "ufmec": "",
+        "uframe": _matrix_pose(uframe),
+        "oframe": oframe,
+    }
+
+
+def format_wobjdata(name, data, precision=3):
+    """Format work object data as a RAPID declaration."""
+
+    def numbers(values, digits):
+        return (
+            "["
+            + ",".join("{:.{}f}".format(round(v, digits) + 0.0, digits) for v in values)
+            + "]"
+        )
+
+    def pose(value):
+        return "[{},{}]".format(numbers(value[0], precision), numbers(value[1], 6))
+
+    return 'PERS wobjdata {} := [{},{},"{}",{},{}];'.format(
+        name,
+        "TRUE" if data["robhold"] else "FALSE",
+        "TRUE" if data["ufprog"] else "FALSE",
+        data["ufmec"],
+        pose(data["uframe"]),
+        pose(data["oframe"]),
+    )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab relocalize", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("reference", help="reference points per work object")
+    parser.add_argument(
+        "--measured", help="measured points, instead of measuring with the robot"
+    )
+    parser.add_argument("--output", help="write the measured points to this file")
+    parser.add_argument("--backup", help="controller backup with the current wobjdata")
+    parser.add_argument("--module", help="write the wobjdata to this RAPID module")
+    parser.add_argument(
+        "--no-jog",
+        action="store_true",
+        help="try the approach to the points without stopping, records the "
+        "commanded points",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.reference, "r") as f:
+        reference = json.load(f)
+
+    if args.measured:
+        with open(args.measured, "r") as f:
+            measured = json.load(f)
+    else:
+        from mmec_fab.robot_client import RobotClient
+
+        measured = {}
+        with RobotClient() as client:
+            client.pre()
+            for wobj, points in sorted(reference.items()):
+                measured[wobj] = measure_points(
+                    client, points, wobj, jog=not args.no_jog
+                )
+            client.post()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(measured, f, indent=2)
+
+    setup = None
+    if args.backup:
+        from mmec_fab.rapid_data import load_setup
+
+        setup = load_setup(args.backup)
+
+    declarations = []
+    for wobj in sorted(reference):
+        result = fit_wobj(reference[wobj], measured[wobj])
+        print(
+            "{}: rms {:.2f} mm, max {:.2f} mm".format(
+                wobj, result["rms"], result["max"]
+            )
+        )
+        for index, residual in enumerate(result["residuals"]):
+            print("  point {}: {:.2f} mm".format(index, residual))
+
+        previous = setup.wobjs.get(wobj) if setup else None
+        if previous:
+            old = setup.wobj_matrix(wobj)
+            shift = np.linalg.norm(result["matrix"][:3, 3] - old[:3, 3])
+            print("  moved {:.2f} mm".format(shift))
+
+        declarations.append(
+            format_wobjdata(wobj, wobj_data(result["matrix"], previous))
+        )
+
+    print("\n".join(declarations))
+    if args.module:
+        with open(args.module, "w") as f:
+            f.write("MODULE A057_WobjData\n")
+            for declaration in declarations:
+                f.write("    {}\n".format(declaration))
+            f.write("ENDMODULE\n")
+
+    return 0
@@ -2,15 +2,35 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
+import time
+
 import compas_rrc
+import roslibpy
 from compas_rrc import MoveToFrame, MoveToJoints, Zone, Motion
 from compas_fab.backends import RosClient
+from compas_fab.backends.ros.messages import ROSmsg
 
 from mmec_fab import offset_frame
 from mmec_fab import ensure_frame
+from mmec_fab.batching import BatchedTopic
+from mmec_fab.encoding import CborMessage
+from mmec_fab.encoding import accept_binary
+from mmec_fab.encoding import round_floats
+from mmec_fab.timeouts import FRAME_MOVES
+from mmec_fab.timeouts import MOVE_STEPS
+from mmec_fab.timeouts import OTHER_MOVES
+from mmec_fab.timeouts import AdaptiveTimeouts
 
 GRIPPER_PIN = "doUnitC1Out1"
 
+# Custom RAPID procedure of MoveToFrameTrigger
+TRIGGER_INSTRUCTION = "r_A057_MoveToTrigg"
+
+# Values an RRC instruction carries at most, see the RRC message buffer
+MAX_FLOAT_VALUES = 36
+MAX_STRING_VALUES = 8
+
 # Speed values
 ACCEL = 100  # %
 ACCEL_RAMP = 100  # %
@@ -19,6 +39,8 @@ TCP_MAX_SPEED = 250  # mm/s
 
 SAFE_JOINT_POSITION = [0, 0, 0, 0, 90, 0]  # six values in degrees
 SAFE_ROLL_POSITION = [90, 0, 0, 0, 90, 0]  # six values in degrees
+# Seconds allowed after the predicted end of a waited instruction until the
+# margin is learned, and for moves of unknown length, see AdaptiveTimeouts
 TIMEOUT_SHORT = 10
 TIMEOUT_LONG = 30
 
@@ -30,6 +52,153 @@ WOBJ_SL = "ob_A057_WobjSliceST"
 WOBJ_CT = "ob_A057_WobjCutST"
 WOBJ_LT = "ob_A057_WobjLatticeST"
 
+# Workflow phases, in the order they usually appear within an item
+PHASES = (
+    "setup",
+    "approach",
+    "pick",
+    "cut",
+    "transfer",
+    "place",
+    "nail",
+    "release",
+    "measure",
+    "roll",
+    "finish",
+)
+
+
+class PhaseMarker(object):
+    """Start of a workflow phase, as sent by the client and executed by the robot.
+
+    Parameters
+    ----------
+    item_index : :obj:`int`
+        Index of the workflow item, ``-1`` outside of items (e.g. in
+        :meth:`RobotClient.pre`).
+    workflow : :obj:`str`
+        Name of the workflow method, e.g. ``"slice_making"``.
+    phase : :obj:`str`
+        One of :data:`PHASES`.
+    params : :obj:`dict`, optional
+        Parameters of the item, see :attr:`RobotClient.params`.
+
+    Attributes
+    ----------
+    sent_at : :obj:`float`
+        Time the first instruction of the phase was sent.
+    executed_at : :obj:`float`
+        Time the controller reported that instruction as executed, ``None``
+        until then. Phases starting with a move are marked by a ``Noop``
+        before it, so this is when the move starts, see
+        :meth:`RobotClient.send`.
+    """
+
+    def __init__(self, item_index, workflow, phase, params=None):
+        self.item_index = item_index
+        self.workflow = workflow
+        self.phase = phase
+        self.params = params or {}
+        self.sent_at = None
+        self.executed_at = None
+
+    def __repr__(self):
+        return "PhaseMarker({!r}, {!r}, {!r})".format(
+            self.item_index, self.workflow, self.phase
+        )
+
+
+def check_value_counts(instruction):
+    """Check that an instruction fits into the RRC message buffer.
+
+    Parameters
+    ----------
+    instruction : :class:`compas_fab.backends.ros.messages.ROSmsg`
+        Instruction with ``float_values`` and ``string_values``.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If it has more than :data:`MAX_FLOAT_VALUES` float or
+        :data:`MAX_STRING_VALUES` string values.
+    """
+    for name, limit in (
+        ("float_values", MAX_FLOAT_VALUES),
+        ("string_values", MAX_STRING_VALUES),
+    ):
+        count = len(getattr(instruction, name))
+        if count > limit:
+            raise ValueError(
+                "{} has {} {}, RRC takes at most {}".format(
+                    instruction.instruction, count, name.replace("_", " "), limit
+                )
+            )
+
+
+def _is_move(instruction):
+    name = getattr(instruction, "instruction", None)
+    return name in FRAME_MOVES or name in OTHER_MOVES or name == MOVE_STEPS
+
+
+class MoveToFrameTrigger(MoveToFrame):
+    """Move to a frame and set a digital output on the way.
+
+    Runs ``TriggL`` or ``TriggJ`` with a ``TriggIO`` event in the custom RAPID
+    procedure ``r_A057_MoveToTrigg``, see ``00_robotcontrol/03_rapid``. The
+    output is switched by the motion planner at the given position of the path,
+    without a separate instruction to wait for.
+
+    Parameters
+    ----------
+    frame : :class:`compas.geometry.Frame`
+        Target frame.
+    speed : :obj:`float`
+        TCP speed in mm/s.
+    zone : :class:`compas_rrc.Zone`
+    signal : :obj:`str`
+        Name of the digital output.
+    value : :obj:`int`
+        Value to set, ``0`` or ``1``.
+    distance : :obj:`float`, optional
+        Distance in mm before the end of the path, or after its start with
+        ``start``, where the output is set. Time in s with ``time``.
+    start : :obj:`bool`, optional
+        Measure ``distance`` from the start of the path.
+    time : :obj:`bool`, optional
+        ``distance`` is the time before the end of the path, only allowed with
+        :attr:`compas_rrc.Zone.FINE`.
+    motion_type : :class:`compas_rrc.Motion`, optional
+    """
+
+    def __init__(
+        self,
+        frame,
+        speed,
+        zone,
+        signal,
+        value,
+        distance=0,
+        start=False,
+        time=False,
+        motion_type=Motion.LINEAR,
+        feedback_level=compas_rrc.FeedbackLevel.NONE,
+    ):
+        if time and (start or zone != Zone.FINE):
+            raise ValueError("Time triggers are only allowed before a fine point")
+
+        super(MoveToFrameTrigger, self).__init__(
+            frame, speed, zone, motion_type, feedback_level
+        )
+        self.instruction = TRIGGER_INSTRUCTION
+        self.string_values = self.string_values + [signal]
+        self.float_values = self.float_values + [
+            distance,
+            value,
+            1 if start else 0,
+            1 if time else 0,
+        ]
+        check_value_counts(self)
+
 
 class RobotClient(compas_rrc.AbbClient):
     """Robot communication client for MMEC
@@ -40,6 +209,53 @@ class RobotClient(compas_rrc.AbbClient):
     ----------
     ros_port : :obj:`int`, optional
         ROS client port for communcation with ABB controller, defaults to 9090.
+    ros : :class:`compas_fab.backends.RosClient`, optional
+        Connection to use instead of a new one on ``ros_port``, e.g. a
+        :class:`mmec_fab.FakeRos`.
+    batch_size : :obj:`int`, optional
+        Number of instructions sent without waiting that are written to the
+        connection together, ``1`` to send each right away. See
+        :class:`mmec_fab.BatchedTopic`.
+    batch_delay : :obj:`float`, optional
+        Seconds an instruction may wait for others to join its batch.
+    encoding : :obj:`str`, optional
+        ``"cbor"`` to receive feedback in the binary CBOR encoding where the
+        connection supports it, ``"json"`` for JSON. See
+        :mod:`mmec_fab.encoding`.
+    float_precision : :obj:`int`, optional
+        Decimals the float values of instructions are rounded to, ``None``
+        to send them unchanged.
+    adaptive_timeouts : :obj:`bool`, optional
+        Time out waits for feedback shortly after the predicted completion of
+        the instruction, see :class:`mmec_fab.AdaptiveTimeouts`. Otherwise
+        they wait without timeout unless one is given.
+
+    Attributes
+    ----------
+    item_index : :obj:`int`
+        Index of the last workflow item sent, ``-1`` before the first one.
+        :meth:`run_plan` counts from the start of each plan, so the markers
+        of its phases carry the plan's item indices.
+    workflow : :obj:`str`
+        Name of the workflow of the item being sent, ``None`` outside of items.
+    params : :obj:`dict`
+        Speed, zone and offset parameters of the item being sent.
+    phase : :obj:`str`
+        Phase last sent, one of :data:`PHASES`.
+    executing : :class:`PhaseMarker`
+        Phase the controller is currently executing, according to feedback.
+    encoding : :obj:`str`
+        Encoding of the feedback, ``"cbor"`` or ``"json"``. Set from the first
+        feedback received, the one asked for until then.
+    timeouts : :class:`mmec_fab.AdaptiveTimeouts`
+        Predicted completion of the instructions sent, ``None`` without
+        adaptive timeouts.
+    listeners : :obj:`list`
+        Objects notified of client events. Listeners implement any of the
+        methods ``phase_started(marker)``, ``plan_started(plan)``,
+        ``plan_finished(plan)``, ``instruction_sending(instruction)``,
+        ``instruction_sent(instruction)`` and ``feedback_received(message)``.
+        Exceptions raised by ``instruction_sending`` stop the instruction.
 
     Class attributes
     ----------------
@@ -51,9 +267,56 @@ class RobotClient(compas_rrc.AbbClient):
     # Define external axes, will not be used but required in move cmds
     EXTERNAL_AXES_DUMMY = compas_rrc.ExternalAxes()
 
-    def __init__(self, ros_port=9090):
+    def __init__(
+        self,
+        ros_port=9090,
+        ros=None,
+        batch_size=32,
+        batch_delay=0.005,
+        encoding="cbor",
+        float_precision=6,
+        adaptive_timeouts=True,
+    ):
         """Sets up a RosClient."""
-        super(RobotClient, self).__init__(RosClient(port=9090), namespace="/")
+        if ros is None:
+            ros = RosClient(port=ros_port)
+        super(RobotClient, self).__init__(ros, namespace="/")
+        self.topic = BatchedTopic(self.topic, batch_size, batch_delay)
+        self.float_precision = float_precision
+        self.encoding = "json"
+        self._check_encoding = False
+        if encoding == "cbor" and accept_binary(ros):
+            self._subscribe_feedback("cbor")
+        self._init_state()
+
+        self.timeouts = None
+        if adaptive_timeouts:
+            self.timeouts = AdaptiveTimeouts(TIMEOUT_SHORT, TIMEOUT_LONG, TCP_MAX_SPEED)
+            self.add_listener(self.timeouts)
+
+    def _subscribe_feedback(self, compression):
+        # rosbridge falls back to JSON if it doesn't know the compression
+        feedback = self.feedback
+        feedback.unsubscribe()
+        self.feedback = roslibpy.Topic(
+            self.ros, feedback.name, feedback.message_type, queue_size=0
+        )
+        self.feedback.compression = compression
+        self.feedback.subscribe(self.feedback_callback)
+        self.encoding = compression
+        self._check_encoding = True
+
+    def _init_state(self):
+        self.item_index = -1
+        self.workflow = None
+        self.params = {}
+        self.phase = None
+        self.executing = None
+        self.listeners = []
+
+        self._pending_marker = None
+        self._phase_markers = {}
+        self._marker_lock = threading.Lock()
 
     # __enter__ and __exit__ are called at start and end of with statements
     # example:
@@ -67,10 +330,271 @@ class RobotClient(compas_rrc.AbbClient):
         return self
 
     def __exit__(self, *args):
+        self.flush()
         self.ros.close()
         self.ros.terminate()
 
+    def send(self, instruction):
+        """Send instruction, tagging it if it is the first of a new phase.
+
+        The first instruction after :meth:`set_phase` is sent with feedback
+        requested, so the client learns when the controller starts executing
+        the phase without any extra messages. A move only reports done once
+        the robot is on its way to the next target, or stopped at a fine
+        point, so a phase starting with a move is marked by a ``Noop`` sent
+        before it instead.
+        """
+        if self._pending_marker is not None and _is_move(instruction):
+            self.send(compas_rrc.Noop())
+
+        self._notify("instruction_sending", instruction)
+        if self.float_precision is not None and getattr(
+            instruction, "float_values", None
+        ):
+            instruction.float_values = round_floats(
+                instruction.float_values, self.float_precision
+            )
+
+        marker = self._pending_marker
+        if marker is None:
+            future = super(RobotClient, self).send(instruction)
+            self._notify("instruction_sent", instruction)
+            return future
+
+        self._pending_marker = None
+        if instruction.feedback_level == compas_rrc.FeedbackLevel.NONE:
+            instruction.feedback_level = compas_rrc.FeedbackLevel.DONE
+
+        # Hold the lock until the marker is registered, so the feedback can't
+        # be handled before we know about it
+        with self._marker_lock:
+            marker.sent_at = time.time()
+            future = super(RobotClient, self).send(instruction)
+            self._phase_markers[instruction.sequence_id] = marker
+
+        self._notify("instruction_sent", instruction)
+        return future
+
+    def send_and_wait(self, instruction, timeout=None):
+        """Send instruction and the ones batched before it, and wait for feedback.
+
+        Parameters
+        ----------
+        instruction : :class:`compas_fab.backends.ros.messages.ROSmsg`
+        timeout : :obj:`float`, optional
+            Seconds to wait. By default the wait times out shortly after the
+            instruction is expected to be done, see :attr:`timeouts`.
+
+        Raises
+        ------
+        :exc:`compas_rrc.TimeoutException`
+            If the feedback doesn't arrive in time.
+        """
+        if instruction.feedback_level == compas_rrc.FeedbackLevel.NONE:
+            instruction.feedback_level = compas_rrc.FeedbackLevel.DONE
+
+        future = self.send(instruction)
+        self.flush()
+        if timeout is None and self.timeouts is not None:
+            return self.timeouts.wait(future, instruction.sequence_id)
+        return future.result(timeout)
+
+    def flush(self):
+        """Send batched instructions now."""
+        self.topic.flush()
+
+    def feedback_callback(self, message):
+        if self._check_encoding:
+            self._check_encoding = False
+            if not isinstance(message, CborMessage):
+                self.encoding = "json"
+
+        self._notify("feedback_received", message)
+        super(RobotClient, self).feedback_callback(message)
+
+        with self._marker_lock:
+            marker = self._phase_markers.pop(message["feedback_id"], None)
+
+        if marker:
+            marker.executed_at = time.time()
+            self.executing = marker
+            self._notify("phase_started", marker)
+
+    @property
+    def pending_markers(self):
+        """Number of phases sent whose start the controller hasn't reported."""
+        with self._marker_lock:
+            return len(self._phase_markers)
+
+    def add_listener(self, listener):
+        """Register an object to be notified of client events."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Unregister a listener added with :meth:`add_listener`."""
+        self.listeners.remove(listener)
+
+    def _notify(self, event, *args):
+        for listener in self.listeners:
+            callback = getattr(listener, event, None)
+            if callback:
+                callback(*args)
+
+    def set_phase(self, phase):
+        """Mark the start of a new phase of the current item.
+
+        Parameters
+        ----------
+        phase : :obj:`str`
+            One of :data:`PHASES`.
+        """
+        if phase not in PHASES:
+            raise ValueError("Unknown phase: {}".format(phase))
+
+        self.phase = phase
+        item_index = self.item_index if self.workflow else -1
+        self._pending_marker = PhaseMarker(
+            item_index, self.workflow, phase, self.params
+        )
+
+    def prompt(self, text):
+        """Show a message to the operator at the computer."""
+        print(text)
+
+    def run_plan(self, plan):
+        """Send the instructions of a prepared plan.
+
+        Parameters
+        ----------
+        plan : :class:`mmec_fab.Plan`
+            Plan compiled by :func:`mmec_fab.prepare_job`.
+        """
+        self.item_index = -1
+        self._notify("plan_started", plan)
+        item = None
+
+        for step in plan.steps:
+            if step["item"] != item:
+                item = step["item"]
+                if item < 0:
+                    self._end_item()
+                else:
+                    info = plan.items[item]
+                    self._start_item(info["workflow"], **info["params"])
+
+            if step.get("new_phase"):
+                self.set_phase(step["phase"])
+
+            if "prompt" in step:
+                self.prompt(step["prompt"])
+            elif step["wait"]:
+                self.send_and_wait(ROSmsg(**step["msg"]), timeout=step.get("timeout"))
+            else:
+                self.send(ROSmsg(**step["msg"]))
+
+        self._notify("plan_finished", plan)
+
+    def _start_item(self, workflow, **params):
+        self.item_index += 1
+        self.workflow = workflow
+        self.params = params
+
+    def _end_item(self):
+        self.workflow = None
+        self.params = {}
+
+    def move_and_grip(
+        self,
+        frame,
+        speed,
+        zone,
+        value,
+        gripper_trigger=None,
+        motion_type=Motion.JOINT,
+        wait=False,
+    ):
+        """Move to a frame and set the gripper there.
+
+        Parameters
+        ----------
+        frame : :class:`compas.geometry.Frame`
+        speed : :obj:`float`
+        zone : :class:`compas_rrc.Zone`
+        value : :obj:`int`
+            ``1`` to close, ``0`` to open the gripper.
+        gripper_trigger : :obj:`float`, optional
+            Set the gripper this distance in mm before reaching the frame, as
+            part of the move. By default the gripper is set by a separate
+            instruction after the move.
+        motion_type : :class:`compas_rrc.Motion`, optional
+        wait : :obj:`bool`, optional
+            Wait for the move to finish.
+        """
+        send = self.send_and_wait if wait else self.send
+        if gripper_trigger is None:
+            send(MoveToFrame(frame, speed, zone, motion_type=motion_type))
+            self.send(compas_rrc.SetDigital(GRIPPER_PIN, value))
+        else:
+            send(
+                MoveToFrameTrigger(
+                    frame,
+                    speed,
+                    zone,
+                    GRIPPER_PIN,
+                    value,
+                    distance=gripper_trigger,
+                    motion_type=motion_type,
+                )
+            )
+
+    def grip_and_move(
+        self,
+        value,
+        frame,
+        speed,
+        zone,
+        gripper_trigger=None,
+        motion_type=Motion.JOINT,
+        wait=False,
+    ):
+        """Set the gripper and move away to a frame.
+
+        Parameters
+        ----------
+        value : :obj:`int`
+            ``1`` to close, ``0`` to open the gripper.
+        frame : :class:`compas.geometry.Frame`
+        speed : :obj:`float`
+        zone : :class:`compas_rrc.Zone`
+        gripper_trigger : :obj:`float`, optional
+            Set the gripper this distance in mm after leaving, as part of the
+            move. By default the gripper is set by a separate instruction
+            before the move.
+        motion_type : :class:`compas_rrc.Motion`, optional
+        wait : :obj:`bool`, optional
+            Wait for the move to finish.
+        """
+        send = self.send_and_wait if wait else self.send
+        if gripper_trigger is None:
+            self.send(compas_rrc.SetDigital(GRIPPER_PIN, value))
+            send(MoveToFrame(frame, speed, zone, motion_type=motion_type))
+        else:
+            send(
+                MoveToFrameTrigger(
+                    frame,
+                    speed,
+                    zone,
+                    GRIPPER_PIN,
+                    value,
+                    distance=gripper_trigger,
+                    start=True,
+                    motion_type=motion_type,
+                )
+            )
+
     def pre(self, safe_joint_position=[0, 0, 0, 0, 90, 0]):
+        self._end_item()
+        self.set_phase("setup")
         self.check_connection_controller()
         # Open gripper
         self.send(compas_rrc.SetDigital(GRIPPER_PIN, False))
@@ -93,6 +617,8 @@ class RobotClient(compas_rrc.AbbClient):
 
 
     def post(self, safe_joint_position=[0, 0, 0, 0, 90, 0]):
+        self._end_item()
+        self.set_phase("finish")
         self.send_and_wait(
             MoveToJoints(SAFE_JOINT_POSITION, self.EXTERNAL_AXES_DUMMY, 150, 50)
         )
@@ -100,6 +626,8 @@ class RobotClient(compas_rrc.AbbClient):
 
 
     def preroll(self, safe_roll_position=[90, 0, 0, 0, 90, 0]):
+        self._end_item()
+        self.set_phase("setup")
         self.check_connection_controller()
         # Open gripper
         self.send(compas_rrc.SetDigital(GRIPPER_PIN, False))
@@ -122,6 +650,8 @@ class RobotClient(compas_rrc.AbbClient):
 
 
     def postroll(self, safe_roll_position=[90, 0, 0, 0, 90, 0]):
+        self._end_item()
+        self.set_phase("finish")
         self.send_and_wait(
             MoveToJoints(SAFE_ROLL_POSITION, self.EXTERNAL_AXES_DUMMY, 150, 50)
         )
@@ -140,6 +670,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=150,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         pick_frame = ensure_frame(pick_framelike)
         place_frame = ensure_frame(place_framelike)
@@ -148,21 +679,30 @@ class RobotClient(compas_rrc.AbbClient):
         above_pick_frame = offset_frame(pick_frame, -offset_distance)
         above_place_frame = offset_frame(place_frame, -offset_distance)
 
+        self._start_item(
+            "pick_place",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         # PICK
+        self.set_phase("pick")
 
         # Move to just above pickup frame
         self.send(MoveToFrame(above_pick_frame, travel_speed, travel_zone))
 
-        # Move to pickup frame
-        self.send(MoveToFrame(pick_frame, precise_speed, precise_zone))
-
-        # Activate gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to pickup frame and activate gripper
+        self.move_and_grip(pick_frame, precise_speed, precise_zone, 1, gripper_trigger)
 
         # Return to just above pickup frame
         self.send(MoveToFrame(above_pick_frame, precise_speed, precise_zone,motion_type=motion_type_precise))
 
         # PLACE
+        self.set_phase("place")
 
         # Move to just above place frame
         self.send(MoveToFrame(above_place_frame, travel_speed, travel_zone))
@@ -170,11 +710,11 @@ class RobotClient(compas_rrc.AbbClient):
         # Move to pickup frame
         self.send(MoveToFrame(place_frame, precise_speed, precise_zone))
 
-        # Release gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 0))
-
-        # Move to just above place frame
-        self.send(MoveToFrame(above_place_frame, travel_speed, travel_zone))
+        # Release gripper and move to just above place frame
+        self.set_phase("release")
+        self.grip_and_move(
+            0, above_place_frame, travel_speed, travel_zone, gripper_trigger
+        )
 
 
     def base_making(
@@ -192,6 +732,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=150,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         pick_frame = ensure_frame(pick_framelike)
         measure_frame = ensure_frame(measure_framelike)
@@ -204,7 +745,18 @@ class RobotClient(compas_rrc.AbbClient):
         above_place_frame = offset_frame(place_frame, -offset_distance)
 
 
+        self._start_item(
+            "base_making",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         #### MOVE TO SAFE POINT
+        self.set_phase("pick")
 
         # Set Workobject to World Object 0
         self.send(compas_rrc.SetWorkObject(WOBJ))
@@ -221,17 +773,15 @@ class RobotClient(compas_rrc.AbbClient):
         # Move to just above pickup frame
         self.send_and_wait(MoveToFrame(above_pick_frame, travel_speed, travel_zone))
 
-        # Move to pickup frame
-        self.send(MoveToFrame(pick_frame, precise_speed, precise_zone))
-
-        # Activate gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to pickup frame and activate gripper
+        self.move_and_grip(pick_frame, precise_speed, precise_zone, 1, gripper_trigger)
 
         # Slide to measure wood before cutting
         self.send(MoveToFrame(measure_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
 
         # Stop to allow human to Cut the Wood
         self.stop_to_cut()
+        self.set_phase("transfer")
 
         # Move to just above measure frame
         self.send(MoveToFrame(above_measure_frame, travel_speed, travel_zone))
@@ -250,6 +800,7 @@ class RobotClient(compas_rrc.AbbClient):
 
 
         #### Move TO LATTICE MAKING STATION
+        self.set_phase("place")
 
         # Set Workobject to lattice making slice
         self.send(compas_rrc.SetWorkObject(WOBJ_LT))
@@ -262,12 +813,12 @@ class RobotClient(compas_rrc.AbbClient):
 
         # Stop to allow human to nail the Wood
         self.stop_to_nail()
+        self.set_phase("release")
 
-        # Release gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 0))
-
-        # Move to just above place frame
-        self.send_and_wait(MoveToFrame(above_place_frame, travel_speed, travel_zone))
+        # Release gripper and move to just above place frame
+        self.grip_and_move(
+            0, above_place_frame, travel_speed, travel_zone, gripper_trigger, wait=True
+        )
         # self.send_and_wait(MoveToFrame(safe_frame, travel_speed, travel_zone))
         
 
@@ -291,6 +842,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=150,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         pick_frame = ensure_frame(pick_framelike)
         measure_frame = ensure_frame(measure_framelike)
@@ -302,7 +854,18 @@ class RobotClient(compas_rrc.AbbClient):
         above_place_frame = offset_frame(place_frame, -offset_distance)
 
 
+        self._start_item(
+            "slice_making",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         #### MOVE TO SAFE POINT
+        self.set_phase("pick")
 
         # Set Workobject to World Object 0
         self.send(compas_rrc.SetWorkObject(WOBJ))
@@ -318,17 +881,15 @@ class RobotClient(compas_rrc.AbbClient):
         # Move to just above pickup frame
         self.send(MoveToFrame(above_pick_frame, travel_speed, travel_zone))
 
-        # Move to pickup frame
-        self.send(MoveToFrame(pick_frame, precise_speed, precise_zone))
-
-        # Activate gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to pickup frame and activate gripper
+        self.move_and_grip(pick_frame, precise_speed, precise_zone, 1, gripper_trigger)
 
         # Slide to measure wood before cutting
         self.send_and_wait(MoveToFrame(measure_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
 
         # Stop to allow human to Cut the Wood
         self.stop_to_cut()
+        self.set_phase("transfer")
 
         # Move to just above measure frame
         self.send(MoveToFrame(above_measure_frame, travel_speed, travel_zone))
@@ -343,6 +904,7 @@ class RobotClient(compas_rrc.AbbClient):
 
 
         #### MOVEMENT AT THE SLICE MAKING STATION
+        self.set_phase("place")
 
         # Set Workobject to Slice Making Station
         self.send(compas_rrc.SetWorkObject(WOBJ_SL))
@@ -355,12 +917,12 @@ class RobotClient(compas_rrc.AbbClient):
 
         # Stop to allow human to nail the Wood
         self.stop_to_nail()
+        self.set_phase("release")
 
-        # Release gripper
-        self.send_and_wait(compas_rrc.SetDigital(GRIPPER_PIN, 0))
-
-        # Move to just above place frame
-        self.send_and_wait(MoveToFrame(above_place_frame, travel_speed, travel_zone))
+        # Release gripper and move to just above place frame
+        self.grip_and_move(
+            0, above_place_frame, travel_speed, travel_zone, gripper_trigger, wait=True
+        )
         # self.send_and_wait(MoveToFrame(safe_frame, travel_speed, travel_zone))
         
 
@@ -387,6 +949,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=150,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         pick_slice_frame = ensure_frame(pick_slice_framelike)
         safe2_frame = ensure_frame(safe2_framelike)
@@ -397,7 +960,18 @@ class RobotClient(compas_rrc.AbbClient):
         above_pick_slice_frame = offset_frame(pick_slice_frame, -offset_distance)
         offset_place_slice_frame = offset_frame(place_slice_frame, -offset_distance)
 
+        self._start_item(
+            "slice_placing",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         #### MOVEMENT AT THE SLICE MAKING STATION
+        self.set_phase("pick")
 
         # Set Workobject to Slice Making Station
         self.send(compas_rrc.SetWorkObject(WOBJ_SL))
@@ -408,22 +982,23 @@ class RobotClient(compas_rrc.AbbClient):
         # Move to just above pick_slice frame
         self.send(MoveToFrame(above_pick_slice_frame, travel_speed, travel_zone))
 
-        # Move to pick_slice frame
-        self.send(MoveToFrame(pick_slice_frame, precise_speed, precise_zone))
-
-        # Activate gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to pick_slice frame and activate gripper
+        self.move_and_grip(
+            pick_slice_frame, precise_speed, precise_zone, 1, gripper_trigger
+        )
 
         # Move to just above pick_slice frame
         self.send(MoveToFrame(above_pick_slice_frame, travel_speed, travel_zone))
 
         #### MOVE TO SAFE2 POINT
+        self.set_phase("transfer")
         self.send(MoveToFrame(safe2_frame, travel_speed, travel_zone))
 
         # Rotate plane at safe2 point
         self.send(MoveToFrame(rotated_safe2_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
 
         #### MOVEMENT AT THE LATTICE MAKING STATION
+        self.set_phase("place")
 
         # Set Workobject to Lattice Station
         self.send(compas_rrc.SetWorkObject(WOBJ_LT))
@@ -436,12 +1011,17 @@ class RobotClient(compas_rrc.AbbClient):
 
         # Stop to allow human to nail the Wood
         self.stop_to_nail()
-
-        # Release gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 0))
-
-        # Move to offset place_slice frame
-        self.send(MoveToFrame(offset_place_slice_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
+        self.set_phase("release")
+
+        # Release gripper and move to offset place_slice frame
+        self.grip_and_move(
+            0,
+            offset_place_slice_frame,
+            precise_speed,
+            precise_zone,
+            gripper_trigger,
+            motion_type=motion_type_precise,
+        )
 
         # Set Workobject to Slice Making Station
         self.send(compas_rrc.SetWorkObject(WOBJ_SL))
@@ -466,6 +1046,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=150,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         pick_frame = ensure_frame(pick_framelike)
         measure_frame = ensure_frame(measure_framelike)
@@ -476,7 +1057,18 @@ class RobotClient(compas_rrc.AbbClient):
         above_measure_frame = offset_frame(measure_frame, -offset_distance)
         above_place_frame = offset_frame(place_frame, -offset_distance)
 
+        self._start_item(
+            "cap_making",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         #### MOVE TO SAFE POINT
+        self.set_phase("pick")
 
         # Set Workobject to World Object 0
         self.send(compas_rrc.SetWorkObject(WOBJ))
@@ -493,17 +1085,15 @@ class RobotClient(compas_rrc.AbbClient):
         # Move to just above pickup frame
         self.send_and_wait(MoveToFrame(above_pick_frame, travel_speed, travel_zone))
 
-        # Move to pickup frame
-        self.send(MoveToFrame(pick_frame, precise_speed, precise_zone))
-
-        # Activate gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to pickup frame and activate gripper
+        self.move_and_grip(pick_frame, precise_speed, precise_zone, 1, gripper_trigger)
 
         # Slide to measure wood before cutting
         self.send(MoveToFrame(measure_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
 
         # Stop to allow human to Cut the Wood
         self.stop_to_cut()
+        self.set_phase("transfer")
 
         # Move to just above measure frame
         self.send(MoveToFrame(above_measure_frame, travel_speed, travel_zone))
@@ -519,6 +1109,7 @@ class RobotClient(compas_rrc.AbbClient):
 
 
         #### Move TO SLICE MAKING STATION
+        self.set_phase("place")
 
         # Set Workobject to slice making slice
         self.send(compas_rrc.SetWorkObject(WOBJ_SL))
@@ -531,12 +1122,12 @@ class RobotClient(compas_rrc.AbbClient):
 
         # Stop to allow human to nail the Wood
         self.stop_to_nail()
+        self.set_phase("release")
 
-        # Release gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 0))
-
-        # Move to just above place frame
-        self.send_and_wait(MoveToFrame(above_place_frame, travel_speed, travel_zone))
+        # Release gripper and move to just above place frame
+        self.grip_and_move(
+            0, above_place_frame, travel_speed, travel_zone, gripper_trigger, wait=True
+        )
         # self.send_and_wait(MoveToFrame(safe_frame, travel_speed, travel_zone))
         
 
@@ -561,7 +1152,17 @@ class RobotClient(compas_rrc.AbbClient):
     ):
         pick_frame = ensure_frame(pick_framelike)
 
+        self._start_item(
+            "point_go",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+        )
+
         # PICK
+        self.set_phase("approach")
 
         # Move to pickup frame
         self.send_and_wait(MoveToFrame(pick_frame, precise_speed, precise_zone, motion_type=motion_type_precise))
@@ -583,7 +1184,17 @@ class RobotClient(compas_rrc.AbbClient):
     ):
         marking_frame = ensure_frame(marking_framelike)
 
+        self._start_item(
+            "marking",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+        )
+
         # GO TO LOCATION POINT
+        self.set_phase("approach")
 
         # Set Workobject
         self.send(compas_rrc.SetWorkObject(WOBJ_SL))
@@ -609,6 +1220,7 @@ class RobotClient(compas_rrc.AbbClient):
         offset_distance=4,
         motion_type_travel=Motion.JOINT,
         motion_type_precise=Motion.LINEAR,
+        gripper_trigger=None,
     ):
         rolling_frame = ensure_frame(rolling_framelike)
         offset_rolling_frame = offset_frame(rolling_frame, -offset_distance)
@@ -617,7 +1229,18 @@ class RobotClient(compas_rrc.AbbClient):
     
 
     
+        self._start_item(
+            "rolling",
+            travel_speed=travel_speed,
+            travel_zone=travel_zone,
+            precise_speed=precise_speed,
+            precise_zone=precise_zone,
+            offset_distance=offset_distance,
+            gripper_trigger=gripper_trigger,
+        )
+
         #### MOVEMENT AT THE SLICE MAKING STATION
+        self.set_phase("roll")
 
         # Set Workobject to Lattice Station
         self.send(compas_rrc.SetWorkObject(WOBJ_LT))
@@ -627,15 +1250,21 @@ class RobotClient(compas_rrc.AbbClient):
 
         # Stop to measure
         self.stop_to_nail()
+        self.set_phase("roll")
         
         # Move to frame
         self.send_and_wait(MoveToFrame(offset_rolling_frame, precise_speed, precise_zone,motion_type_precise))
 
-        # Move to frame
-        self.send_and_wait(MoveToFrame(rolling_frame, precise_speed, precise_zone,motion_type_precise))
-
-        # Close gripper
-        self.send(compas_rrc.SetDigital(GRIPPER_PIN, 1))
+        # Move to frame and close gripper
+        self.move_and_grip(
+            rolling_frame,
+            precise_speed,
+            precise_zone,
+            1,
+            gripper_trigger,
+            motion_type=motion_type_precise,
+            wait=True,
+        )
 
         # Move to frame
         self.send_and_wait(MoveToFrame(rolling_frame, precise_speed, precise_zone,motion_type_precise))
@@ -676,7 +1305,7 @@ class RobotClient(compas_rrc.AbbClient):
         """Stop program and prompt user to press play on pendant to resume."""
         self.send(compas_rrc.PrintText("Press play To start the Program."))
         self.send(compas_rrc.Stop())
-        print("Press start on pendant when ready")
+        self.prompt("Press start on pendant when ready")
 
         # After user presses play on pendant execution resumes:
         self.send(compas_rrc.PrintText("Resuming execution."))
@@ -684,45 +1313,53 @@ class RobotClient(compas_rrc.AbbClient):
 
     def stop_to_cut(self):
         """Stop program and prompt user to press play on pendant to resume."""
+        self.set_phase("cut")
         self.send(compas_rrc.PrintText("stop to Cut, press play When Finish."))
         self.send(compas_rrc.Stop())
-        print("stop to Cut, press play on pendant to continue")
+        self.prompt("stop to Cut, press play on pendant to continue")
 
         # After user presses play on pendant execution resumes:
         self.send(compas_rrc.PrintText("continue to place and nail process."))
 
     def stop_to_nail(self):
         """Stop program and prompt user to press play on pendant to resume."""
+        self.set_phase("nail")
         self.send(compas_rrc.PrintText("stop to Nail, press play when Finish."))
         self.send(compas_rrc.Stop())
-        print("stop to Nail, press play on pendant to continue")
+        self.prompt("stop to Nail, press play on pendant to continue")
 
         # After user presses play on pendant execution resumes:
         self.send(compas_rrc.PrintText("continue to pick and cut process."))
 
     def stop_to_measure(self):
         """Stop program and prompt user to press play on pendant to resume."""
+        self.set_phase("measure")
         self.send(compas_rrc.PrintText("stop to measure, press play when Finish."))
         self.send(compas_rrc.Stop())
-        print("stop to measure, press play on pendant to continue")
+        self.prompt("stop to measure, press play on pendant to continue")
 
         # After user presses play on pendant execution resumes:
         self.send(compas_rrc.PrintText("continue to next location."))
 
 
-    def check_connection_controller(self, timeout=10):
+    def check_connection_controller(self, timeout=None):
         """Check connection to ABB controller and raises an exception if not connected.
 
         Parameters
         ----------
-        timeout_ping
-            Timeout for ping response in seconds.
+        timeout : :obj:`float`, optional
+            Timeout for ping response in seconds. By default the margin of
+            :attr:`timeouts` after the instructions queued before it, or
+            :data:`TIMEOUT_SHORT` without adaptive timeouts.
 
         Raises
         ------
         :exc:`compas_rrc.TimeoutException`
             If no reply is returned to second ping before timeout.
         """
+        if timeout is None and self.timeouts is None:
+            timeout = TIMEOUT_SHORT
+
         try:
             self.send_and_wait(
                 compas_rrc.Noop(feedback_level=compas_rrc.FeedbackLevel.DONE),
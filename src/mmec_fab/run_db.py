@@ -0,0 +1,370 @@
+"""Historical run database for throughput tracking.
+
+Every run appends its per item and per phase timings, the parameters used and
+the hash of the job file to a local SQLite database. Use the command line to
+query it::
+
+    python -m mmec_fab runs median slice_making --last 20
+    python -m mmec_fab runs report --workflow slice_making
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from mmec_fab.utils import file_hash
+from mmec_fab.utils import median
+
+__all__ = ["RunDatabase", "RunRecorder", "DEFAULT_DB_PATH"]
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".mmec_fab", "runs.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    job_path TEXT,
+    job_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    item_index INTEGER NOT NULL,
+    workflow TEXT NOT NULL,
+    params TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    item_index INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+CREATE INDEX IF NOT EXISTS items_workflow ON items (workflow, run_id);
+CREATE INDEX IF NOT EXISTS phases_run ON phases (run_id, phase);
+"""
+
+
+class RunDatabase(object):
+    """SQLite database of job runs.
+
+    Parameters
+    ----------
+    path : :obj:`str`, optional
+        Database file, created if missing. Defaults to :data:`DEFAULT_DB_PATH`.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Rows are written from the ROS feedback thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, job_path=None):
+        """Add a run and return its id.
+
+        Parameters
+        ----------
+        job_path : :obj:`str` or :obj:`list`, optional
+            Job file, or the files of a scheduled run, which are hashed
+            together and stored separated by :data:`os.pathsep`.
+        """
+        job_hash = None
+        if isinstance(job_path, (list, tuple)):
+            hashes = "".join(file_hash(path) for path in job_path)
+            job_hash = hashlib.sha1(hashes.encode("utf-8")).hexdigest()
+            job_path = os.pathsep.join(job_path)
+        elif job_path:
+            job_hash = file_hash(job_path)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, job_path, job_hash) VALUES (?, ?, ?)",
+                (time.time(), job_path, job_hash),
+            )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET finished_at = ? WHERE id = ?", (time.time(), run_id)
+            )
+
+    def add_item(self, run_id, item_index, workflow, params, started_at, duration):
+        params = json.dumps(params, sort_keys=True)
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, item_index, workflow, params, started_at, duration),
+            )
+
+    def add_phase(self, run_id, item_index, phase, started_at, duration):
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO phases VALUES (?, ?, ?, ?, ?)",
+                (run_id, item_index, phase, started_at, duration),
+            )
+
+    def runs(self, workflow, last=None):
+        """Return runs of a workflow, most recent first.
+
+        Returns
+        -------
+        :obj:`list` of :obj:`dict`
+            Run rows, with the ``params`` of the workflow's first item.
+        """
+        query = (
+            "SELECT id, started_at, job_path, job_hash, "
+            "(SELECT params FROM items "
+            "WHERE run_id = runs.id AND workflow = ? LIMIT 1) "
+            "FROM runs WHERE id IN (SELECT run_id FROM items WHERE workflow = ?) "
+            "ORDER BY started_at DESC"
+        )
+        args = (workflow, workflow)
+        if last:
+            query += " LIMIT ?"
+            args += (last,)
+
+        keys = ("id", "started_at", "job_path", "job_hash", "params")
+        runs = [dict(zip(keys, row)) for row in self.connection.execute(query, args)]
+        for run in runs:
+            run["params"] = json.loads(run["params"]) if run["params"] else {}
+        return runs
+
+    def cycle_times(self, run_ids, workflow):
+        """Return item durations of the given runs."""
+        if not run_ids:
+            return []
+
+        query = "SELECT duration FROM items WHERE workflow = ? AND run_id IN ({})"
+        query = query.format(", ".join("?" * len(run_ids)))
+        return [row[0] for row in self.connection.execute(query, [workflow] + run_ids)]
+
+    def phase_times(self, run_ids, phase):
+        """Return durations of a phase in the given runs."""
+        if not run_ids:
+            return []
+
+        query = "SELECT duration FROM phases WHERE phase = ? AND run_id IN ({})"
+        query = query.format(", ".join("?" * len(run_ids)))
+        return [row[0] for row in self.connection.execute(query, [phase] + run_ids)]
+
+    def median_cycle_time(self, workflow, last=20):
+        """Median item duration of a workflow over its last runs."""
+        run_ids = [run["id"] for run in self.runs(workflow, last)]
+        return median(self.cycle_times(run_ids, workflow))
+
+    def regressions(self, workflow, threshold=0.1, last=None):
+        """Compare throughput between consecutive parameter sets.
+
+        Runs are grouped by consecutive runs using the same parameters, and
+        the median cycle time of each group is compared with the group before.
+
+        Parameters
+        ----------
+        workflow : :obj:`str`
+        threshold : :obj:`float`, optional
+            Relative increase of median cycle time flagged as a regression.
+        last : :obj:`int`, optional
+            Only consider the last runs.
+
+        Returns
+        -------
+        :obj:`list` of :obj:`dict`
+            One entry per parameter group, oldest first, with keys ``params``,
+            ``runs``, ``median``, ``change`` and ``regression``.
+        """
+        groups = []
+        for run in reversed(self.runs(workflow, last)):
+            if groups and groups[-1]["params"] == run["params"]:
+                groups[-1]["runs"].append(run["id"])
+            else:
+                groups.append({"params": run["params"], "runs": [run["id"]]})
+
+        previous = None
+        for group in groups:
+            group["median"] = median(self.cycle_times(group["runs"], workflow))
+            group["change"] = None
+            group["regression"] = False
+
+            if previous is not None and group["median"] is not None:
+                group["change"] = group["median"] / previous - 1
+                group["regression"] = group["change"] > threshold
+
+            if group["median"] is not None:
+                previous = group["median"]
+
+        return groups
+
+
+class RunRecorder(object):
+    """Record the timings of a run to a :class:`RunDatabase`.
+
+    Phase durations are measured between the controller executing the start
+    of consecutive phases, see :meth:`mmec_fab.RobotClient.set_phase`::
+
+        with RobotClient() as client, RunRecorder(client, file_path):
+            client.pre()
+            ...
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+    job_path : :obj:`str` or :obj:`list`, optional
+        Job file, hashed to identify the job, or the files of a scheduled
+        run, see :meth:`RunDatabase.start_run`.
+    database : :class:`RunDatabase` or :obj:`str`, optional
+        Database or path to one. Defaults to :data:`DEFAULT_DB_PATH`.
+    """
+
+    def __init__(self, client, job_path=None, database=None):
+        self.client = client
+        self.job_path = job_path
+
+        if not isinstance(database, RunDatabase):
+            database = RunDatabase(database or DEFAULT_DB_PATH)
+        self.database = database
+
+        self.run_id = None
+        self._phase = None
+        self._item = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.run_id = self.database.start_run(self.job_path)
+        self.client.add_listener(self)
+
+    def stop(self):
+        self.client.remove_listener(self)
+        self._close(time.time())
+        self.database.finish_run(self.run_id)
+
+    def phase_started(self, marker):
+        now = marker.executed_at
+
+        if self._phase:
+            self._close_phase(now)
+
+        if self._item and self._item.item_index != marker.item_index:
+            self._close_item(now)
+        if self._item is None and marker.item_index >= 0:
+            self._item = marker
+
+        self._phase = marker
+
+    def _close(self, now):
+        if self._phase:
+            self._close_phase(now)
+        if self._item:
+            self._close_item(now)
+
+    def _close_phase(self, now):
+        phase = self._phase
+        self.database.add_phase(
+            self.run_id,
+            phase.item_index,
+            phase.phase,
+            phase.executed_at,
+            now - phase.executed_at,
+        )
+        self._phase = None
+
+    def _close_item(self, now):
+        item = self._item
+        self.database.add_item(
+            self.run_id,
+            item.item_index,
+            item.workflow,
+            item.params,
+            item.executed_at,
+            now - item.executed_at,
+        )
+        self._item = None
+
+
+def _format_params(params):
+    return ", ".join("{}={}".format(key, params[key]) for key in sorted(params))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab runs", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="database file")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    median_parser = commands.add_parser(
+        "median", help="median cycle time of a workflow"
+    )
+    median_parser.add_argument("workflow")
+    median_parser.add_argument("--last", type=int, default=20, help="number of runs")
+
+    report = commands.add_parser("report", help="flag throughput regressions")
+    report.add_argument("--workflow", action="append", help="workflow(s) to report")
+    report.add_argument("--last", type=int, help="only consider the last runs")
+    report.add_argument(
+        "--threshold", type=float, default=0.1, help="relative slowdown to flag"
+    )
+
+    args = parser.parse_args(argv)
+    database = RunDatabase(args.db)
+
+    if args.command == "median":
+        value = database.median_cycle_time(args.workflow, args.last)
+        if value is None:
+            print("No runs of {}".format(args.workflow))
+        else:
+            print("{}: {:.1f} s".format(args.workflow, value))
+        return 0
+
+    workflows = args.workflow or [
+        row[0]
+        for row in database.connection.execute("SELECT DISTINCT workflow FROM items")
+    ]
+
+    found = False
+    for workflow in workflows:
+        print(workflow)
+        for group in database.regressions(workflow, args.threshold, args.last):
+            if group["median"] is None:
+                continue
+
+            change = ""
+            if group["change"] is not None:
+                change = " ({:+.0%})".format(group["change"])
+            flag = "  REGRESSION" if group["regression"] else ""
+            print(
+                "  {} runs, median {:.1f} s{}{}\n    {}".format(
+                    len(group["runs"]),
+                    group["median"],
+                    change,
+                    flag,
+                    _format_params(group["params"]),
+                )
+            )
+            found = found or group["regression"]
+
+    return 1 if found else 0
@@ -0,0 +1,351 @@
+"""Interleaved schedules of items across run data files.
+
+Each making and placing file builds one slice: its making items are nailed
+together on the slice station and its placing item moves the finished slice
+to the lattice. :func:`schedule_files` interleaves the items of several files
+to minimize the estimated robot time including the travel between stations,
+subject to
+
+* keeping the order of the items of each file, the build order of a slice,
+* placing a slice only after all of its members are made,
+* at most ``capacity`` slices on the slice station at a time, and
+* placing slices on the lattice in file order.
+
+With a ``capacity`` of one the files run one after another, items of a file
+are only interleaved with another file's if the station holds more slices.
+
+The result is a single :class:`mmec_fab.Plan`::
+
+    plan, schedule = schedule_files(paths)
+    client.run_plan(plan)
+
+    cd 00_robotcontrol/02_run_data
+    python -m mmec_fab schedule 02_making_placing_aa-01-0*.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from compas.geometry import distance_point_point
+
+from mmec_fab.plan import Plan
+from mmec_fab.plan import prepare_job
+from mmec_fab.robot_client import TCP_MAX_SPEED
+from mmec_fab.timeouts import STATION_TRANSITION
+from mmec_fab.timeouts import MotionEstimator
+
+__all__ = ["Task", "plan_tasks", "schedule_tasks", "schedule_cost", "schedule_files"]
+
+# Workflows whose items start and fill a slice, and the one that empties it
+MAKING_WORKFLOWS = ("slice_making", "base_making", "cap_making")
+PLACING_WORKFLOWS = ("slice_placing",)
+
+
+class Task(object):
+    """An item of a plan to schedule.
+
+    Parameters
+    ----------
+    source : :obj:`int`
+        Index of the plan the item is from.
+    index : :obj:`int`
+        Item index in its plan.
+    workflow : :obj:`str`
+    steps : :obj:`list` of :obj:`dict`
+        Plan steps of the item.
+    tcp_max_speed : :obj:`float`, optional
+        TCP speed cap in mm/s when the item starts, see
+        :class:`mmec_fab.MotionEstimator`.
+    """
+
+    def __init__(self, source, index, workflow, steps, tcp_max_speed=TCP_MAX_SPEED):
+        self.source = source
+        self.index = index
+        self.workflow = workflow
+        self.steps = steps
+
+        # Start and end as work object and position, the capped speed of the
+        # move to the start, and the time of the moves after it
+        self.start = self.end = self.speed = None
+        self.duration = 0.0
+
+        motion = MotionEstimator(tcp_max_speed, STATION_TRANSITION)
+        first = True
+        for step in steps:
+            # Steps through stored targets keep the moves they replace
+            for msg in step.get("moves") or [step.get("msg")]:
+                if not msg:
+                    continue
+                for _, distance, speed in motion.moves(msg):
+                    if speed is not None:
+                        speed = min(speed, motion.tcp_max_speed)
+                    if first:
+                        self.start, self.speed = motion.position, speed
+                        first = False
+                    elif distance is None:
+                        self.duration += STATION_TRANSITION
+                    else:
+                        self.duration += distance / speed
+                    self.end = motion.position
+
+    def __repr__(self):
+        return "Task({}, {}, {!r})".format(self.source, self.index, self.workflow)
+
+
+def plan_tasks(plan, source=0):
+    """Split a plan into its setup steps, item tasks and teardown steps.
+
+    Returns
+    -------
+    :obj:`tuple`
+        Setup steps, :obj:`list` of :class:`Task` and teardown steps.
+    """
+    setup, teardown = [], []
+    blocks = {}
+    for step in plan.steps:
+        if step["item"] >= 0:
+            blocks.setdefault(step["item"], []).append(step)
+        elif blocks:
+            teardown.append(step)
+        else:
+            setup.append(step)
+
+    # Items start with the speed cap of the setup
+    motion = MotionEstimator(TCP_MAX_SPEED)
+    for step in setup:
+        motion.step_duration(step)
+
+    tasks = [
+        Task(
+            source,
+            index,
+            plan.items[index]["workflow"],
+            blocks.get(index, []),
+            motion.tcp_max_speed,
+        )
+        for index in range(len(plan.items))
+    ]
+    return setup, tasks, teardown
+
+
+def _transition_time(a, b, setup=None):
+    # Travel from the end of task a to the start of task b
+    if a is None or a.end is None or b.start is None:
+        return 0.0
+
+    (wobj0, point0), (wobj1, point1) = a.end, b.start
+    if wobj0 != wobj1:
+        if setup is None:
+            return STATION_TRANSITION
+        try:
+            point0 = setup.to_world(wobj0, [point0])[0]
+            point1 = setup.to_world(wobj1, [point1])[0]
+        except (KeyError, ValueError):
+            return STATION_TRANSITION
+    return distance_point_point(point0, point1) / b.speed
+
+
+def schedule_cost(tasks, setup=None):
+    """Estimated robot time of tasks run in order, in seconds.
+
+    Operator stops are not included, as they are the same in any order.
+    """
+    time = 0.0
+    previous = None
+    for task in tasks:
+        time += _transition_time(previous, task, setup) + task.duration
+        previous = task
+    return time
+
+
+def _feasible(sequence, tasks, capacity, ordered=True):
+    # Whether a sequence, the start of a schedule of tasks, keeps the rules
+    remaining = {}
+    placing = set()
+    order = {}
+    for task in tasks:
+        order.setdefault(task.source, []).append(task.index)
+        if task.workflow in MAKING_WORKFLOWS:
+            remaining[task.source] = remaining.get(task.source, 0) + 1
+        elif task.workflow in PLACING_WORKFLOWS:
+            placing.add(task.source)
+    placing = sorted(placing)
+
+    for indices in order.values():
+        indices.sort()
+
+    open_sources = set()
+    placed = 0
+    done = {}
+    for task in sequence:
+        # Items of a source keep their order
+        count = done.get(task.source, 0)
+        if order[task.source][count] != task.index:
+            return False
+        done[task.source] = count + 1
+
+        if task.workflow in MAKING_WORKFLOWS:
+            # Slices that are never placed here are not kept on the station
+            if task.source in placing:
+                open_sources.add(task.source)
+                if ordered:
+                    # Earlier slices have to be made before this one is placed
+                    position = placing.index(task.source)
+                    open_sources.update(placing[placed:position])
+                if len(open_sources) > capacity:
+                    return False
+            remaining[task.source] -= 1
+        elif task.workflow in PLACING_WORKFLOWS:
+            if remaining.get(task.source):
+                return False
+            if ordered and task.source != placing[placed]:
+                return False
+            placed += 1
+            open_sources.discard(task.source)
+    return True
+
+
+def schedule_tasks(tasks, capacity=1, setup=None, ordered=True, max_passes=10):
+    """Order tasks to minimize the estimated robot time.
+
+    A greedy schedule picks the closest allowed task each time, then tasks are
+    moved one at a time to wherever they save the most time.
+
+    Parameters
+    ----------
+    tasks : :obj:`list` of :class:`Task`
+    capacity : :obj:`int`, optional
+        Number of slices the slice station holds.
+    setup : :class:`mmec_fab.KinematicSetup`, optional
+        Work object positions, to estimate the travel between stations.
+    ordered : :obj:`bool`, optional
+        Place slices in the order of their sources.
+    max_passes : :obj:`int`, optional
+        Limit of improvement passes over all tasks.
+
+    Returns
+    -------
+    :obj:`list` of :class:`Task`
+    """
+    schedule = []
+    pending = list(tasks)
+    previous = None
+
+    while pending:
+        candidates = [
+            task
+            for task in pending
+            if _feasible(schedule + [task], tasks, capacity, ordered)
+        ]
+        if not candidates:
+            raise ValueError("No schedule satisfies the station capacity")
+
+        # Earlier tasks win ties, which keeps the order of the files
+        task = min(candidates, key=lambda t: _transition_time(previous, t, setup))
+        schedule.append(task)
+        pending.remove(task)
+        previous = task
+
+    cost = schedule_cost(schedule, setup)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(len(schedule)):
+            for j in range(len(schedule)):
+                if i == j:
+                    continue
+                candidate = list(schedule)
+                candidate.insert(j, candidate.pop(i))
+                if not _feasible(candidate, tasks, capacity, ordered):
+                    continue
+                candidate_cost = schedule_cost(candidate, setup)
+                if candidate_cost < cost - 1e-6:
+                    schedule, cost, improved = candidate, candidate_cost, True
+        if not improved:
+            break
+
+    return schedule
+
+
+def schedule_files(paths, job=None, capacity=1, setup=None, cache=None):
+    """Prepare run data files and interleave their items in one plan.
+
+    Parameters
+    ----------
+    paths : :obj:`list` of :obj:`str`
+        Run data files, in the order their slices are placed.
+    job : :class:`mmec_fab.Job` or :obj:`str`, optional
+        Job for all files, found from the file names if not given.
+    capacity : :obj:`int`, optional
+        Number of slices the slice station holds.
+    setup : :class:`mmec_fab.KinematicSetup`, optional
+        Work object positions, to estimate the travel between stations.
+    cache : :class:`mmec_fab.PlanCache`, optional
+
+    Returns
+    -------
+    :obj:`tuple`
+        The :class:`mmec_fab.Plan` and the scheduled :class:`Task` list.
+    """
+    plans = [prepare_job(path, job, cache) for path in paths]
+
+    setups, tasks, teardowns = [], [], []
+    for source, plan in enumerate(plans):
+        setup_steps, plan_task_list, teardown_steps = plan_tasks(plan, source)
+        setups.append(setup_steps)
+        tasks.extend(plan_task_list)
+        teardowns.append(teardown_steps)
+
+    schedule = schedule_tasks(tasks, capacity, setup)
+
+    items, steps = [], list(setups[0])
+    for task in schedule:
+        item = len(items)
+        items.append(plans[task.source].items[task.index])
+        for step in task.steps:
+            step = dict(step)
+            step["item"] = item
+            steps.append(step)
+    steps.extend(teardowns[-1])
+
+    job_data = dict(plans[0].job)
+    job_data["schedule"] = [[paths[task.source], task.index] for task in schedule]
+    return Plan(job_data, items, steps), schedule
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab schedule", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("paths", nargs="+", help="run data files in placing order")
+    parser.add_argument("--job", help="job for all files")
+    parser.add_argument(
+        "--capacity", type=int, default=1, help="slices the slice station holds"
+    )
+    parser.add_argument("--backup", help="controller backup with the work objects")
+    parser.add_argument("--output", help="write the scheduled plan to this file")
+    args = parser.parse_args(argv)
+
+    setup = None
+    if args.backup:
+        from mmec_fab.rapid_data import load_setup
+
+        setup = load_setup(args.backup)
+
+    plan, schedule = schedule_files(args.paths, args.job, args.capacity, setup)
+
+    tasks = sorted(schedule, key=lambda task: (task.source, task.index))
+    print("file order: {:.1f} s".format(schedule_cost(tasks, setup)))
+    print("scheduled:  {:.1f} s".format(schedule_cost(schedule, setup)))
+    for task in schedule:
+        print(
+            "  {} item {} ({})".format(
+                args.paths[task.source], task.index, task.workflow
+            )
+        )
+
+    if args.output:
+        plan.to_json(args.output)
+
+    return 0
@@ -0,0 +1,430 @@
+"""Soak test of a long session against the local controller stand-in.
+
+Rolling and lattice sessions run for hours in one client process.
+:func:`soak_test` sends tens of thousands of synthetic items of a job through
+a :class:`mmec_fab.RobotClient` connected to a :class:`mmec_fab.FakeRos`,
+and every ``sample_every`` items records the resident memory, the memory
+traced by :mod:`tracemalloc`, what the client still holds, i.e. pending
+futures, phase markers and predicted instructions, and the time to send an
+instruction and to receive its feedback. The test fails if memory grows or
+latency drifts past a threshold after a warm-up, and lists the allocations
+that grew most::
+
+    python -m mmec_fab soak --job rolling --items 20000
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gc
+import itertools
+import math
+import mmap
+import threading
+import time
+import tracemalloc
+
+import compas_rrc
+
+from mmec_fab.exchange import FakeRos
+from mmec_fab.jobs import JOBS
+from mmec_fab.jobs import WORKFLOWS
+from mmec_fab.jobs import Job
+from mmec_fab.robot_client import RobotClient
+from mmec_fab.sources import PatternSource
+from mmec_fab.sources import grid_points
+from mmec_fab.utils import median
+
+__all__ = ["soak_test", "synthetic_source", "resident_memory"]
+
+# Latency changes smaller than this are noise, in seconds
+LATENCY_RESOLUTION = 1e-4
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+def resident_memory():
+    """Resident memory of the process in bytes, ``None`` where unknown.
+
+    Uses ``psutil`` if installed, ``/proc`` otherwise.
+    """
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (IOError, OSError):
+        return None
+
+
+def synthetic_source(workflow, items, spacing=10.0, columns=100):
+    """Source of synthetic items of a workflow, on a grid in the xy plane.
+
+    The frames of an item are stacked 50 mm apart along z, facing down.
+
+    Parameters
+    ----------
+    workflow : :obj:`str`
+        A key of :data:`mmec_fab.WORKFLOWS`.
+    items : :obj:`int`
+        Number of items.
+    spacing : :obj:`float`, optional
+        Distance between items in mm.
+    columns : :obj:`int`, optional
+        Items per row of the grid.
+
+    Returns
+    -------
+    :class:`mmec_fab.PatternSource`
+    """
+    frames = dict(
+        (key, ((0.0, 0.0, 50.0 * index), (1.0, 0.0, 0.0), (0.0, -1.0, 0.0)))
+        for index, key in enumerate(WORKFLOWS[workflow])
+    )
+    grid = grid_points(
+        (0.0, 0.0, 0.0), (columns, int(math.ceil(items / columns))), (spacing, spacing)
+    )
+    return PatternSource(workflow, lambda: itertools.islice(grid(), items), frames)
+
+
+class _Latencies(object):
+    # Client listener timing sends and feedback
+
+    def __init__(self):
+        self.send = []
+        self.feedback = []
+        self._lock = threading.Lock()
+        self._sending = None
+        self._sent = {}
+
+    def instruction_sending(self, instruction):
+        self._sending = _clock()
+
+    def instruction_sent(self, instruction):
+        now = _clock()
+        with self._lock:
+            self.send.append(now - self._sending)
+            if instruction.feedback_level > compas_rrc.FeedbackLevel.NONE:
+                self._sent[instruction.sequence_id] = now
+
+    def feedback_received(self, message):
+        now = _clock()
+        with self._lock:
+            sent = self._sent.pop(message["feedback_id"], None)
+            if sent is not None:
+                self.feedback.append(now - sent)
+
+    def window(self):
+        # Median send and feedback latency since the last window
+        with self._lock:
+            send, self.send = self.send, []
+            feedback, self.feedback = self.feedback, []
+        return median(send), median(feedback)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._sent)
+
+
+def _sample(client, latencies, items, started):
+    send, feedback = latencies.window()
+    return {
+        "items": items,
+        "seconds": time.time() - started,
+        "rss": resident_memory(),
+        "traced": tracemalloc.get_traced_memory()[0]
+        if tracemalloc.is_tracing()
+        else None,
+        "objects": len(gc.get_objects()),
+        "futures": len(client.futures),
+        "markers": client.pending_markers,
+        "predicted": client.timeouts.pending if client.timeouts else 0,
+        "send": send,
+        "feedback": feedback,
+    }
+
+
+def _memory_failures(baseline, last, max_memory_growth):
+    failures = []
+    for key, label in (("rss", "Resident memory"), ("traced", "Traced memory")):
+        if baseline[key] is None or last[key] is None:
+            continue
+        growth = (last[key] - baseline[key]) / 1e6
+        if growth > max_memory_growth:
+            failures.append(
+                "{} grew by {:.1f} MB over {} items, more than {:.1f} MB".format(
+                    label, growth, last["items"] - baseline["items"], max_memory_growth
+                )
+            )
+    return failures
+
+
+def _latency_failures(samples, max_latency_drift):
+    failures = []
+    for key, label in (("send", "Send"), ("feedback", "Feedback")):
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if len(values) < 2:
+            continue
+        first, last = values[0], values[-1]
+        if last - first > LATENCY_RESOLUTION and last > first * max_latency_drift:
+            failures.append(
+                "{} latency drifted from {:.3f} ms to {:.3f} ms, "
+                "more than {:.1f}x".format(
+                    label, first * 1e3, last * 1e3, max_latency_drift
+                )
+            )
+    return failures
+
+
+def soak_test(
+    job="rolling",
+    items=20000,
+    sample_every=500,
+    warmup=2000,
+    max_memory_growth=20.0,
+    max_latency_drift=2.0,
+    execution_time=None,
+    top=10,
+    trace=True,
+    on_sample=None,
+):
+    """Run many synthetic items of a job against a :class:`mmec_fab.FakeRos`.
+
+    Parameters
+    ----------
+    job : :class:`mmec_fab.Job` or :obj:`str`, optional
+        Job or name of a job in :data:`mmec_fab.JOBS`.
+    items : :obj:`int`, optional
+        Items per stage of the job.
+    sample_every : :obj:`int`, optional
+        Items between samples.
+    warmup : :obj:`int`, optional
+        Items sent before the baseline sample, while caches fill up.
+    max_memory_growth : :obj:`float`, optional
+        Growth of resident or traced memory after the warm-up in MB that
+        fails the test.
+    max_latency_drift : :obj:`float`, optional
+        Factor by which the median send or feedback latency of the last
+        samples may exceed the one of the baseline.
+    execution_time : callable, optional
+        Seconds the controller stand-in takes for an instruction message,
+        none by default.
+    top : :obj:`int`, optional
+        Number of allocations that grew most to report.
+    trace : :obj:`bool`, optional
+        Trace allocations with :mod:`tracemalloc`, which slows the client.
+    on_sample : callable, optional
+        Called with each sample as it is taken.
+
+    Returns
+    -------
+    :obj:`dict`
+        Number of ``items`` sent, the ``samples``, the ``top`` allocations
+        that grew after the warm-up, formatted by :mod:`tracemalloc`, and the
+        ``failures``, empty if the test passed.
+    """
+    if not isinstance(job, Job):
+        job = JOBS[job]
+
+    ros = FakeRos(execution_time=execution_time)
+    client = RobotClient(ros=ros)
+    client.prompt = lambda text: None
+    latencies = _Latencies()
+    client.add_listener(latencies)
+
+    tracing = trace and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+
+    samples = []
+    baseline = None
+    snapshot = None
+    count = 0
+    started = time.time()
+    try:
+        with client:
+            getattr(client, job.setup)()
+            for workflow, params in job.stages:
+                method = getattr(client, workflow)
+                for frames in synthetic_source(workflow, items).items(workflow):
+                    method(*frames, **params)
+                    count += 1
+                    if count % sample_every:
+                        continue
+
+                    # Let the controller catch up, so samples compare the
+                    # same state
+                    client.send_and_wait(compas_rrc.Noop())
+                    gc.collect()
+                    sample = _sample(client, latencies, count, started)
+                    samples.append(sample)
+                    if on_sample:
+                        on_sample(sample)
+
+                    if baseline is None and count >= warmup:
+                        baseline = sample
+                        if tracemalloc.is_tracing():
+                            snapshot = tracemalloc.take_snapshot()
+
+            getattr(client, job.teardown)()
+            client.send_and_wait(compas_rrc.Noop())
+
+        gc.collect()
+        last = _sample(client, latencies, count, started)
+        allocations = []
+        if snapshot is not None:
+            ignore = (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            )
+            growth = (
+                tracemalloc.take_snapshot()
+                .filter_traces(ignore)
+                .compare_to(snapshot.filter_traces(ignore), "lineno")
+            )
+            allocations = [str(stat) for stat in growth[:top]]
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    failures = []
+    if baseline is None:
+        failures.append(
+            "No baseline, send more than {} items to warm up".format(warmup)
+        )
+    else:
+        measured = [
+            sample for sample in samples if sample["items"] >= baseline["items"]
+        ]
+        failures.extend(_memory_failures(baseline, samples[-1], max_memory_growth))
+        failures.extend(_latency_failures(measured, max_latency_drift))
+    for key, label in (
+        ("futures", "futures"),
+        ("markers", "phase markers"),
+        ("predicted", "predicted instructions"),
+    ):
+        if last[key]:
+            failures.append("{} {} left after the session".format(last[key], label))
+    if latencies.pending:
+        failures.append("{} instructions without feedback".format(latencies.pending))
+
+    return {
+        "items": count,
+        "seconds": last["seconds"],
+        "samples": samples,
+        "top": allocations,
+        "failures": failures,
+    }
+
+
+ROW = "{:>8} {:>6} {:>8} {:>9} {:>9} {:>8} {:>8} {:>11}"
+
+
+def _format_sample(sample):
+    def megabytes(value):
+        return "-" if value is None else "{:.2f}".format(value / 1e6)
+
+    def milliseconds(value):
+        return "-" if value is None else "{:.3f}".format(value * 1e3)
+
+    return ROW.format(
+        sample["items"],
+        "{:.0f}".format(sample["seconds"]),
+        megabytes(sample["rss"]),
+        megabytes(sample["traced"]),
+        sample["objects"],
+        sample["futures"] + sample["markers"] + sample["predicted"],
+        milliseconds(sample["send"]),
+        milliseconds(sample["feedback"]),
+    )
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab soak", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--job", default="rolling", help="job to run")
+    parser.add_argument(
+        "--items", type=int, default=20000, help="items per stage of the job"
+    )
+    parser.add_argument(
+        "--sample-every", type=int, default=500, help="items between samples"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=2000, help="items before the baseline"
+    )
+    parser.add_argument(
+        "--max-memory-growth",
+        type=float,
+        default=20.0,
+        help="memory growth after the warm-up in MB that fails the test",
+    )
+    parser.add_argument(
+        "--max-latency-drift",
+        type=float,
+        default=2.0,
+        help="factor the median latency may grow by",
+    )
+    parser.add_argument(
+        "--execution-time",
+        type=float,
+        default=0.0,
+        help="seconds the controller takes per instruction",
+    )
+    parser.add_argument(
+        "--no-trace", action="store_true", help="don't trace allocations"
+    )
+    parser.add_argument("--output", help="JSON file for the report")
+    args = parser.parse_args(argv)
+
+    execution_time = None
+    if args.execution_time:
+        execution_time = lambda msg: args.execution_time  # noqa: E731
+
+    print(
+        ROW.format(
+            "items",
+            "s",
+            "RSS MB",
+            "traced MB",
+            "objects",
+            "held",
+            "send ms",
+            "feedback ms",
+        )
+    )
+    report = soak_test(
+        args.job,
+        args.items,
+        args.sample_every,
+        args.warmup,
+        args.max_memory_growth,
+        args.max_latency_drift,
+        execution_time,
+        trace=not args.no_trace,
+        on_sample=lambda sample: print(_format_sample(sample)),
+    )
+
+    if report["top"]:
+        print("Allocations grown most after the warm-up:")
+        for line in report["top"]:
+            print("  {}".format(line))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for failure in report["failures"]:
+        print("FAIL: {}".format(failure))
+    if report["failures"]:
+        return 1
+    print("Passed, {} items in {:.0f} s".format(report["items"], report["seconds"]))
+    return 0
@@ -0,0 +1,232 @@
+"""Sources of the frames of job items.
+
+:func:`mmec_fab.run_job` takes the frames of each workflow item from a
+source. A :class:`JsonSource` reads them from run data. A
+:class:`PatternSource` computes them from a procedural description, a grid,
+points spaced along a polyline or a rule per layer, and yields them one item
+at a time, so memory use and start-up time don't grow with the size of the
+job::
+
+    # Three picks and places 100 mm apart, like examples/pp_frames.json
+    source = PatternSource(
+        "pick_place",
+        grid_points((500, 500, 0), (3, 1), (100, 0)),
+        {
+            "pick_frames": ((0, 0, 0), (0, 1, 0), (1, 0, 0)),
+            "place_frames": ((0, 100, 0), (0, 1, 0), (1, 0, 0)),
+        },
+    )
+    with RobotClient() as client:
+        run_job(client, source, "pick_place")
+
+Point generators are passed as functions returning a new iterator, so a
+source can be run more than once.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+
+from compas import json_load
+from compas.geometry import Frame
+
+from mmec_fab.jobs import WORKFLOWS
+from mmec_fab.jobs import job_items
+
+__all__ = [
+    "JsonSource",
+    "PatternSource",
+    "ChainedSource",
+    "as_source",
+    "grid_points",
+    "polyline_points",
+    "layered_points",
+]
+
+
+class JsonSource(object):
+    """Frames of run data, as written by Grasshopper or
+    :func:`mmec_fab.write_run_data`.
+
+    Parameters
+    ----------
+    data : :obj:`dict` or :obj:`str`
+        Run data or path to a run data file.
+    """
+
+    def __init__(self, data):
+        if not isinstance(data, dict):
+            data = json_load(data)
+        self.data = data
+
+    def items(self, workflow):
+        """Yield the frames of each item of a workflow, in the order of the
+        workflow's arguments, see :data:`mmec_fab.WORKFLOWS`."""
+        return iter(job_items(self.data, workflow))
+
+
+class PatternSource(object):
+    """Frames of the items of a workflow computed from points.
+
+    Parameters
+    ----------
+    workflow : :obj:`str`
+        A key of :data:`mmec_fab.WORKFLOWS`.
+    points : callable
+        Returns an iterator over one point per item, e.g. :func:`grid_points`.
+    frames : :obj:`dict`
+        Per run data key of the workflow, the frame relative to the item's
+        point, either a tuple of offset, x axis and y axis, or a function
+        called with the point and the item index returning a frame.
+    """
+
+    def __init__(self, workflow, points, frames):
+        missing = [key for key in WORKFLOWS[workflow] if key not in frames]
+        if missing:
+            raise ValueError(
+                "No frames given for {} of {}".format(", ".join(missing), workflow)
+            )
+
+        self.workflow = workflow
+        self.points = points
+        self.frames = frames
+
+    def items(self, workflow):
+        """Yield the frames of each item of a workflow, in the order of the
+        workflow's arguments, see :data:`mmec_fab.WORKFLOWS`."""
+        if workflow != self.workflow:
+            return
+        templates = [self.frames[key] for key in WORKFLOWS[workflow]]
+
+        for index, point in enumerate(self.points()):
+            yield tuple(_frame(template, point, index) for template in templates)
+
+
+def _frame(template, point, index):
+    if callable(template):
+        return template(point, index)
+
+    offset, xaxis, yaxis = template
+    return Frame([p + o for p, o in zip(point, offset)], xaxis, yaxis)
+
+
+class ChainedSource(object):
+    """Items of several sources, e.g. one per workflow of a job.
+
+    Parameters
+    ----------
+    sources : :obj:`list`
+        Sources, their items of a workflow are yielded in turn.
+    """
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    def items(self, workflow):
+        for source in self.sources:
+            for frames in source.items(workflow):
+                yield frames
+
+
+def as_source(data):
+    """Return a source for run data, a run data file, a list of sources or a
+    source."""
+    if isinstance(data, (list, tuple)):
+        return ChainedSource([as_source(source) for source in data])
+    if hasattr(data, "items") and not isinstance(data, dict):
+        return data
+    return JsonSource(data)
+
+
+def grid_points(origin, counts, spacing):
+    """Points of a regular grid, the first axis varying fastest.
+
+    Parameters
+    ----------
+    origin : :obj:`list` of :obj:`float`
+        First point.
+    counts : :obj:`tuple` of :obj:`int`
+        Number of points along x, y and optionally z.
+    spacing : :obj:`tuple` of :obj:`float`
+        Distance between points along the same axes.
+
+    Returns
+    -------
+    callable
+        Returns a new iterator over the points.
+    """
+    counts = list(counts) + [1] * (3 - len(counts))
+    spacing = list(spacing) + [0.0] * (3 - len(spacing))
+
+    def points():
+        for k in range(counts[2]):
+            for j in range(counts[1]):
+                for i in range(counts[0]):
+                    yield [
+                        origin[0] + i * spacing[0],
+                        origin[1] + j * spacing[1],
+                        origin[2] + k * spacing[2],
+                    ]
+
+    return points
+
+
+def _polyline(vertices, spacing):
+    # Points every spacing along a polyline, starting at its first vertex
+    travelled = 0.0
+    start = vertices[0]
+    yield list(start)
+
+    for end in vertices[1:]:
+        length = math.sqrt(sum((b - a) ** 2 for a, b in zip(start, end)))
+        if not length:
+            continue
+        position = spacing - travelled
+        while position <= length + 1e-9:
+            t = position / length
+            yield [a + t * (b - a) for a, b in zip(start, end)]
+            position += spacing
+        travelled = length - (position - spacing)
+        start = end
+
+
+def polyline_points(vertices, spacing):
+    """Points every ``spacing`` along a polyline, starting at its first vertex.
+
+    Returns
+    -------
+    callable
+        Returns a new iterator over the points.
+    """
+    return lambda: _polyline(vertices, spacing)
+
+
+def layered_points(rule, layers, height, axis=(0.0, 0.0, 1.0)):
+    """Points of stacked layers, e.g. the rows of nodes of a lattice.
+
+    Parameters
+    ----------
+    rule : callable
+        Called with the layer index, returns an iterable of the points of
+        the layer, e.g. ``polyline_points(vertices, spacing)()``.
+    layers : :obj:`int`
+        Number of layers.
+    height : :obj:`float`
+        Distance between layers along ``axis``.
+    axis : :obj:`list` of :obj:`float`, optional
+        Unit vector the layers are stacked along.
+
+    Returns
+    -------
+    callable
+        Returns a new iterator over the points.
+    """
+
+    def points():
+        for layer in range(layers):
+            shift = [layer * height * a for a in axis]
+            for point in rule(layer):
+                yield [p + s for p, s in zip(point, shift)]
+
+    return points
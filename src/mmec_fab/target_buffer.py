@@ -0,0 +1,414 @@
+"""Store the targets of a plan on the controller and move to them by index.
+
+Each move of a plan is sent as a full target, 15 float values and more for
+triggers. :func:`buffer_plan` instead stores all distinct targets of a plan
+on the controller once, at the start, and sends the moves as
+``r_A057_MoveSteps`` instructions of up to six moves referring to the targets
+by index. The client still sends each instruction, so phases, operator stops
+and prompts work as before::
+
+    plan = buffer_plan(prepare_job(path))
+    with RobotClient() as client:
+        client.run_plan(plan)
+
+Needs the custom instructions in ``00_robotcontrol/03_rapid/A057_TargetBuffer.mod``.
+Compare the messages sent per item::
+
+    cd 00_robotcontrol/02_run_data
+    python -m mmec_fab buffer 01_slice_making_aa-01-01.json
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+from compas_rrc import CustomInstruction
+from compas_rrc import FeedbackLevel
+from compas_rrc import SetWorkObject
+
+from mmec_fab.encoding import round_floats
+from mmec_fab.plan import Plan
+from mmec_fab.robot_client import MAX_FLOAT_VALUES
+from mmec_fab.robot_client import TRIGGER_INSTRUCTION
+from mmec_fab.robot_client import check_value_counts
+from mmec_fab.timeouts import FRAME_MOVES
+
+__all__ = ["StoreTargets", "MoveSteps", "buffer_plan", "message_volume"]
+
+STORE_INSTRUCTION = "r_A057_StoreTargets"
+STEPS_INSTRUCTION = "r_A057_MoveSteps"
+OUTPUT_INSTRUCTION = "r_RRC_SetDigital"
+
+# Size of the target array of the RAPID module
+MAX_TARGETS = 2000
+
+# Targets of 7 values after the first index and count, and moves of 5 values
+# after a header of 5, fit into the float values of an RRC instruction
+TARGETS_PER_STORE = (MAX_FLOAT_VALUES - 2) // 7
+MOVES_PER_STEP = 6
+
+# Instructions independent of the work object, sent without restoring it
+WOBJ_INDEPENDENT = (
+    "r_RRC_Noop",
+    "r_RRC_PrintText",
+    "r_RRC_Stop",
+    "r_RRC_SetDigital",
+    "r_RRC_SetAcceleration",
+    "r_RRC_SetMaxSpeed",
+    "r_RRC_SetTool",
+    "r_RRC_WaitTime",
+    "r_RRC_MoveToJoints",
+)
+
+
+class StoreTargets(CustomInstruction):
+    """Store targets on the controller.
+
+    Parameters
+    ----------
+    first : :obj:`int`
+        Index of the first target, from 1.
+    poses : :obj:`list`
+        Up to four targets, each the position and orientation quaternion as
+        7 float values.
+    """
+
+    def __init__(self, first, poses, feedback_level=FeedbackLevel.NONE):
+        if len(poses) > TARGETS_PER_STORE:
+            raise ValueError("At most {} targets at once".format(TARGETS_PER_STORE))
+
+        float_values = [first, len(poses)]
+        for pose in poses:
+            float_values.extend(pose)
+        super(StoreTargets, self).__init__(
+            STORE_INSTRUCTION, [], float_values, feedback_level
+        )
+        check_value_counts(self)
+
+
+class MoveSteps(CustomInstruction):
+    """Move through targets stored with :class:`StoreTargets`.
+
+    Parameters
+    ----------
+    moves : :obj:`list` of :obj:`tuple`
+        Up to six moves, each the target index, speed in mm/s, zone (``-1``
+        for fine), whether the move is linear and the work object name.
+    trigger : :obj:`dict`, optional
+        Digital output set along one of the moves, with the ``move`` index
+        from 0, ``signal``, ``value``, ``distance`` and the ``mode``, ``0``
+        before the end, ``1`` from the start of the path or ``2`` for a time.
+    """
+
+    def __init__(self, moves, trigger=None, feedback_level=FeedbackLevel.NONE):
+        if len(moves) > MOVES_PER_STEP:
+            raise ValueError("At most {} moves at once".format(MOVES_PER_STEP))
+
+        wobjs = []
+        values = []
+        for index, speed, zone, linear, wobj in moves:
+            if wobj not in wobjs:
+                wobjs.append(wobj)
+            values.extend(
+                [index, speed, zone, 1 if linear else 0, wobjs.index(wobj) + 2]
+            )
+
+        if trigger is None:
+            header = [len(moves), 0, 0, 0, 0]
+            signal = ""
+        else:
+            header = [
+                len(moves),
+                trigger["move"] + 1,
+                trigger["distance"],
+                trigger["value"],
+                trigger["mode"],
+            ]
+            signal = trigger["signal"]
+
+        super(MoveSteps, self).__init__(
+            STEPS_INSTRUCTION, [signal] + wobjs, header + values, feedback_level
+        )
+        check_value_counts(self)
+
+
+def _pose_key(values):
+    return tuple(round(value, 6) for value in values[:7])
+
+
+def _trigger(msg, move):
+    if msg["instruction"] == OUTPUT_INSTRUCTION:
+        # At the start of the next move, the robot stands still before it
+        return {
+            "move": move,
+            "signal": msg["string_values"][0],
+            "value": msg["float_values"][0],
+            "distance": 0,
+            "mode": 1,
+        }
+
+    values = msg["float_values"]
+    mode = 2 if values[18] else (1 if values[17] else 0)
+    return {
+        "move": move,
+        "signal": msg["string_values"][1],
+        "value": values[16],
+        "distance": values[15],
+        "mode": mode,
+    }
+
+
+def buffer_plan(plan, first_index=1, max_targets=MAX_TARGETS):
+    """Send the moves of a plan as steps through targets stored beforehand.
+
+    Consecutive moves to frames of a phase, also with a trigger, and the
+    changes of work object between them are combined into steps of up to six
+    moves, with at most one trigger. A step ends with a waited move. Digital
+    outputs set while the robot stands still, e.g. the gripper after a fine
+    point, become the trigger at the start of the next move.
+
+    The controller reports a step, and starts the phase of its first move,
+    once it has issued all its moves. Buffer a plan after other changes to
+    it, e.g. :func:`mmec_fab.apply_profile` or
+    :func:`mmec_fab.add_alert_outputs`.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    first_index : :obj:`int`, optional
+        Index of the first target in the controller's array.
+    max_targets : :obj:`int`, optional
+        Size of the controller's array.
+
+    Returns
+    -------
+    :class:`mmec_fab.Plan`
+        Plan storing the targets after its first instruction. Steps keep the
+        instructions they replace in ``moves``.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the plan has more distinct targets than fit on the controller.
+    """
+    targets = {}
+    for step in plan.steps:
+        if step.get("msg", {}).get("instruction") in FRAME_MOVES:
+            key = _pose_key(step["msg"]["float_values"])
+            targets.setdefault(key, first_index + len(targets))
+
+    if first_index + len(targets) - 1 > max_targets:
+        raise ValueError(
+            "{} targets don't fit on the controller, at most {}".format(
+                len(targets), max_targets - first_index + 1
+            )
+        )
+
+    steps = []
+    group = []
+    # Work object set on the controller, the one of the plan at this point and
+    # at the start of the group of moves
+    state = {"sent": "wobj0", "wobj": "wobj0", "start": "wobj0", "stopped": True}
+
+    def close():
+        moves = [s for s in group if s["msg"]["instruction"] in FRAME_MOVES]
+        if not moves:
+            steps.extend(group)
+            if group:
+                state["sent"] = state["wobj"]
+            del group[:]
+            return
+
+        # Outputs after the last move have no move to trigger with
+        last = group.index(moves[-1]) + 1
+        tail = group[last:]
+        del group[last:]
+
+        values = []
+        trigger = None
+        wobj = state["start"]
+        for step in group:
+            msg = step["msg"]
+            if msg["instruction"] == "r_RRC_SetWorkObject":
+                wobj = msg["string_values"][0]
+                continue
+            if msg["instruction"] in (TRIGGER_INSTRUCTION, OUTPUT_INSTRUCTION):
+                trigger = _trigger(msg, len(values))
+            if msg["instruction"] == OUTPUT_INSTRUCTION:
+                continue
+            floats = msg["float_values"]
+            values.append(
+                (
+                    targets[_pose_key(floats)],
+                    floats[13],
+                    floats[14],
+                    msg["string_values"][0] == "FrameL",
+                    wobj,
+                )
+            )
+
+        level = max(s["msg"]["feedback_level"] for s in moves)
+        step = {
+            "item": group[0]["item"],
+            "phase": group[0]["phase"],
+            "msg": MoveSteps(values, trigger, level).msg,
+            "wait": group[-1]["wait"],
+            "moves": [s["msg"] for s in group],
+        }
+        if group[0].get("new_phase"):
+            step["new_phase"] = True
+        if group[-1].get("timeout") is not None:
+            step["timeout"] = group[-1]["timeout"]
+        steps.append(step)
+        steps.extend(tail)
+        del group[:]
+
+    def restore_wobj(step):
+        # Instructions other than steps use the work object set last
+        if state["wobj"] != state["sent"]:
+            msg = SetWorkObject(state["wobj"]).msg
+            steps.append(dict(_place(step), msg=msg, wait=False))
+            if step.get("new_phase"):
+                steps[-1]["new_phase"] = True
+                step = dict(step)
+                del step["new_phase"]
+            state["sent"] = state["wobj"]
+        return step
+
+    for step in plan.steps:
+        name = step.get("msg", {}).get("instruction")
+        joins = name in FRAME_MOVES or (
+            name in ("r_RRC_SetWorkObject", OUTPUT_INSTRUCTION) and not step["wait"]
+        )
+        if name == OUTPUT_INSTRUCTION and not state["stopped"]:
+            joins = False
+
+        if name in FRAME_MOVES:
+            state["stopped"] = step["msg"]["float_values"][14] < 0
+        elif name in ("r_RRC_Stop", "r_RRC_WaitTime"):
+            state["stopped"] = True
+        elif name in ("r_RRC_MoveToJoints", "r_RRC_MoveToRobtarget"):
+            state["stopped"] = False
+
+        if group and (
+            not joins
+            or step.get("new_phase")
+            or step["item"] != group[0]["item"]
+            or _full(group, name)
+        ):
+            close()
+
+        if joins:
+            if not group:
+                state["start"] = state["wobj"]
+            if name == "r_RRC_SetWorkObject":
+                state["wobj"] = step["msg"]["string_values"][0]
+            group.append(step)
+            if step["wait"]:
+                close()
+            continue
+
+        if name == "r_RRC_SetWorkObject":
+            state["wobj"] = state["sent"] = step["msg"]["string_values"][0]
+        elif name is not None and name not in WOBJ_INDEPENDENT:
+            step = restore_wobj(step)
+        steps.append(step)
+
+    close()
+    if plan.steps:
+        restore_wobj(plan.steps[-1])
+
+    # Store the targets once the controller has answered the first step
+    poses = [list(key) for key, _ in sorted(targets.items(), key=lambda t: t[1])]
+    store = []
+    for start in range(0, len(poses), TARGETS_PER_STORE):
+        msg = StoreTargets(
+            first_index + start, poses[start : start + TARGETS_PER_STORE]
+        )
+        store.append(dict(_place(steps[0]), msg=msg.msg, wait=False))
+    steps[1:1] = store
+
+    job = dict(plan.job, target_buffer={"first": first_index, "targets": len(poses)})
+    return Plan(job, plan.items, steps)
+
+
+def _place(step):
+    return {"item": step["item"], "phase": step["phase"]}
+
+
+def _full(group, name):
+    # Whether a move or output doesn't fit into a step any more
+    names = [s["msg"]["instruction"] for s in group]
+    moves = sum(1 for n in names if n in FRAME_MOVES)
+    triggers = (TRIGGER_INSTRUCTION, OUTPUT_INSTRUCTION)
+    if name in FRAME_MOVES + (OUTPUT_INSTRUCTION,) and moves == MOVES_PER_STEP:
+        return True
+    return name in triggers and any(n in triggers for n in names)
+
+
+def message_volume(plan, float_precision=6):
+    """Count the instructions of a plan and their size as sent.
+
+    Returns
+    -------
+    :obj:`dict`
+        Per item index, ``-1`` outside of items, the number of ``messages``
+        and their JSON ``bytes`` with the float values rounded as the client
+        sends them.
+    """
+    volume = {}
+    for step in plan.steps:
+        msg = step.get("msg")
+        if not msg:
+            continue
+        msg = dict(msg, float_values=round_floats(msg["float_values"], float_precision))
+        counts = volume.setdefault(step["item"], {"messages": 0, "bytes": 0})
+        counts["messages"] += 1
+        counts["bytes"] += len(json.dumps(msg, separators=(",", ":")))
+    return volume
+
+
+def main(argv=None):
+    import argparse
+
+    from mmec_fab.plan import prepare_job
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab buffer", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("path", help="run data file")
+    parser.add_argument("--job", help="job of the file")
+    parser.add_argument(
+        "--first", type=int, default=1, help="index of the first target to store"
+    )
+    args = parser.parse_args(argv)
+
+    plan = prepare_job(args.path, args.job)
+    buffered = buffer_plan(plan, args.first)
+    before = message_volume(plan)
+    after = message_volume(buffered)
+    items = [item for item in sorted(before) if item >= 0] or [0]
+
+    def per_item(volume, key):
+        return sum(volume.get(item, {}).get(key, 0) for item in items) / len(items)
+
+    row = "{:<12} {:>10} {:>10}"
+    print(row.format("per item", "messages", "bytes"))
+    for label, volume in (("full", before), ("buffered", after)):
+        print(
+            row.format(
+                label,
+                "{:.1f}".format(per_item(volume, "messages")),
+                "{:.0f}".format(per_item(volume, "bytes")),
+            )
+        )
+    setup = after.get(-1, {"messages": 0, "bytes": 0})
+    print(
+        "{} targets stored, {} messages and {} bytes outside of items".format(
+            buffered.job["target_buffer"]["targets"],
+            setup["messages"],
+            setup["bytes"],
+        )
+    )
+    return 0
@@ -0,0 +1,351 @@
+"""Record the robot state stream during a job.
+
+The driver publishes the robot state it receives on ``robot_state_port``
+(see ``docker/*/docker-compose.yaml``) as ROS joint states. Samples are kept in
+a fixed size ring buffer and flushed periodically to a columnar file, tagged
+with the item index and phase the controller is executing.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import struct
+import sys
+import threading
+import time
+from array import array
+
+import roslibpy
+
+from mmec_fab.robot_client import PHASES
+
+__all__ = [
+    "RingBuffer",
+    "ColumnarWriter",
+    "read_columnar",
+    "TelemetryRecorder",
+    "read_telemetry",
+    "segment_times",
+]
+
+FILE_MAGIC = b"MMECCOL1"
+
+TELEMETRY_COLUMNS = [
+    ("time", "d"),
+    ("item", "i"),
+    ("phase", "b"),
+    ("j1", "f"),
+    ("j2", "f"),
+    ("j3", "f"),
+    ("j4", "f"),
+    ("j5", "f"),
+    ("j6", "f"),
+]
+
+
+def _array_to_bytes(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    if sys.version_info[0] < 3:
+        return values.tostring()
+    return values.tobytes()
+
+
+def _array_from_bytes(typecode, raw):
+    values = array(typecode)
+    if sys.version_info[0] < 3:
+        values.fromstring(raw)
+    else:
+        values.frombytes(raw)
+
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class RingBuffer(object):
+    """Fixed size, preallocated column store.
+
+    When full, new rows overwrite the oldest ones and are counted in
+    :attr:`dropped`, so memory use never grows.
+
+    Parameters
+    ----------
+    columns : :obj:`list` of :obj:`tuple`
+        Pairs of column name and :mod:`array` typecode.
+    capacity : :obj:`int`
+        Number of rows to preallocate.
+    """
+
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.dropped = 0
+
+        self._data = [array(code, [0]) * capacity for _, code in self.columns]
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        """Add a row, a sequence with one value per column."""
+        with self._lock:
+            index = (self._start + self._count) % self.capacity
+            for column, value in zip(self._data, row):
+                column[index] = value
+
+            if self._count < self.capacity:
+                self._count += 1
+            else:
+                self._start = (self._start + 1) % self.capacity
+                self.dropped += 1
+
+    def drain(self):
+        """Remove all rows and return them as one array per column."""
+        with self._lock:
+            start, count = self._start, self._count
+            end = start + count
+
+            if end <= self.capacity:
+                result = [column[start:end] for column in self._data]
+            else:
+                end -= self.capacity
+                result = [column[start:] + column[:end] for column in self._data]
+
+            self._start = 0
+            self._count = 0
+
+        return result
+
+
+class ColumnarWriter(object):
+    """Append-only columnar file.
+
+    The file starts with a JSON header describing the columns, followed by
+    chunks of rows. Each chunk is a row count followed by the little-endian
+    values of each column in turn.
+
+    Parameters
+    ----------
+    path : :obj:`str`
+        File to create.
+    columns : :obj:`list` of :obj:`tuple`
+        Pairs of column name and :mod:`array` typecode.
+    metadata : :obj:`dict`, optional
+        Extra JSON serializable values stored in the header.
+    """
+
+    def __init__(self, path, columns, metadata=None):
+        self.columns = list(columns)
+        self.rows = 0
+
+        header = {"columns": self.columns, "metadata": metadata or {}}
+        header = json.dumps(header).encode("utf-8")
+
+        self._file = open(path, "wb")
+        self._file.write(FILE_MAGIC)
+        self._file.write(struct.pack("<I", len(header)))
+        self._file.write(header)
+
+    def write(self, data):
+        """Append a chunk, given as one array per column."""
+        count = len(data[0])
+        if not count:
+            return
+
+        self._file.write(struct.pack("<I", count))
+        for column in data:
+            self._file.write(_array_to_bytes(column))
+
+        self._file.flush()
+        self.rows += count
+
+    def close(self):
+        self._file.close()
+
+
+def read_columnar(path):
+    """Read a file written by :class:`ColumnarWriter`.
+
+    Returns
+    -------
+    :obj:`tuple`
+        Dictionary of column name to :class:`array.array`, and the header
+        metadata.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError("Not a columnar file: {}".format(path))
+
+        (size,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(size).decode("utf-8"))
+        columns = [(name, str(code)) for name, code in header["columns"]]
+        data = [array(code) for _, code in columns]
+
+        while True:
+            count = f.read(4)
+            if len(count) < 4:
+                break
+            (count,) = struct.unpack("<I", count)
+
+            for column in data:
+                raw = f.read(count * column.itemsize)
+                column.extend(_array_from_bytes(column.typecode, raw))
+
+    return dict(zip([name for name, _ in columns], data)), header["metadata"]
+
+
+class TelemetryRecorder(object):
+    """Record joint states from the driver while a job runs.
+
+    Phase changes reported by the client are used to annotate samples, see
+    :meth:`mmec_fab.RobotClient.set_phase`. Use as a context manager around
+    the job::
+
+        with RobotClient() as client:
+            with TelemetryRecorder(client, "rolling_left.tel"):
+                client.preroll()
+                ...
+
+    Parameters
+    ----------
+    client : :class:`mmec_fab.RobotClient`
+        Connected client.
+    path : :obj:`str`
+        Output file.
+    capacity : :obj:`int`, optional
+        Number of samples kept in memory between flushes.
+    flush_interval : :obj:`float`, optional
+        Seconds between flushes to disk.
+    topic : :obj:`str`, optional
+        Joint state topic published by the driver.
+    """
+
+    def __init__(
+        self,
+        client,
+        path,
+        capacity=4096,
+        flush_interval=1.0,
+        topic="/joint_states",
+    ):
+        self.client = client
+        self.path = path
+        self.flush_interval = flush_interval
+        self.buffer = RingBuffer(TELEMETRY_COLUMNS, capacity)
+
+        self._topic = roslibpy.Topic(client.ros, topic, "sensor_msgs/JointState")
+        self._item = -1
+        self._phase = -1
+        self._writer = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def dropped(self):
+        """Samples lost because the buffer was full before a flush."""
+        return self.buffer.dropped
+
+    def start(self):
+        """Subscribe to the robot state and start flushing to disk."""
+        self._writer = ColumnarWriter(
+            self.path, TELEMETRY_COLUMNS, metadata={"phases": list(PHASES)}
+        )
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.client.add_listener(self)
+        self._topic.subscribe(self._on_state)
+
+    def stop(self):
+        """Unsubscribe and write remaining samples."""
+        self._topic.unsubscribe()
+        self.client.remove_listener(self)
+
+        self._stop.set()
+        self._thread.join()
+        self._writer.write(self.buffer.drain())
+        self._writer.close()
+
+    def phase_started(self, marker):
+        self._item = marker.item_index
+        self._phase = PHASES.index(marker.phase)
+
+    def _on_state(self, message):
+        position = message["position"]
+        if len(position) < 6:
+            return
+
+        self.buffer.append(
+            [time.time(), self._item, self._phase] + list(position[:6])
+        )
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self._writer.write(self.buffer.drain())
+
+
+def read_telemetry(path):
+    """Read a telemetry file into columns.
+
+    Returns
+    -------
+    :obj:`dict`
+        Column name to :class:`array.array`, plus ``"phases"`` with the phase
+        names the ``phase`` column indexes into.
+    """
+    data, metadata = read_columnar(path)
+    data["phases"] = metadata["phases"]
+    return data
+
+
+def segment_times(data):
+    """Measure the time spent in each item and phase.
+
+    Parameters
+    ----------
+    data : :obj:`dict`
+        As returned by :func:`read_telemetry`.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`dict`
+        One entry per consecutive run of samples with the same item and phase,
+        with keys ``item``, ``phase``, ``start``, ``end`` and ``duration``.
+    """
+    times, items, phases = data["time"], data["item"], data["phase"]
+    segments = []
+
+    start = 0
+    for i in range(1, len(times) + 1):
+        if i < len(times) and items[i] == items[start] and phases[i] == phases[start]:
+            continue
+
+        if phases[start] >= 0:
+            segments.append(
+                {
+                    "item": items[start],
+                    "phase": data["phases"][phases[start]],
+                    "start": times[start],
+                    "end": times[i - 1],
+                    "duration": times[i - 1] - times[start],
+                }
+            )
+        start = i
+
+    return segments
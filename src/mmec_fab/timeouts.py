@@ -0,0 +1,394 @@
+"""Timeouts of waited instructions from the motions queued before them.
+
+The controller executes instructions in order, so an instruction is done
+once the motions sent before it and its own are. :class:`AdaptiveTimeouts`
+follows the instructions sent by a :class:`mmec_fab.RobotClient`, predicts
+when each is done from the lengths and speeds of the moves, and learns from
+the feedback how late the controller usually reports compared with the
+prediction. A waited instruction times out ``margin`` seconds after its
+predicted completion, instead of after a fixed worst-case time.
+
+Motions take longer in proportion when the speed override is lowered on the
+pendant, so the prediction is also scaled by the ``slowdown`` of the recent
+motions, the ratio of their time to the predicted one.
+
+Predictions start again from every feedback, so a long queue doesn't add up
+errors. While an operator stop is queued ahead of a waited instruction there
+is no timeout, the robot waits for the operator.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import threading
+import time
+from collections import deque
+
+import compas_rrc
+
+from mmec_fab.utils import median
+
+__all__ = ["MotionEstimator", "AdaptiveTimeouts"]
+
+# Instructions moving to a frame, with the speed at index 13
+FRAME_MOVES = ("r_RRC_MoveTo", "r_A057_MoveToTrigg")
+
+# Instructions moving without a known length
+OTHER_MOVES = ("r_RRC_MoveToJoints", "r_RRC_MoveToRobtarget")
+
+# Stop keeping a jogged position on restart, see mmec_fab.measure_points
+STOP_NO_REGAIN = "r_A057_StopNoRegain"
+
+# Instructions waiting for the operator to press play
+OPERATOR_STOPS = ("r_RRC_Stop", STOP_NO_REGAIN)
+
+# Instructions of the controller-side target buffer, see mmec_fab.buffer_plan
+STORE_TARGETS = "r_A057_StoreTargets"
+MOVE_STEPS = "r_A057_MoveSteps"
+
+# Time for a change of work object when their relative position is unknown,
+# in seconds
+STATION_TRANSITION = 2.0
+
+
+class MotionEstimator(object):
+    """Estimate how long the controller takes to execute instructions.
+
+    Instructions are passed in the order the controller executes them, to
+    follow the work object, the TCP speed cap, the position and the targets
+    stored with ``r_A057_StoreTargets``. A move to a frame takes its length at
+    the commanded speed, capped by the last ``SetMaxSpeed``. Moves of unknown
+    length, i.e. joint moves and the first move in a work object, take
+    ``unknown_move`` seconds.
+
+    Parameters
+    ----------
+    tcp_max_speed : :obj:`float`, optional
+        TCP speed cap in mm/s until an instruction sets another one.
+    unknown_move : :obj:`float`, optional
+        Seconds for a move of unknown length.
+
+    Attributes
+    ----------
+    tcp_max_speed : :obj:`float`
+        TCP speed cap in effect.
+    wobj : :obj:`str`
+        Work object in effect.
+    position : :obj:`tuple`
+        Work object and position of the last move, ``None`` if unknown.
+    """
+
+    def __init__(self, tcp_max_speed=250.0, unknown_move=30.0):
+        self.tcp_max_speed = tcp_max_speed
+        self.unknown_move = unknown_move
+        self.wobj = "wobj0"
+        self.position = None
+        self._targets = {}
+
+    def moves(self, msg):
+        """Follow an instruction and yield its moves.
+
+        Parameters
+        ----------
+        msg : :obj:`dict`
+            Instruction message, see :attr:`mmec_fab.Plan.steps`.
+
+        Yields
+        ------
+        :obj:`tuple`
+            Work object, distance in mm or ``None`` if unknown, and the
+            commanded speed in mm/s or ``None`` for joint moves.
+        """
+        name = msg["instruction"]
+        values = msg.get("float_values") or []
+        strings = msg.get("string_values") or []
+
+        if name == "r_RRC_SetMaxSpeed":
+            self.tcp_max_speed = values[1]
+        elif name == "r_RRC_SetWorkObject":
+            self.wobj = strings[0]
+        elif name in OTHER_MOVES:
+            self.position = None
+            yield self.wobj, None, None
+        elif name in FRAME_MOVES:
+            yield self._move(self.wobj, values[:3], values[13])
+        elif name == STORE_TARGETS:
+            for i in range(int(values[1])):
+                self._targets[int(values[0]) + i] = values[2 + 7 * i : 5 + 7 * i]
+        elif name == MOVE_STEPS:
+            for i in range(int(values[0])):
+                # Steps name the work object of each move
+                index, speed, _, _, slot = values[5 + 5 * i : 10 + 5 * i]
+                wobj = strings[int(slot) - 1]
+                position = self._targets.get(int(index))
+                if position is None:
+                    self.position = None
+                    yield wobj, None, speed
+                else:
+                    yield self._move(wobj, position, speed)
+
+    def _move(self, wobj, position, speed):
+        previous, self.position = self.position, (wobj, position)
+        if previous is None or previous[0] != wobj:
+            return wobj, None, speed
+        distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(previous[1], position)))
+        return wobj, distance, speed
+
+    def duration(self, msg):
+        """Follow an instruction and estimate its execution time.
+
+        Parameters
+        ----------
+        msg : :obj:`dict`
+            Instruction message, see :attr:`mmec_fab.Plan.steps`.
+
+        Returns
+        -------
+        :obj:`tuple`
+            Seconds, ``None`` for an operator stop, and whether that is only
+            a bound because of moves of unknown length.
+        """
+        name = msg["instruction"]
+        if name in OPERATOR_STOPS:
+            return None, False
+        if name == "r_RRC_WaitTime":
+            return msg["float_values"][0], False
+
+        seconds, bound = 0.0, False
+        for _, distance, speed in self.moves(msg):
+            if distance is None:
+                seconds, bound = seconds + self.unknown_move, True
+            else:
+                seconds += distance / min(speed, self.tcp_max_speed)
+        return seconds, bound
+
+    def step_duration(self, step):
+        """Follow a plan step and estimate its execution time without stops.
+
+        Steps through stored targets, see :func:`mmec_fab.buffer_plan`, are
+        estimated from the moves they replace.
+
+        Returns
+        -------
+        :obj:`float`
+            Seconds.
+        """
+        seconds = 0.0
+        for msg in step.get("moves") or [step.get("msg")]:
+            if msg:
+                seconds += self.duration(msg)[0] or 0.0
+        return seconds
+
+
+class AdaptiveTimeouts(object):
+    """Predict when instructions are done and time out waits for them.
+
+    Add it as a listener of a client, see
+    :meth:`mmec_fab.RobotClient.add_listener`. The client does so by default.
+
+    Parameters
+    ----------
+    initial_margin : :obj:`float`, optional
+        Seconds allowed after the predicted completion until enough feedback
+        has been received to learn the margin.
+    unknown_move : :obj:`float`, optional
+        Seconds allowed for a move whose length is unknown, i.e. a joint move
+        or a move between work objects.
+    tcp_max_speed : :obj:`float`, optional
+        TCP speed cap in mm/s until the client sets another one.
+    tolerance : :obj:`float`, optional
+        Share of the predicted time allowed in addition to the margin, for
+        accelerating and braking.
+    min_margin : :obj:`float`, optional
+        Smallest margin in seconds.
+    window : :obj:`int`, optional
+        Number of recent feedback delays the margin is learned from.
+    min_samples : :obj:`int`, optional
+        Number of feedback delays needed to use the learned margin, and
+        number of recent motions the slowdown is learned from.
+    min_span : :obj:`float`, optional
+        Shortest predicted motion in seconds to learn the slowdown from.
+
+    Attributes
+    ----------
+    delays : :class:`collections.deque`
+        Recent delays of feedback after the scaled predicted completion in
+        seconds, negative if the feedback came early.
+    ratios : :class:`collections.deque`
+        Time of recent motions over their predicted time.
+    """
+
+    def __init__(
+        self,
+        initial_margin=10.0,
+        unknown_move=30.0,
+        tcp_max_speed=250.0,
+        tolerance=0.2,
+        min_margin=1.0,
+        window=100,
+        min_samples=5,
+        min_span=1.0,
+    ):
+        self.initial_margin = initial_margin
+        self.unknown_move = unknown_move
+        self.tcp_max_speed = tcp_max_speed
+        self.tolerance = tolerance
+        self.min_margin = min_margin
+        self.min_samples = min_samples
+        self.min_span = min_span
+        self.delays = deque(maxlen=window)
+        self.ratios = deque(maxlen=min_samples)
+
+        self._lock = threading.Lock()
+        self._queue = []
+        self._motion = MotionEstimator(tcp_max_speed, unknown_move)
+
+    @property
+    def margin(self):
+        """Seconds allowed after the predicted completion of an instruction.
+
+        Mean plus three standard deviations of the recent feedback delays,
+        at least ``min_margin``.
+        """
+        with self._lock:
+            delays = list(self.delays)
+
+        if len(delays) < self.min_samples:
+            return self.initial_margin
+
+        mean = sum(delays) / len(delays)
+        deviation = math.sqrt(sum((d - mean) ** 2 for d in delays) / len(delays))
+        return max(mean + 3 * deviation, self.min_margin)
+
+    @property
+    def slowdown(self):
+        """Factor applied to the predicted motion times.
+
+        Median of the recent ratios of motion time to predicted time, at
+        least ``1``. Few motions are used, so it follows changes of the
+        speed override quickly.
+        """
+        with self._lock:
+            ratios = list(self.ratios)
+        return max(median(ratios) or 1.0, 1.0)
+
+    def _scaled_end(self, entry, slowdown):
+        # Predictions start at end - span, the motions take slowdown times
+        # longer
+        return entry["end"] + (slowdown - 1) * entry["span"]
+
+    @property
+    def pending(self):
+        """Number of instructions sent and followed without feedback yet."""
+        with self._lock:
+            return len(self._queue)
+
+    def _predict(self, start, entries):
+        # Predicted completion of queued entries executed from a start time
+        end = start
+        span = 0.0
+        bound = False
+        for entry in entries:
+            if entry["duration"] is None:
+                end = None
+            elif end is not None:
+                end += entry["duration"]
+                span += entry["duration"]
+                bound = bound or entry["unknown"]
+            entry["end"] = end
+            entry["span"] = span
+            entry["bound"] = bound
+
+    def instruction_sent(self, instruction):
+        now = time.time()
+        with self._lock:
+            duration, bound = self._motion.duration(instruction.msg)
+            entry = {
+                "id": instruction.sequence_id,
+                "duration": duration,
+                "unknown": bound,
+                "bound": bound,
+                "end": None,
+                "span": 0.0,
+            }
+            previous = self._queue[-1] if self._queue else None
+            if previous is None:
+                self._predict(now, [entry])
+            elif previous["end"] is not None and duration is not None:
+                # Starts when the instructions before it are done
+                entry["end"] = max(previous["end"], now) + duration
+                entry["span"] = previous["span"] + duration
+                entry["bound"] = previous["bound"] or bound
+            self._queue.append(entry)
+
+    def feedback_received(self, message):
+        now = time.time()
+        done = message["feedback_id"]
+        slowdown = self.slowdown
+
+        with self._lock:
+            # Instructions are done in send order, the ones before the
+            # reported one too. Ids wrap, so compare for equality only
+            for position, entry in enumerate(self._queue):
+                if entry["id"] == done:
+                    break
+            else:
+                return
+            self._queue = self._queue[position + 1 :]
+
+            if entry["end"] is not None and not entry["bound"]:
+                self.delays.append(now - self._scaled_end(entry, slowdown))
+                if entry["span"] >= self.min_span:
+                    start = entry["end"] - entry["span"]
+                    self.ratios.append((now - start) / entry["span"])
+
+            # Predict the rest from the actual completion
+            self._predict(now, self._queue)
+
+    def deadline(self, sequence_id):
+        """Time by which an instruction should be done.
+
+        Returns
+        -------
+        :obj:`float`
+            Seconds since the epoch, ``None`` while an operator stop is
+            queued before the instruction or the instruction isn't followed.
+        """
+        margin = self.margin
+        slowdown = self.slowdown
+        with self._lock:
+            for entry in self._queue:
+                if entry["id"] == sequence_id:
+                    break
+            else:
+                return None
+            if entry["end"] is None:
+                return None
+            span = slowdown * entry["span"]
+            return self._scaled_end(entry, slowdown) + self.tolerance * span + margin
+
+    def wait(self, future, sequence_id, poll=0.5):
+        """Wait for the result of an instruction until its deadline.
+
+        The deadline is checked again every ``poll`` seconds, as feedback of
+        earlier instructions moves it.
+
+        Raises
+        ------
+        :exc:`compas_rrc.TimeoutException`
+            If the instruction isn't done by its deadline.
+        """
+        while not future.done:
+            deadline = self.deadline(sequence_id)
+            now = time.time()
+            if deadline is not None and now > deadline:
+                raise compas_rrc.TimeoutException(
+                    "Timeout: instruction {} not done {:.1f} s after its "
+                    "predicted completion".format(sequence_id, self.margin)
+                )
+
+            timeout = poll if deadline is None else min(poll, deadline - now)
+            future.event.wait(max(timeout, 0.0))
+
+        return future.result()
@@ -0,0 +1,579 @@
+"""Tune speed and acceleration settings from recorded runs.
+
+The speeds of the jobs are set per workflow in :data:`mmec_fab.JOBS`, but the
+controller caps the TCP speed at ``TCP_MAX_SPEED`` and every move accelerates
+and brakes. :func:`analyze_speeds` compares the time the moves of each
+workflow phase would take at their commanded speed with the time recorded by
+a :class:`mmec_fab.TelemetryRecorder`, and finds what limits the phase:
+
+``speed``
+    The speed cap, the moves are commanded faster than ``TCP_MAX_SPEED``.
+``acceleration``
+    Accelerating and braking, the phase takes longer than its moves at full
+    speed, e.g. many short moves or fine points.
+``geometry``
+    The distance travelled, the phase takes about its commanded time.
+
+:func:`propose_profile` raises the speed cap and acceleration of the limited
+phases, up to the safety limits. By default these are the settings the client
+already uses, so raising them takes a file of limits checked for the cell. A
+profile saved with :func:`save_profile` is applied by
+:func:`mmec_fab.prepare_job` to the next runs of its job::
+
+    python -m mmec_fab tune propose 01_slice_making_aa-01-01.json run.tel
+    python -m mmec_fab tune propose ... --limits cell_limits.json
+    python -m mmec_fab tune apply slice_making.profile.json
+    python -m mmec_fab tune clear slice_making
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import time
+
+from mmec_fab.plan import Plan
+from mmec_fab.progress import STOP_PHASES
+from mmec_fab.robot_client import ACCEL
+from mmec_fab.robot_client import ACCEL_RAMP
+from mmec_fab.robot_client import SPEED_OVERRIDE
+from mmec_fab.robot_client import TCP_MAX_SPEED
+from mmec_fab.timeouts import STATION_TRANSITION
+from mmec_fab.timeouts import MotionEstimator
+from mmec_fab.utils import median
+
+__all__ = [
+    "DEFAULT_LIMITS",
+    "PROFILE_DIR",
+    "analyze_speeds",
+    "propose_profile",
+    "check_profile",
+    "apply_profile",
+    "profile_path",
+    "save_profile",
+    "load_profile",
+    "clear_profile",
+]
+
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".mmec_fab", "profiles")
+
+# Highest settings a profile may use, per phase in "phases". The settings of
+# RobotClient.pre, going faster needs limits given explicitly
+DEFAULT_LIMITS = {
+    "tcp_max_speed": TCP_MAX_SPEED,  # mm/s
+    "accel": ACCEL,  # %
+    "accel_ramp": ACCEL_RAMP,  # %
+    "phases": {},
+}
+
+# Acceleration settings are a percentage of the robot's nominal acceleration
+ACCEL_MAX = 100
+
+SETTINGS = ("tcp_max_speed", "accel", "accel_ramp")
+
+
+def _default_settings():
+    # Settings of the controller until the plan changes them, see
+    # RobotClient.pre
+    return {"tcp_max_speed": TCP_MAX_SPEED, "accel": ACCEL, "accel_ramp": ACCEL_RAMP}
+
+
+def _settings(steps):
+    # Speed cap and acceleration in effect after each step
+    settings = []
+    current = _default_settings()
+    for step in steps:
+        msg = step.get("msg")
+        if msg and msg["instruction"] == "r_RRC_SetMaxSpeed":
+            current = dict(current, tcp_max_speed=msg["float_values"][1])
+        elif msg and msg["instruction"] == "r_RRC_SetAcceleration":
+            values = msg["float_values"]
+            current = dict(current, accel=values[0], accel_ramp=values[1])
+        settings.append(current)
+    return settings
+
+
+def _phase_moves(plan):
+    # Moves of each item phase, with their commanded and capped times, in
+    # plan order
+    phases = {}
+    order = []
+    motion = MotionEstimator(TCP_MAX_SPEED, STATION_TRANSITION)
+
+    for step, setting in zip(plan.steps, _settings(plan.steps)):
+        for msg in step.get("moves") or [step.get("msg")]:
+            if not msg:
+                continue
+            for _, distance, speed in motion.moves(msg):
+                # Joint moves are left out, their speed isn't a TCP speed
+                if speed is None or step["item"] < 0:
+                    continue
+
+                key = (step["item"], step["phase"])
+                if key not in phases:
+                    order.append(key)
+                    phases[key] = {
+                        "moves": 0,
+                        "distance": 0.0,
+                        "commanded": 0.0,
+                        "capped": 0.0,
+                        "speed": 0.0,
+                        "setting": setting,
+                        "segments": [],
+                    }
+                phase = phases[key]
+                phase["moves"] += 1
+                phase["speed"] = max(phase["speed"], speed)
+
+                # Moves between work objects are estimated, their distance is
+                # unknown
+                if distance is None:
+                    phase["commanded"] += STATION_TRANSITION
+                    phase["capped"] += STATION_TRANSITION
+                    continue
+
+                phase["distance"] += distance
+                phase["segments"].append((distance, speed))
+                phase["commanded"] += distance / speed
+                phase["capped"] += distance / min(speed, motion.tcp_max_speed)
+
+    return [(key, phases[key]) for key in order]
+
+
+def analyze_speeds(plan, segments, tolerance=0.1):
+    """Find what limits the duration of each workflow phase of a plan.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+        Plan that was run, see :func:`mmec_fab.prepare_job`.
+    segments : :obj:`list` of :obj:`dict`
+        Time spent per item and phase in runs of the plan, see
+        :func:`mmec_fab.segment_times`.
+    tolerance : :obj:`float`, optional
+        Share of the achieved time a cap must cost to limit a phase.
+
+    Returns
+    -------
+    :obj:`list` of :obj:`dict`
+        Per workflow phase with moves, in plan order, the ``workflow``,
+        ``phase``, median ``moves``, ``distance`` in mm, the ``commanded``
+        time at the commanded speeds, the ``capped`` time at the speeds
+        allowed by the speed cap and the median ``achieved`` time, in
+        seconds. ``limit`` is ``"speed"``, ``"acceleration"``, ``"geometry"``
+        or ``None`` without recorded time. ``speed`` is the highest commanded
+        speed, ``setting`` the speed cap and acceleration in effect and
+        ``segments`` the length and speed of the moves of each item.
+    """
+    achieved = {}
+    for segment in segments:
+        key = (segment["item"], segment["phase"])
+        achieved[key] = achieved.get(key, 0.0) + segment["duration"]
+
+    groups = {}
+    order = []
+    for key, phase in _phase_moves(plan):
+        item, name = key
+        if name in STOP_PHASES:
+            continue
+        group_key = (plan.items[item]["workflow"], name)
+        if group_key not in groups:
+            groups[group_key] = []
+            order.append(group_key)
+        groups[group_key].append((phase, achieved.get(key)))
+
+    rows = []
+    for workflow, name in order:
+        phases = [phase for phase, _ in groups[(workflow, name)]]
+        times = [t for _, t in groups[(workflow, name)] if t is not None]
+        row = {
+            "workflow": workflow,
+            "phase": name,
+            "moves": median([p["moves"] for p in phases]),
+            "distance": median([p["distance"] for p in phases]),
+            "commanded": median([p["commanded"] for p in phases]),
+            "capped": median([p["capped"] for p in phases]),
+            "achieved": median(times) if times else None,
+            "speed": max(p["speed"] for p in phases),
+            "setting": phases[0]["setting"],
+            "segments": [p["segments"] for p in phases],
+            "limit": None,
+        }
+
+        if row["achieved"] is not None:
+            cap_loss = row["capped"] - row["commanded"]
+            overhead = row["achieved"] - row["capped"]
+            if cap_loss >= overhead and cap_loss > tolerance * row["achieved"]:
+                row["limit"] = "speed"
+            elif overhead > tolerance * row["achieved"]:
+                row["limit"] = "acceleration"
+            else:
+                row["limit"] = "geometry"
+        rows.append(row)
+
+    return rows
+
+
+def _phase_limits(limits, phase):
+    return dict(limits, **limits.get("phases", {}).get(phase, {}))
+
+
+def _capped_time(segments, speed_cap):
+    return sum(distance / min(speed, speed_cap) for distance, speed in segments)
+
+
+def propose_profile(plan, analysis, limits=None):
+    """Propose speed caps and accelerations per workflow phase.
+
+    Phases limited by the speed cap get it raised to their highest commanded
+    speed, phases limited by acceleration get the highest acceleration,
+    within the safety limits. Other phases keep the settings of the profile
+    the plan was run with, if any.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    analysis : :obj:`list` of :obj:`dict`
+        See :func:`analyze_speeds`.
+    limits : :obj:`dict`, optional
+        Highest ``tcp_max_speed`` in mm/s, ``accel`` and ``accel_ramp`` in %,
+        also per phase name in ``phases``. Defaults to :data:`DEFAULT_LIMITS`.
+
+    Returns
+    -------
+    :obj:`dict`
+        Profile with the ``job`` name, the ``limits``, and per workflow and
+        phase in ``phases`` the ``tcp_max_speed``, ``accel`` and
+        ``accel_ramp`` to use, the ``limit`` found and the estimated time
+        ``saved`` per item in seconds (``None`` if it can't be estimated).
+    """
+    limits = limits or DEFAULT_LIMITS
+    previous = plan.job.get("profile") or {}
+    phases = json.loads(json.dumps(previous.get("phases", {})))
+
+    for row in analysis:
+        if row["limit"] not in ("speed", "acceleration"):
+            continue
+
+        current = row["setting"]
+        allowed = _phase_limits(limits, row["phase"])
+        setting = dict((key, current[key]) for key in SETTINGS)
+        saved = None
+
+        if row["limit"] == "speed":
+            speed_cap = min(row["speed"], allowed["tcp_max_speed"])
+            if speed_cap <= current["tcp_max_speed"]:
+                continue
+            setting["tcp_max_speed"] = speed_cap
+            saved = median(
+                [
+                    _capped_time(segments, current["tcp_max_speed"])
+                    - _capped_time(segments, speed_cap)
+                    for segments in row["segments"]
+                ]
+            )
+        else:
+            accel = min(allowed["accel"], ACCEL_MAX)
+            ramp = min(allowed["accel_ramp"], ACCEL_MAX)
+            if accel <= current["accel"] and ramp <= current["accel_ramp"]:
+                continue
+            setting["accel"] = max(accel, current["accel"])
+            setting["accel_ramp"] = max(ramp, current["accel_ramp"])
+
+        setting.update(limit=row["limit"], saved=saved)
+        phases.setdefault(row["workflow"], {})[row["phase"]] = setting
+
+    return {
+        "job": plan.job["name"],
+        "created_at": time.time(),
+        "limits": limits,
+        "phases": phases,
+    }
+
+
+def _setting_steps(step, sent, wanted):
+    # Instructions changing the settings sent so far to the wanted ones
+    import compas_rrc
+
+    instructions = []
+    if wanted["accel"] != sent["accel"] or wanted["accel_ramp"] != sent["accel_ramp"]:
+        instructions.append(
+            compas_rrc.SetAcceleration(wanted["accel"], wanted["accel_ramp"])
+        )
+    if wanted["tcp_max_speed"] != sent["tcp_max_speed"]:
+        instructions.append(
+            compas_rrc.SetMaxSpeed(SPEED_OVERRIDE, wanted["tcp_max_speed"])
+        )
+
+    return [
+        {
+            "item": step["item"],
+            "phase": step["phase"],
+            "msg": instruction.msg,
+            "wait": False,
+        }
+        for instruction in instructions
+    ]
+
+
+def check_profile(profile):
+    """Check the settings of a profile against its limits.
+
+    The limits are the ``limits`` of the profile, :data:`DEFAULT_LIMITS` if
+    it has none. Accelerations are at most 100 % in any case.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If a setting of a phase is missing, not positive or above its limit.
+    """
+    limits = profile.get("limits") or DEFAULT_LIMITS
+    for workflow, settings in sorted(profile.get("phases", {}).items()):
+        for phase, setting in sorted(settings.items()):
+            allowed = _phase_limits(limits, phase)
+            for key in SETTINGS:
+                value = setting.get(key)
+                highest = allowed.get(key, DEFAULT_LIMITS[key])
+                if key != "tcp_max_speed":
+                    highest = min(highest, ACCEL_MAX)
+                if not isinstance(value, (int, float)) or not 0 < value <= highest:
+                    raise ValueError(
+                        "Profile of {} sets {} of {} {} to {}, the limit is {}".format(
+                            profile.get("job"), key, workflow, phase, value, highest
+                        )
+                    )
+
+
+def apply_profile(plan, profile):
+    """Set the speed cap and acceleration of a profile at each phase of a plan.
+
+    Phases not in the profile run with the settings of the plan.
+
+    Parameters
+    ----------
+    plan : :class:`mmec_fab.Plan`
+    profile : :obj:`dict`
+        See :func:`propose_profile`.
+
+    Returns
+    -------
+    :class:`mmec_fab.Plan`
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the profile is outside its limits, see :func:`check_profile`.
+    """
+    check_profile(profile)
+    planned = _settings(plan.steps)
+    sent = _default_settings()
+    phases = profile.get("phases", {})
+
+    steps = []
+    for index, step in enumerate(plan.steps):
+        if step.get("new_phase"):
+            wanted = planned[index - 1] if index else sent
+            if step["item"] >= 0:
+                workflow = plan.items[step["item"]]["workflow"]
+                wanted = phases.get(workflow, {}).get(step["phase"], wanted)
+
+            inserted = _setting_steps(step, sent, wanted)
+            if inserted:
+                # The phase starts with the first of its instructions
+                inserted[0]["new_phase"] = True
+                step = dict(step)
+                del step["new_phase"]
+                steps.extend(inserted)
+                sent = dict((key, wanted[key]) for key in SETTINGS)
+
+        msg = step.get("msg")
+        if msg and msg["instruction"] == "r_RRC_SetMaxSpeed":
+            sent = dict(sent, tcp_max_speed=msg["float_values"][1])
+        elif msg and msg["instruction"] == "r_RRC_SetAcceleration":
+            values = msg["float_values"]
+            sent = dict(sent, accel=values[0], accel_ramp=values[1])
+        steps.append(step)
+
+    job = dict(plan.job, profile=profile)
+    return Plan(job, plan.items, steps)
+
+
+def profile_path(job, directory=None):
+    """Path of the profile saved for a job, see :func:`save_profile`."""
+    return os.path.join(directory or PROFILE_DIR, "{}.json".format(job))
+
+
+def save_profile(profile, directory=None):
+    """Save a profile to use for the next runs of its job, return its path.
+
+    Parameters
+    ----------
+    profile : :obj:`dict`
+        See :func:`propose_profile`.
+    directory : :obj:`str`, optional
+        Defaults to :data:`PROFILE_DIR`.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the profile is outside its limits, see :func:`check_profile`.
+    """
+    check_profile(profile)
+    path = profile_path(profile["job"], directory)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_profile(job, directory=None):
+    """Return the profile saved for a job, ``None`` if there is none.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If the profile is outside its limits, see :func:`check_profile`.
+    """
+    path = profile_path(job, directory)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        profile = json.load(f)
+    check_profile(profile)
+    return profile
+
+
+def clear_profile(job, directory=None):
+    """Run a job with the settings of its plan again, return whether it had
+    a profile."""
+    path = profile_path(job, directory)
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    return True
+
+
+def _format_time(value):
+    return "-" if value is None else "{:.1f}".format(value)
+
+
+def main(argv=None):
+    import argparse
+
+    from mmec_fab.plan import prepare_job
+    from mmec_fab.telemetry import read_telemetry
+    from mmec_fab.telemetry import segment_times
+
+    parser = argparse.ArgumentParser(
+        prog="python -m mmec_fab tune", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    propose = commands.add_parser("propose", help="propose a profile from runs")
+    propose.add_argument("path", help="run data file of the runs")
+    propose.add_argument("telemetry", nargs="+", help="telemetry files of the runs")
+    propose.add_argument("--job", help="job of the file")
+    propose.add_argument(
+        "--limits",
+        help="JSON file with the safety limits, the client's settings by default",
+    )
+    propose.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="share of a phase's time a cap must cost to limit it",
+    )
+    propose.add_argument("--output", help="profile file, <job>.profile.json by default")
+    propose.add_argument(
+        "--apply", action="store_true", help="use the profile for the next runs"
+    )
+
+    apply = commands.add_parser("apply", help="use a profile for the next runs")
+    apply.add_argument("profile", help="profile file")
+
+    clear = commands.add_parser("clear", help="stop using a job's profile")
+    clear.add_argument("job", help="job name")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "apply":
+        with open(args.profile, "r") as f:
+            profile = json.load(f)
+        try:
+            path = save_profile(profile)
+        except ValueError as error:
+            print(error)
+            return 1
+        print("Next runs of {} use {}".format(profile["job"], path))
+        return 0
+
+    if args.command == "clear":
+        if not clear_profile(args.job):
+            print("No profile for {}".format(args.job))
+            return 1
+        print("Next runs of {} use the speeds of the job".format(args.job))
+        return 0
+
+    if args.command != "propose":
+        parser.print_help()
+        return 1
+
+    limits = None
+    if args.limits:
+        with open(args.limits, "r") as f:
+            limits = json.load(f)
+
+    plan = prepare_job(args.path, args.job)
+    segments = []
+    for path in args.telemetry:
+        segments.extend(segment_times(read_telemetry(path)))
+
+    analysis = analyze_speeds(plan, segments, args.tolerance)
+    profile = propose_profile(plan, analysis, limits)
+
+    row = "{:<14} {:<9} {:>6} {:>10} {:>7} {:>9} {:<13} {}"
+    print(
+        row.format(
+            "workflow",
+            "phase",
+            "moves",
+            "commanded",
+            "capped",
+            "achieved",
+            "limit",
+            "proposed",
+        )
+    )
+    for entry in analysis:
+        proposed = profile["phases"].get(entry["workflow"], {}).get(entry["phase"])
+        if proposed is None:
+            change = ""
+        else:
+            change = "{} mm/s, {} %".format(
+                proposed["tcp_max_speed"], proposed["accel"]
+            )
+            if proposed["saved"] is not None:
+                change += ", -{:.1f} s per item".format(proposed["saved"])
+        print(
+            row.format(
+                entry["workflow"],
+                entry["phase"],
+                entry["moves"],
+                _format_time(entry["commanded"]),
+                _format_time(entry["capped"]),
+                _format_time(entry["achieved"]),
+                entry["limit"] or "no data",
+                change,
+            )
+        )
+
+    output = args.output or "{}.profile.json".format(profile["job"])
+    with open(output, "w") as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+    print("Profile written to {}".format(output))
+
+    if args.apply:
+        print("Next runs of {} use {}".format(profile["job"], save_profile(profile)))
+    return 0
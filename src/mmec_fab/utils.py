@@ -2,6 +2,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import hashlib
+
 from compas.geometry import Frame
 from compas.geometry import Point
 from compas.geometry import Vector
@@ -54,3 +56,24 @@ def rgplane_to_cgframe(plane):
     xaxis = Vector(plane.XAxis.X, plane.XAxis.Y, plane.XAxis.Z)
     yaxis = Vector(plane.YAxis.X, plane.YAxis.Y, plane.YAxis.Z)
     return Frame(pt, xaxis, yaxis)
+
+
+def median(values):
+    """Return the median of values, ``None`` if there are none."""
+    values = sorted(values)
+    if not values:
+        return None
+
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def file_hash(path):
+    """Return the SHA-1 hex digest of a file's content."""
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
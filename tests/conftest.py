@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import pytest
+
+from mmec_fab import PlanCache
+from mmec_fab import prepare_job
+
+RUN_DATA = os.path.join(
+    os.path.dirname(__file__), os.pardir, "00_robotcontrol", "02_run_data"
+)
+
+
+@pytest.fixture
+def run_data():
+    """Path of a run data file of 00_robotcontrol/02_run_data."""
+    return lambda name: os.path.join(RUN_DATA, name)
+
+
+@pytest.fixture
+def prepare(tmp_path, run_data):
+    """Prepare a run data file into a temporary cache, without speed profile."""
+    cache = PlanCache(str(tmp_path / "plans"))
+    return lambda name, job=None: prepare_job(run_data(name), job, cache, False)
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import compas_rrc
+from compas.geometry import Frame
+from compas_rrc import MoveToFrame
+from compas_rrc import Zone
+
+from mmec_fab import OperatorAlerts
+from mmec_fab import PhaseMarker
+from mmec_fab import Plan
+from mmec_fab import add_alert_outputs
+
+
+def step(instruction, phase):
+    return {"msg": instruction.msg, "item": 0, "phase": phase}
+
+
+def move(x, phase="approach"):
+    frame = Frame([x, 0, 0], [1, 0, 0], [0, 1, 0])
+    return step(MoveToFrame(frame, 1000, Zone.Z10), phase)
+
+
+def test_alert_outputs_are_set_ahead_of_stops():
+    # Moves of 1000 mm at the 250 mm/s TCP limit take 4 s
+    steps = [move(1000 * i) for i in range(5)]
+    steps.append(step(compas_rrc.Stop(), "cut"))
+    steps.extend([move(3000, "transfer"), move(2000, "transfer")])
+    steps.append(step(compas_rrc.Stop(), "nail"))
+    steps.append(move(1000, "release"))
+    plan = Plan({}, [{"workflow": "slice_making"}], steps)
+    plan = add_alert_outputs(plan, "do_1", 6)
+
+    assert plan.job["alert_output"] == {"signal": "do_1", "lead": 6}
+    signals = [
+        (index, s["msg"]["float_values"][0], s["phase"], s["wait"])
+        for index, s in enumerate(plan.steps)
+        if s["msg"]["instruction"] == "r_RRC_SetDigital"
+    ]
+    # Set two moves before the first stop and reset after it. The second stop
+    # is closer than the lead, so its output is set after the first move
+    assert signals == [
+        (3, 1, "approach", False),
+        (7, 0, "cut", False),
+        (9, 1, "transfer", False),
+        (12, 0, "nail", False),
+    ]
+    assert [s for s in plan.steps if "wait" not in s] == steps
+
+
+class Client(object):
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+
+class Tracker(object):
+    def __init__(self):
+        self.client = Client()
+        self.next_stop = None
+
+    def state(self):
+        return {"next_stop": self.next_stop}
+
+
+def test_operator_alerts_once_per_stop():
+    tracker = Tracker()
+    alerts = []
+    operator = OperatorAlerts(tracker, lead=20, channels=[alerts.append])
+    operator.baseline = {"cut": 50.0}
+
+    tracker.next_stop = {"item": 0, "phase": "cut", "eta": 30.0}
+    operator.check()
+    assert alerts == []
+
+    tracker.next_stop["eta"] = 15.0
+    operator.check()
+    operator.check()
+    assert len(alerts) == 1
+    assert alerts[0]["phase"] == "cut" and alerts[0]["eta"] == 15.0
+
+    cut = PhaseMarker(0, "slice_making", "cut")
+    cut.executed_at = alerts[0]["time"] + 15
+    operator.phase_started(cut)
+    transfer = PhaseMarker(0, "slice_making", "transfer")
+    transfer.executed_at = cut.executed_at + 40
+    operator.phase_started(transfer)
+
+    assert operator.records == [
+        {
+            "item": 0,
+            "workflow": "slice_making",
+            "phase": "cut",
+            "arrived_at": cut.executed_at,
+            "lead": 15.0,
+            "wait": 40.0,
+            "saved": 10.0,
+        }
+    ]
+
+    # Item indices start again with the next plan
+    operator.plan_started(None)
+    operator.check()
+    assert len(alerts) == 2
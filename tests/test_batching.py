@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from mmec_fab import BatchedTopic
+
+
+class FakeRos(object):
+    """Connection collecting sent messages and pending timers."""
+
+    def __init__(self):
+        self.id_counter = 0
+        self.sent = []
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        self.timers.append(callback)
+
+    def send_on_ready(self, message):
+        self.sent.append(message["msg"]["n"])
+
+
+class FakeTopic(object):
+    name = "/robot_command"
+    latch = False
+    is_advertised = True
+
+    def __init__(self, ros):
+        self.ros = ros
+
+
+def batched(max_messages=3):
+    ros = FakeRos()
+    return ros, BatchedTopic(FakeTopic(ros), max_messages=max_messages)
+
+
+def test_full_batch_is_sent():
+    ros, topic = batched()
+    for n in range(4):
+        topic.publish({"n": n})
+    assert ros.sent == [0, 1, 2]
+    assert (topic.messages, topic.batches) == (4, 1)
+    assert topic.name == "/robot_command"
+
+
+def test_flush_sends_pending_messages_once():
+    ros, topic = batched()
+    topic.publish({"n": 0})
+    topic.publish({"n": 1})
+    topic.flush()
+    topic.flush()
+    assert ros.sent == [0, 1]
+    assert topic.batches == 1
+
+    # The timer of the flushed batch does not send the next one early
+    topic.publish({"n": 2})
+    ros.timers[0]()
+    assert ros.sent == [0, 1]
+    ros.timers[1]()
+    assert ros.sent == [0, 1, 2]
+    assert topic.batches == 2
+
+
+def test_batch_size_one_publishes_right_away():
+    ros, topic = batched(1)
+    topic.publish({"n": 0})
+    topic.publish({"n": 1})
+    assert ros.sent == [0, 1]
+    assert ros.timers == []
+    assert topic.batches == 2
@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+from compas import json_load
+
+from mmec_fab import cut_lengths
+from mmec_fab import plan_cuts
+from mmec_fab import plan_stock
+
+
+def test_plan_stock_best_fit_decreasing():
+    sticks = plan_stock([1000, 1900, 500, 1400, 600], stock_lengths=[3000], kerf=0)
+    assert [stick["pieces"] for stick in sticks] == [[0, 1], [2, 3, 4]]
+    assert [stick["used"] for stick in sticks] == [2900, 2500]
+    assert [stick["waste"] for stick in sticks] == [100, 500]
+
+
+def test_plan_stock_counts_the_kerf():
+    # Two pieces of 1500 mm don't fit into 3000 mm with the saw cuts
+    sticks = plan_stock([1500, 1500], stock_lengths=[3000], kerf=3)
+    assert len(sticks) == 2
+    assert sticks[0]["used"] == 1503
+
+
+def test_plan_stock_uses_the_shortest_stock_that_fits():
+    sticks = plan_stock([2000, 700, 500], stock_lengths=[1200, 3000], kerf=0)
+    assert [stick["stock"] for stick in sticks] == [3000, 1200]
+    assert [stick["pieces"] for stick in sticks] == [[0, 1], [2]]
+
+
+def test_plan_stock_keeps_every_piece_once():
+    lengths = [float(length) for length in range(100, 2900, 137)]
+    sticks = plan_stock(lengths, stock_lengths=[2400, 3000], kerf=3)
+    pieces = sorted(index for stick in sticks for index in stick["pieces"])
+    assert pieces == list(range(len(lengths)))
+    for stick in sticks:
+        assert stick["used"] <= stick["stock"]
+        assert stick["waste"] >= 0
+
+
+def test_plan_stock_rejects_long_pieces():
+    with pytest.raises(ValueError):
+        plan_stock([3000], stock_lengths=[3000], kerf=3)
+
+
+def test_plan_cuts_keeps_the_lengths(run_data):
+    data = json_load(run_data("01_slice_making_aa-01-01.json"))
+    result = plan_cuts(data, "slice_making")
+
+    lengths = cut_lengths(data, "slice_making")
+    order = [index for stick in result["cut_plan"] for index in stick["items"]]
+    assert sorted(order) == list(range(len(lengths)))
+    # Slides include the kerf
+    for new, old in enumerate(order):
+        pick = result["pick_frames"][new].point
+        measure = result["measure_frames"][new].point
+        assert pick.distance_to_point(measure) == pytest.approx(lengths[old] + 3.0)
+
+    with pytest.raises(ValueError):
+        plan_cuts(result, "slice_making")
@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import struct
+
+import compas_rrc
+import pytest
+from autobahn.twisted.websocket import WebSocketClientProtocol
+
+from mmec_fab import CborMessage
+from mmec_fab import FakeRos
+from mmec_fab import Float32Array
+from mmec_fab import RobotClient
+from mmec_fab import accept_binary
+from mmec_fab import cbor_dumps
+from mmec_fab import cbor_loads
+from mmec_fab import round_floats
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        23,
+        24,
+        255,
+        256,
+        65536,
+        2**32,
+        -1,
+        -1000,
+        1.5,
+        -0.1,
+        "",
+        "r_RRC_MoveTo",
+        "ü",
+        b"\x00\x01",
+        [],
+        [1, [2, "three"], {"four": 4.0}],
+        {"op": "publish", "msg": {"float_values": [1.0, 2.5], "feedback_id": 7}},
+    ],
+)
+def test_cbor_round_trip(value):
+    assert cbor_loads(cbor_dumps(value)) == value
+
+
+def test_cbor_long_containers():
+    values = list(range(300))
+    assert cbor_loads(cbor_dumps(values)) == values
+    text = "x" * 70000
+    assert cbor_loads(cbor_dumps(text)) == text
+
+
+def test_float32_array():
+    data = cbor_dumps(Float32Array([1.0, -2.5, 0.25]))
+    # Tag 85, then a byte string of three little-endian float32
+    assert data[:2] == b"\xd8\x55"
+    assert cbor_loads(data) == [1.0, -2.5, 0.25]
+
+
+def test_float32_array_loses_precision():
+    value = cbor_loads(cbor_dumps(Float32Array([0.1])))[0]
+    assert value != 0.1
+    assert value == pytest.approx(0.1)
+
+
+def test_typed_array_big_endian():
+    # Tag 82, float64 big-endian
+    payload = struct.pack(">2d", 1.25, -3.0)
+    data = b"\xd8\x52" + bytes([0x40 | len(payload)]) + payload
+    assert cbor_loads(data) == [1.25, -3.0]
+
+
+def test_half_precision_float():
+    assert cbor_loads(b"\xf9\x3e\x00") == 1.5
+    assert cbor_loads(b"\xf9\x7c\x00") == float("inf")
+
+
+def test_extra_data_raises():
+    with pytest.raises(ValueError):
+        cbor_loads(cbor_dumps(1) + b"\x00")
+
+
+def test_round_floats():
+    assert round_floats([1.23456789, 2.0], 3) == [1.235, 2.0]
+    values = [1.23456789]
+    assert round_floats(values, None) is values
+
+
+class Protocol(WebSocketClientProtocol):
+    def __init__(self):
+        self.text = []
+        self.received = []
+        self._message_handlers = {"publish": self.received.append}
+
+    def onMessage(self, payload, isBinary):
+        self.text.append(payload)
+
+
+class Factory(object):
+    def __init__(self, proto):
+        self._proto = proto
+        self.callbacks = []
+
+    def on(self, event, callback):
+        self.callbacks.append((event, callback))
+
+
+class Ros(object):
+    def __init__(self, proto):
+        self.factory = Factory(proto)
+
+
+def test_accept_binary_decodes_cbor_frames():
+    proto = Protocol()
+    ros = Ros(proto)
+    assert accept_binary(ros)
+    assert ros.factory.callbacks[0][0] == "ready"
+
+    message = {"op": "publish", "topic": "/rob1/robot_response", "msg": {"x": 1}}
+    proto.onMessage(cbor_dumps(message), True)
+    assert proto.received == [message]
+    assert isinstance(proto.received[0]["msg"], CborMessage)
+
+    proto.onMessage(b'{"op": "publish"}', False)
+    assert proto.text == [b'{"op": "publish"}']
+
+
+def test_accept_binary_ignores_undecodable_frames():
+    proto = Protocol()
+    accept_binary(Ros(proto))
+    proto.onMessage(b"\xff\xff", True)
+    assert proto.received == []
+
+
+def test_accept_binary_without_factory():
+    assert not accept_binary(object())
+
+
+class OtherProtocol(Protocol):
+    # Without the private handlers of roslibpy
+    def __init__(self):
+        self.text = []
+
+    def on_message(self, payload):
+        self.text.append(payload)
+
+
+def test_accept_binary_without_message_handlers():
+    proto = OtherProtocol()
+    accept_binary(Ros(proto))
+    proto.onMessage(cbor_dumps({"op": "publish", "msg": {"x": 1.5}}), True)
+    assert proto.text == [b'{"op": "publish", "msg": {"x": 1.5}}']
+
+
+@pytest.mark.parametrize("supports_cbor", [True, False])
+def test_client_encoding_follows_the_feedback(supports_cbor):
+    client = RobotClient(ros=FakeRos(supports_cbor=supports_cbor))
+    client.prompt = lambda text: None
+    assert client.encoding == "cbor"
+
+    with client:
+        client.send_and_wait(compas_rrc.Noop())
+    assert client.encoding == ("cbor" if supports_cbor else "json")
@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from mmec_fab import FEEDBACK
+from mmec_fab import SENT
+from mmec_fab import ExchangeLog
+from mmec_fab import ExchangeRecorder
+from mmec_fab import FakeRos
+from mmec_fab import RobotClient
+from mmec_fab import read_exchange
+from mmec_fab import replay_exchange
+
+
+def test_log_grows_and_reads_back(tmp_path):
+    path = str(tmp_path / "session.log")
+    with ExchangeLog(path, size=64) as log:
+        for i in range(20):
+            log.append(SENT if i % 2 else FEEDBACK, {"i": i, "text": "x" * i})
+
+    _, records = read_exchange(path)
+    assert [message["i"] for _, _, message in records] == list(range(20))
+    assert [direction for _, direction, _ in records[:2]] == [FEEDBACK, SENT]
+    times = [seconds for seconds, _, _ in records]
+    assert times == sorted(times)
+
+
+def test_read_exchange_checks_the_file(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_exchange(str(path))
+
+
+def test_replay_sends_the_recorded_session(prepare, tmp_path, capsys):
+    plan = prepare("01_slice_making_aa-01-01.json")
+    path = str(tmp_path / "session.log")
+
+    def execution_time(msg):
+        return 0.002 if msg["instruction"] == "r_RRC_MoveTo" else 0.0
+
+    ros = FakeRos(execution_time)
+    with RobotClient(ros=ros) as client, ExchangeRecorder(client, path):
+        client.run_plan(plan)
+
+    _, records = read_exchange(path)
+    sent = [message for _, direction, message in records if direction == SENT]
+    feedback = [message for _, direction, message in records if direction == FEEDBACK]
+    assert len(sent) == ros.received
+    sequence_ids = set(m["sequence_id"] for m in sent)
+    assert set(m["feedback_id"] for m in feedback) <= sequence_ids
+
+    result = replay_exchange(path, speed=4.0)
+    assert result["instructions"] == len(sent)
+    assert result["replayed"] < result["recorded"]
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from mmec_fab import BackgroundExecutor
+
+
+class FakeClient(object):
+    """Client notifying its listeners of each sent instruction."""
+
+    def __init__(self):
+        self.listeners = []
+        self.sent = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def send(self, instruction):
+        for listener in list(self.listeners):
+            listener.instruction_sending(instruction)
+        self.sent.append(instruction)
+        for listener in list(self.listeners):
+            listener.instruction_sent(instruction)
+
+
+def send_all(client, count):
+    for i in range(count):
+        client.send(i)
+    return count
+
+
+def test_cancel_stops_the_running_job_and_skips_queued_ones():
+    clients = []
+
+    def factory():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    started = threading.Event()
+    resume = threading.Event()
+
+    def blocking(client):
+        client.send("first")
+        started.set()
+        resume.wait(5)
+        client.send("second")
+
+    with BackgroundExecutor(factory) as executor:
+        running = executor.submit(blocking)
+        queued = executor.submit(send_all, 10)
+        assert started.wait(5)
+        assert executor.busy
+
+        executor.cancel()
+        resume.set()
+        assert running.wait(5) and queued.wait(5)
+
+        assert running.status == "cancelled"
+        assert running.instructions == 1
+        assert queued.status == "cancelled"
+        assert queued.started_at is not None and queued.instructions == 0
+        assert clients[0].sent == ["first"]
+        assert not executor.busy
+
+    assert len(clients) == 1 and clients[0].closed
+
+
+def test_failed_job_reconnects_for_the_next_one():
+    clients = []
+
+    def factory():
+        clients.append(FakeClient())
+        return clients[-1]
+
+    def fail(client):
+        raise ValueError("lost")
+
+    with BackgroundExecutor(factory) as executor:
+        failed = executor.submit(fail)
+        done = executor.submit(send_all, 3)
+        assert done.wait(5)
+
+        assert failed.status == "failed"
+        assert "ValueError: lost" in failed.error
+        assert done.status == "done" and done.result == 3
+
+        state = executor.state()
+        assert state["connected"] and not state["busy"]
+        assert [job["status"] for job in state["jobs"]] == ["failed", "done"]
+
+    assert len(clients) == 2
+    assert clients[0].closed and clients[1].closed
@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+from compas.geometry import Frame
+
+from mmec_fab import ChannelSource
+from mmec_fab import FrameChannel
+
+
+def frames(count, z=0.0):
+    return [Frame([i, 0, z], [1, 0, 0], [0, 1, 0]) for i in range(count)]
+
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / "frames.frames")
+    with FrameChannel(path, capacity=8) as channel:
+        version = channel.write(frames(3))
+        assert version == channel.version == 2
+
+    # Another reader of the same file
+    with FrameChannel(path) as channel:
+        assert channel.capacity == 8
+        read_version, read = channel.read()
+        assert read_version == version
+        assert [list(frame.point) for frame in read] == [
+            [0, 0, 0],
+            [1, 0, 0],
+            [2, 0, 0],
+        ]
+        assert channel.frame(2).point == frames(3)[2].point
+        assert channel.frame(3) is None
+
+
+def test_changes_since_version(tmp_path):
+    with FrameChannel(str(tmp_path / "frames.frames"), capacity=8) as channel:
+        first = channel.write(frames(3))
+
+        moved = frames(4)
+        moved[1] = Frame([1, 0, 5], [1, 0, 0], [0, 1, 0])
+        second = channel.write(moved)
+
+        version, changed, count = channel.changes(first)
+        assert version == second
+        assert count == 4
+        assert sorted(changed) == [1, 3]
+        assert list(changed[1].point) == [1, 0, 5]
+
+        assert channel.changes(second)[1] == {}
+        assert channel.wait(first, timeout=0) == second
+        assert channel.wait(second, timeout=0) == second
+
+
+def test_capacity_and_file_checks(tmp_path):
+    with FrameChannel(str(tmp_path / "frames.frames"), capacity=2) as channel:
+        with pytest.raises(ValueError):
+            channel.write(frames(3))
+
+    other = tmp_path / "other.frames"
+    other.write_bytes(b"not a channel" + b"\0" * 64)
+    with pytest.raises(ValueError):
+        FrameChannel(str(other))
+
+
+def test_channel_source_reads_items_live(tmp_path):
+    keys = ["pick_frames", "measure_frames", "safe_frames", "place_frames"]
+    paths = {}
+    for key in keys:
+        paths[key] = str(tmp_path / "{}.frames".format(key))
+        with FrameChannel(paths[key]) as channel:
+            # The shortest channel ends the items
+            channel.write(frames(2 if key == "place_frames" else 3))
+
+    source = ChannelSource("slice_making", paths)
+    items = source.items("slice_making")
+    assert [frame.point[0] for frame in next(items)] == [0, 0, 0, 0]
+
+    # Changes apply to the items not read yet
+    with FrameChannel(paths["place_frames"]) as channel:
+        channel.write(frames(3, z=10))
+    assert [frame.point[2] for frame in next(items)] == [0, 0, 0, 10]
+    assert len(list(items)) == 1
+
+    assert list(source.items("slice_placing")) == []
+    with pytest.raises(ValueError):
+        ChannelSource("slice_making", {"pick_frames": paths["pick_frames"]})
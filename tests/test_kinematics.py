@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import compas_rrc
+import numpy as np
+import pytest
+from compas.geometry import Frame
+
+from mmec_fab import IRB4600_40_255
+from mmec_fab import IKSolver
+from mmec_fab import Plan
+from mmec_fab import analyze_plan
+from mmec_fab import forward_kinematics
+from mmec_fab import inverse_kinematics
+from mmec_fab import matrix_quaternion
+
+# Joint positions in radians within the limits of the IRB 4600
+JOINTS = np.radians(
+    [
+        [0, 0, 0, 0, 90, 0],
+        [30, 20, -10, 45, 60, -30],
+        [-60, 45, -45, -90, 30, 120],
+        [120, -30, 20, 10, -45, 200],
+    ]
+)
+
+
+def test_inverse_kinematics_reaches_forward_kinematics():
+    matrices = forward_kinematics(JOINTS)
+    solutions = inverse_kinematics(matrices)
+    assert solutions.shape == (len(JOINTS), 8, 6)
+
+    for matrix, pose_solutions in zip(matrices, solutions):
+        valid = pose_solutions[~np.isnan(pose_solutions).any(axis=1)]
+        assert len(valid)
+        for joints in valid:
+            assert np.allclose(forward_kinematics(joints), matrix, atol=1e-6)
+
+
+def test_inverse_kinematics_finds_the_joint_positions():
+    solutions = inverse_kinematics(forward_kinematics(JOINTS))
+    for joints, pose_solutions in zip(JOINTS, solutions):
+        # Same angles up to full turns
+        difference = np.angle(np.exp(1j * (pose_solutions - joints)))
+        assert np.any(np.all(np.abs(difference) < 1e-6, axis=1))
+
+
+def test_inverse_kinematics_out_of_reach():
+    matrix = np.identity(4)
+    matrix[:3, 3] = [10000.0, 0.0, 0.0]
+    assert np.isnan(inverse_kinematics(matrix)).any(axis=-1).all()
+
+
+def test_solver_picks_the_nearest_solution():
+    solver = IKSolver()
+    matrices = forward_kinematics(JOINTS)
+    points = matrices[:, :3, 3]
+    quaternions = np.array([matrix_quaternion(m[:3, :3]) for m in matrices])
+
+    solutions = solver.solve(points, quaternions)
+    for joints, pose_solutions in zip(JOINTS, solutions):
+        index, nearest = solver.nearest(pose_solutions, joints)
+        assert index is not None
+        assert np.allclose(nearest, joints, atol=1e-6)
+
+
+def test_joint_time_is_limited_by_the_slowest_joint():
+    solver = IKSolver()
+    end = np.radians([0, 0, 0, 0, 0, 90])
+    speed = np.radians(solver.params["speeds"][5])
+    assert solver.joint_time(np.zeros(6), end) == pytest.approx(np.pi / 2 / speed)
+
+
+def test_irb4600_40_255_dimensions():
+    # Flange at the calibration position, from the product specification
+    matrix = forward_kinematics(np.zeros(6))
+    assert np.allclose(matrix[:3, 3], [1580, 0, 1765])
+    assert np.allclose(matrix[:3, 2], [1, 0, 0])
+
+    # The wrist centre reaches 2.55 m from axis 1
+    axis2 = np.radians(np.arange(-90, 150.5, 0.5))
+    axis3 = np.radians(np.arange(-180, 75.5, 0.5))
+    joints = np.zeros((len(axis2), len(axis3), 6))
+    joints[..., 1] = axis2[:, None]
+    joints[..., 2] = axis3[None, :]
+    matrices = forward_kinematics(joints)
+    center = matrices[..., :3, 3] - IRB4600_40_255["c4"] * matrices[..., :3, 2]
+    reach = np.hypot(center[..., 0], center[..., 1]).max()
+    assert reach == pytest.approx(2550, abs=5)
+
+
+def test_moves_in_unknown_work_objects_are_not_checked():
+    frame = Frame([1500, 0, 1000], [0, 1, 0], [1, 0, 0])
+    move = {"msg": compas_rrc.MoveToFrame(frame, 100, compas_rrc.Zone.Z10).msg}
+    steps = [
+        move,
+        {"msg": compas_rrc.SetWorkObject("ob_A057_WobjCutST").msg},
+        move,
+        {"msg": compas_rrc.SetWorkObject("wobj0").msg},
+        move,
+    ]
+    report = analyze_plan(Plan({}, [], steps))
+    assert [entry["reachable"] for entry in report] == [True, None, True]
+    assert report[1]["joint_time"] is None
+
+    solver = IKSolver()
+    assert not solver.has_wobj("ob_A057_WobjCutST")
+    with pytest.raises(KeyError, match="ob_A057_WobjCutST"):
+        solver.solve([frame.point], [frame.quaternion.wxyz], "ob_A057_WobjCutST")
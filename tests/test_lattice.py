@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+import pytest
+
+from mmec_fab import LatticeSpec
+from mmec_fab import PlanCache
+from mmec_fab import generate_run_data
+from mmec_fab import job_for_file
+from mmec_fab import prepare_job
+
+DAE = os.path.join(
+    os.path.dirname(__file__), os.pardir, "01_Setup", "01_3D_object", "3D Lattice.dae"
+)
+
+
+def _place_points(path):
+    with open(path) as f:
+        return [frame["value"]["point"] for frame in json.load(f)["place_frames"]]
+
+
+def test_generated_files_prepare_as_their_jobs(tmp_path):
+    spec = LatticeSpec(slices=4, rung_count=2, rolling_rows=2)
+    paths = generate_run_data(str(tmp_path / "gen"), spec=spec)
+
+    names = sorted(os.path.basename(path) for path in paths)
+    assert names == [
+        "00_Base_making_gen.json",
+        "00_Cap_making_gen.json",
+        "01_slice_making_gen-02.json",
+        "01_slice_making_gen-03.json",
+        "02_slice_placing_gen-01.json",
+        "02_slice_placing_gen-02.json",
+        "02_slice_placing_gen-03.json",
+        "02_slice_placing_gen-04.json",
+        "02_slice_placing_gen.json",
+        "04_rolling_gen.json",
+    ]
+
+    cache = PlanCache(str(tmp_path / "plans"))
+    for path in paths:
+        plan = prepare_job(path, cache=cache, profile=False)
+        assert plan.job["name"] == job_for_file(path).name
+        assert plan.items
+
+
+def test_dae_slices_use_the_station_of_the_spec(tmp_path):
+    default = generate_run_data(str(tmp_path / "default"), dae=DAE)
+    spec = LatticeSpec(station_center=(295.0, 667.0), rail_z=19.0)
+    moved = generate_run_data(str(tmp_path / "moved"), spec=spec, dae=DAE)
+
+    making = [path for path in default if "_making_" in path]
+    assert making
+    assert [os.path.basename(path) for path in moved] == [
+        os.path.basename(path) for path in default
+    ]
+    for path, moved_path in zip(default, moved):
+        if "_making_" not in path:
+            continue
+        for a, b in zip(_place_points(path), _place_points(moved_path)):
+            assert b == pytest.approx([a[0] + 100, a[1] - 100, a[2] + 10])
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+from mmec_fab import JOBS
+from mmec_fab import WORKFLOWS
+from mmec_fab import PlanCache
+from mmec_fab import compile_job
+from mmec_fab import compile_job_incremental
+from mmec_fab import diff_run_data
+from mmec_fab import prepare_files
+from mmec_fab.plan import plan_key
+
+SLICE_MAKING = "01_slice_making_aa-01-01.json"
+
+
+def test_plan_key_changes_with_content_and_job():
+    key = plan_key(b"{}", JOBS["slice_making"])
+    assert key == plan_key(b"{}", JOBS["slice_making"])
+    assert key != plan_key(b"{ }", JOBS["slice_making"])
+    assert key != plan_key(b"{}", JOBS["slice_making_trigger"])
+
+
+def test_put_data_replaces_only_when_asked(tmp_path):
+    cache = PlanCache(str(tmp_path))
+    cache.put_data("key", {"value": 1})
+    cache.put_data("key", {"value": 2})
+    assert cache.get_data("key") == {"value": 1}
+
+    cache.put_data("key", {"value": 3}, replace=True)
+    assert cache.get_data("key") == {"value": 3}
+    assert [p.name for p in tmp_path.iterdir()] == ["key.json"]
+
+
+def test_prepared_plans_are_cached(prepare, run_data, tmp_path):
+    plan = prepare(SLICE_MAKING)
+    assert plan.data == compile_job(run_data(SLICE_MAKING), "slice_making").data
+
+    cache_dir = str(tmp_path / "files")
+    paths = [run_data(SLICE_MAKING), run_data("01_slice_making_aa-01-02.json")]
+    first = prepare_files(paths, cache_dir=cache_dir, processes=2)
+    second = prepare_files(paths, cache_dir=cache_dir, processes=2)
+
+    assert [(hit, error) for _, hit, _, error in first] == [(False, None)] * 2
+    assert [(hit, error) for _, hit, _, error in second] == [(True, None)] * 2
+
+
+def _run_data(run_data, name=SLICE_MAKING):
+    with open(run_data(name)) as f:
+        return json.load(f)
+
+
+def test_diff_run_data_finds_changed_added_and_removed_items(run_data):
+    old = _run_data(run_data)
+    new = _run_data(run_data)
+    new["place_frames"][2] = new["place_frames"][3]
+    for key in WORKFLOWS["slice_making"]:
+        new[key].append(new[key][0])
+
+    diff = diff_run_data(old, new, "slice_making")["slice_making"]
+    assert diff == {"changed": [(2, ["place_frames"])], "added": [7], "removed": []}
+
+    diff = diff_run_data(new, old, "slice_making")["slice_making"]
+    assert diff["removed"] == [7]
+
+
+def test_incremental_compile_only_compiles_changed_items(run_data, tmp_path):
+    cache = PlanCache(str(tmp_path / "plans"))
+    job = JOBS["slice_making"]
+    data = _run_data(run_data)
+
+    plan, compiled = compile_job_incremental(data, job, cache)
+    assert compiled == 7
+    assert plan.data == compile_job(run_data(SLICE_MAKING), job).data
+
+    data["measure_frames"][4] = data["measure_frames"][5]
+    path = str(tmp_path / SLICE_MAKING)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+    plan, compiled = compile_job_incremental(data, job, cache)
+    assert compiled == 1
+    assert plan.data == compile_job(path, job).data
@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+from compas.geometry import Frame
+from compas_rrc import MoveToFrame
+from compas_rrc import SetMaxSpeed
+from compas_rrc import SetWorkObject
+from compas_rrc import Zone
+
+from mmec_fab import KinematicSetup
+from mmec_fab import Plan
+from mmec_fab import preview_plan
+from mmec_fab import read_columnar
+from mmec_fab import slerp
+from mmec_fab import write_preview
+
+WOBJ_FIELDS = ("robhold", "ufprog", "ufmec", "uframe", "oframe")
+
+
+def step(instruction, phase="approach"):
+    return {"msg": instruction.msg, "item": 0, "phase": phase}
+
+
+def move(x, speed=1000, zone=Zone.FINE, phase="approach"):
+    frame = Frame([x, 0, 0], [1, 0, 0], [0, 1, 0])
+    return step(MoveToFrame(frame, speed, zone), phase)
+
+
+def test_slerp_endpoints_and_midpoint():
+    q0 = [1, 0, 0, 0]
+    q1 = [0, 0, 0, 1]
+    q = slerp(q0, q1, [0.0, 0.5, 1.0])
+    assert q[0] == pytest.approx(q0)
+    assert q[1] == pytest.approx([np.sqrt(0.5), 0, 0, np.sqrt(0.5)])
+    assert q[2] == pytest.approx(q1)
+
+    # Along the shorter arc, and one fraction per row
+    rows = slerp([q0, q0], [[-1, 0, 0, 0], q1], [0.5, 0.0])
+    assert rows[0] == pytest.approx(q0)
+    assert rows[1] == pytest.approx(q0)
+
+
+def test_preview_steps_through_the_moves():
+    steps = [step(SetMaxSpeed(100, 500)), move(0), move(1000)]
+    steps.append(move(1500, 100, phase="place"))
+    preview = preview_plan(Plan({}, [{"workflow": "slice_making"}], steps), dt=0.5)
+
+    # 1000 mm at the 500 mm/s cap, then 500 mm at 100 mm/s
+    assert preview["time"][-1] == pytest.approx(7.0)
+    assert np.diff(preview["time"]) == pytest.approx(0.5)
+    assert preview["x"][preview["time"] == 1.0] == pytest.approx([500])
+    assert preview["x"][preview["time"] == 4.5] == pytest.approx([1250])
+    assert preview["x"][-1] == pytest.approx(1500)
+    assert preview["phase"][0] == 1
+    assert preview["phase"][-1] == 5
+    assert preview["wobj_names"] == ["wobj0"]
+
+
+def test_preview_leaves_unknown_work_objects_in_their_coordinates():
+    steps = [step(SetWorkObject("ob_Station")), move(0), move(1000)]
+    steps += [step(SetWorkObject("ob_Missing")), move(0), move(500)]
+    station = [False, True, "", [[0, 2000, 0], [1, 0, 0, 0]], [[0, 0, 0], [1, 0, 0, 0]]]
+    setup = KinematicSetup({}, {"ob_Station": dict(zip(WOBJ_FIELDS, station))})
+    preview = preview_plan(Plan({}, [], steps), dt=0.5, setup=setup)
+
+    assert preview["missing_wobjs"] == ["ob_Missing"]
+    assert preview["wobj_names"] == ["ob_Station", "ob_Missing", "wobj0"]
+    assert set(preview["wobj"]) == {1, 2}
+    assert preview["y"][preview["wobj"] == 2] == pytest.approx(2000)
+    assert preview["y"][preview["wobj"] == 1] == pytest.approx(0)
+    # The change of work object is a jump, 4 s in the station and 2 s after at
+    # the 250 mm/s TCP limit
+    assert preview["time"][-1] == pytest.approx(6.0)
+
+
+def test_preview_poses_of_a_job(prepare, tmp_path):
+    preview = preview_plan(prepare("04_rolling_left.json"))
+    quaternions = np.stack([preview[name] for name in ("qw", "qx", "qy", "qz")])
+    assert np.linalg.norm(quaternions, axis=0) == pytest.approx(1.0)
+
+    path = str(tmp_path / "preview.col")
+    write_preview(path, preview, {"job": "04_rolling_left.json"})
+    data, metadata = read_columnar(path)
+    assert metadata["job"] == "04_rolling_left.json"
+    assert metadata["wobjs"] == preview["wobj_names"]
+    assert list(data["item"]) == list(preview["item"])
+    assert np.array(data["x"]) == pytest.approx(preview["x"], abs=1e-3)
@@ -0,0 +1,106 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import socket
+
+from mmec_fab import FakeRos
+from mmec_fab import PhaseMarker
+from mmec_fab import ProgressServer
+from mmec_fab import ProgressTracker
+from mmec_fab import RobotClient
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen  # type: ignore
+
+
+class _NextStops(object):
+    # Next stop estimated by the tracker as each phase starts
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.plans = []
+
+    def plan_started(self, plan):
+        self.plans.append([])
+
+    def phase_started(self, marker):
+        stop = self.tracker.state()["next_stop"]
+        self.plans[-1].append(
+            (marker.item_index, marker.phase, stop and (stop["item"], stop["phase"]))
+        )
+
+
+def _marker(item_index, workflow, phase, executed_at):
+    marker = PhaseMarker(item_index, workflow, phase)
+    marker.executed_at = executed_at
+    return marker
+
+
+def test_tracker_follows_consecutive_plans_of_a_client(prepare, capsys):
+    plans = [
+        prepare("02_making_placing_aa-01-01.json"),
+        prepare("02_making_placing_aa-01-02.json"),
+    ]
+
+    with RobotClient(ros=FakeRos(), adaptive_timeouts=False) as client:
+        tracker = ProgressTracker(client)
+        tracker.start()
+        stops = _NextStops(tracker)
+        client.add_listener(stops)
+        for plan in plans:
+            client.run_plan(plan)
+
+    for plan, seen in zip(plans, stops.plans):
+        items = [item for item, _, _ in seen if item >= 0]
+        assert items == sorted(items)
+        assert items[-1] == len(plan.items) - 1
+
+        # Each stop is announced from the phase before it
+        for (_, _, stop), (item, phase, _) in zip(seen, seen[1:]):
+            if phase in ("cut", "nail"):
+                assert stop == (item, phase)
+
+
+def test_tracker_estimates_from_seen_phases(prepare):
+    plan = prepare("01_slice_making_aa-01-01.json")
+    tracker = ProgressTracker(None, plan)
+
+    tracker.phase_started(_marker(-1, None, "setup", 0.0))
+    tracker.phase_started(_marker(0, "slice_making", "pick", 10.0))
+    state = tracker.state()
+    assert state["item"] == 0
+    assert state["items_total"] == 7
+    assert state["next_stop"]["item"] == 0
+    assert state["next_stop"]["phase"] == "cut"
+    # The cut stop waits for the operator, no estimate until one is seen
+    assert state["eta"] is None
+
+    for phase, start in (("cut", 30), ("transfer", 60), ("pick", 110)):
+        item_index = 0 if start < 100 else 1
+        tracker.phase_started(_marker(item_index, "slice_making", phase, start))
+    state = tracker.state()
+    assert state["items_done"] == 1
+    assert state["cycle_times"] == {"slice_making": 100.0}
+    assert (state["next_stop"]["item"], state["next_stop"]["phase"]) == (1, "cut")
+
+
+def test_server_serves_the_state(prepare):
+    plan = prepare("01_slice_making_aa-01-01.json")
+    client = RobotClient(ros=FakeRos(), adaptive_timeouts=False)
+    tracker = ProgressTracker(client, plan)
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    with ProgressServer(tracker, port=port):
+        response = urlopen("http://127.0.0.1:{}/".format(port), timeout=5)
+        state = json.loads(response.read().decode("utf-8"))
+
+    client.ros.close()
+    assert state["items_total"] == 7
+    assert tracker not in client.listeners
@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import pytest
+
+from mmec_fab import KinematicSetup
+from mmec_fab import load_setup
+from mmec_fab import parse_rapid
+from mmec_fab.rapid_data import STATION_WOBJS
+
+BACKUP = os.path.join(
+    os.path.dirname(__file__),
+    os.pardir,
+    "00_robotcontrol",
+    "xx_RobotBackup",
+    "C1_R1_RW6-11_BACKUP_2021-05-01",
+)
+
+RAPID = """
+MODULE Station
+    ! Old calibration, kept for reference
+    !TASK PERS wobjdata ob_Old:=[FALSE,TRUE,"",[[9,9,9],[1,0,0,0]],[[0,0,0],[1,0,0,0]]];
+    TASK PERS tooldata t_Needle:=[TRUE,[[0,0,.5],[1,0,0,0]],
+                                  [1.5,[0,0,1],[1,0,0,0],0,0,0]];
+    TASK PERS wobjdata ob_Station:=[FALSE,TRUE,"",[[1000,0,0],[0.707107,0,0,0.707107]],
+                                    [[0,0,10],[1,0,0,0]]]; ! Rotated 90 deg
+    PERS wobjdata ob_Held:=[TRUE,TRUE,"",[[0,0,0],[1,0,0,0]],[[0,0,0],[1,0,0,0]]];
+ENDMODULE
+"""
+
+
+def test_parse_rapid():
+    data = parse_rapid(RAPID)
+    assert sorted(data["tools"]) == ["t_Needle"]
+    assert sorted(data["wobjs"]) == ["ob_Held", "ob_Station"]
+
+    needle = data["tools"]["t_Needle"]
+    assert needle["robhold"] is True
+    assert needle["tframe"] == [[0, 0, 0.5], [1, 0, 0, 0]]
+    assert needle["load"][0] == 1.5
+
+    station = data["wobjs"]["ob_Station"]
+    assert (station["robhold"], station["ufprog"], station["ufmec"]) == (
+        False,
+        True,
+        "",
+    )
+    assert station["oframe"] == [[0, 0, 10], [1, 0, 0, 0]]
+
+
+def test_to_world():
+    data = parse_rapid(RAPID)
+    setup = KinematicSetup(data["tools"], data["wobjs"])
+
+    points = setup.to_world("ob_Station", [[0, 0, 0], [100, 0, 0]])
+    assert np.allclose(points, [[1000, 0, 10], [1000, 100, 10]], atol=1e-3)
+    assert np.allclose(setup.to_world("wobj0", points), points)
+
+    with pytest.raises(ValueError, match="ob_Held"):
+        setup.to_world("ob_Held", points)
+    with pytest.raises(KeyError, match="ob_Old"):
+        setup.to_world("ob_Old", points)
+
+
+def test_backups_have_no_station_wobjs(tmp_path):
+    setup = load_setup(BACKUP, cache_dir=str(tmp_path))
+    assert "t_RFL_Act" in setup.tools
+    assert not set(STATION_WOBJS).intersection(setup.wobjs)
+
+    # From the cache the second time
+    assert os.listdir(str(tmp_path))
+    assert load_setup(BACKUP, cache_dir=str(tmp_path)).data == setup.data
@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from mmec_fab import FakeRos
+from mmec_fab import RobotClient
+from mmec_fab import fit_transform
+from mmec_fab import fit_wobj
+from mmec_fab import format_wobjdata
+from mmec_fab import measure_points
+from mmec_fab import wobj_data
+
+POINTS = [[0, 0, 0], [1200, 0, 0], [0, 800, 0], [1200, 800, 50]]
+
+
+def transform(angle, translation):
+    c, s = np.cos(angle), np.sin(angle)
+    matrix = np.identity(4)
+    matrix[:3, :3] = [[c, -s, 0], [s, c, 0], [0, 0, 1]]
+    matrix[:3, 3] = translation
+    return matrix
+
+
+def apply(matrix, points):
+    points = np.asarray(points, dtype=float)
+    return points.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def test_fit_transform_recovers_the_transformation():
+    expected = transform(0.3, [1500, -200, 20])
+    matrix = fit_transform(POINTS, apply(expected, POINTS))
+    assert np.allclose(matrix, expected)
+
+
+def test_fit_wobj_reports_residuals():
+    measured = apply(transform(-0.1, [10, 20, 30]), POINTS)
+    measured[0] += [0, 0, 1]
+    result = fit_wobj(POINTS, measured)
+    assert len(result["residuals"]) == 4
+    assert 0 < result["rms"] <= result["max"] < 1
+
+
+@pytest.mark.parametrize(
+    "points",
+    [
+        [[0, 0, 0], [100, 0, 0]],
+        [[0, 0, 0], [100, 0, 0], [200, 0, 0]],
+    ],
+)
+def test_fit_transform_needs_three_points_off_a_line(points):
+    with pytest.raises(ValueError):
+        fit_transform(points, points)
+
+
+def test_wobj_data_keeps_the_object_frame():
+    matrix = transform(np.pi / 2, [100, 200, 0])
+    previous = {"oframe": [[0.0, 0.0, 10.0], [1.0, 0.0, 0.0, 0.0]]}
+    data = wobj_data(matrix, previous)
+
+    assert data["oframe"] == previous["oframe"]
+    assert np.allclose(data["uframe"][0], [100, 200, -10])
+    assert np.allclose(data["uframe"][1], [np.sqrt(0.5), 0, 0, np.sqrt(0.5)])
+    assert format_wobjdata("ob_test", data).startswith(
+        'PERS wobjdata ob_test := [FALSE,TRUE,"",[[100.000,200.000,-10.000],'
+    )
+
+
+class JoggingRos(FakeRos):
+    """Controller where the operator jogs by ``jog`` at each stop.
+
+    Work objects are shifted by ``origin`` from the world. After a stop the
+    robot regains its stop position unless the stop is without regain.
+    """
+
+    def __init__(self, origin, jog):
+        super(JoggingRos, self).__init__()
+        self.origin = np.array(origin, dtype=float)
+        self.jog = np.array(jog, dtype=float)
+        self.wobj = "wobj0"
+        self.position = np.zeros(3)
+        self.frames = {}
+
+    def send_on_ready(self, message):
+        msg = message.get("msg", {})
+        instruction = msg.get("instruction")
+        if instruction == "r_RRC_SetWorkObject":
+            self.wobj = msg["string_values"][0]
+        elif instruction == "r_RRC_MoveTo":
+            self.position = np.array(msg["float_values"][:3])
+            if self.wobj != "wobj0":
+                self.position += self.origin
+        elif instruction == "r_A057_StopNoRegain":
+            self.position = self.position + self.jog
+        elif instruction == "r_RRC_GetRobtarget":
+            position = self.position
+            if self.wobj != "wobj0":
+                position = position - self.origin
+            values = list(position) + [1, 0, 0, 0] + [9e9] * 6
+            self.frames[msg["sequence_id"]] = values
+        super(JoggingRos, self).send_on_ready(message)
+
+    def _publish_feedback(self, feedback):
+        if feedback["feedback_id"] in self.frames:
+            feedback["float_values"] = self.frames[feedback["feedback_id"]]
+        super(JoggingRos, self)._publish_feedback(feedback)
+
+
+def test_measure_points_reads_the_jogged_position():
+    points = [[0, 0, 0], [100, 0, 0]]
+    ros = JoggingRos(origin=[1000, 500, 0], jog=[0.5, -0.25, 1])
+
+    with RobotClient(ros=ros) as client:
+        measured = measure_points(client, points, "ob_A057_WobjSliceST")
+        commanded = measure_points(client, points, "ob_A057_WobjSliceST", jog=False)
+
+    assert np.allclose(measured, [[1000.5, 499.75, 1], [1100.5, 499.75, 1]])
+    assert np.allclose(commanded, [[1000, 500, 0], [1100, 500, 0]])
@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+from compas.geometry import Frame
+from compas_rrc import CustomInstruction
+from compas_rrc import MoveToFrame
+from compas_rrc import Noop
+from compas_rrc import Zone
+
+from mmec_fab import MAX_FLOAT_VALUES
+from mmec_fab import MAX_STRING_VALUES
+from mmec_fab import TRIGGER_INSTRUCTION
+from mmec_fab import FakeRos
+from mmec_fab import MoveToFrameTrigger
+from mmec_fab import RobotClient
+from mmec_fab import check_value_counts
+
+
+def test_trigger_move_values():
+    move = MoveToFrameTrigger(
+        Frame.worldXY(), 100, Zone.FINE, "doUnitC1Out1", 1, distance=5, start=True
+    )
+    assert move.instruction == TRIGGER_INSTRUCTION
+    assert len(move.float_values) == 19
+    assert move.float_values[15:] == [5, 1, 1, 0]
+    assert move.string_values[-1] == "doUnitC1Out1"
+
+
+def test_time_trigger_needs_a_fine_point():
+    with pytest.raises(ValueError):
+        MoveToFrameTrigger(
+            Frame.worldXY(), 100, Zone.Z10, "doUnitC1Out1", 1, distance=0.1, time=True
+        )
+
+
+def test_check_value_counts_limits():
+    check_value_counts(
+        CustomInstruction(
+            "r_A057_Test",
+            ["s"] * MAX_STRING_VALUES,
+            [0.0] * MAX_FLOAT_VALUES,
+        )
+    )
+
+    with pytest.raises(ValueError, match="37 float values"):
+        check_value_counts(
+            CustomInstruction("r_A057_Test", [], [0.0] * (MAX_FLOAT_VALUES + 1))
+        )
+    with pytest.raises(ValueError, match="9 string values"):
+        check_value_counts(
+            CustomInstruction("r_A057_Test", ["s"] * (MAX_STRING_VALUES + 1), [])
+        )
+
+
+class _Sent(object):
+    def __init__(self):
+        self.names = []
+
+    def instruction_sent(self, instruction):
+        self.names.append(instruction.instruction)
+
+
+def test_phase_starting_with_a_move_is_marked_before_it():
+    sent = _Sent()
+    with RobotClient(ros=FakeRos(), adaptive_timeouts=False) as client:
+        client.add_listener(sent)
+        client.set_phase("setup")
+        client.send_and_wait(MoveToFrame(Frame.worldXY(), 100, Zone.FINE), timeout=5)
+        client.set_phase("finish")
+        client.send_and_wait(Noop(), timeout=5)
+
+    assert sent.names == ["r_RRC_Noop", "r_RRC_MoveTo", "r_RRC_Noop"]
+    assert client.executing.phase == "finish"
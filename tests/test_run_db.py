@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import pytest
+
+from mmec_fab import RunDatabase
+from mmec_fab.run_db import main
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = RunDatabase(str(tmp_path / "runs.sqlite"))
+    yield database
+    database.close()
+
+
+def add_run(database, started_at, params, durations, workflow="slice_making"):
+    run_id = database.start_run()
+    with database.connection:
+        database.connection.execute(
+            "UPDATE runs SET started_at = ? WHERE id = ?", (started_at, run_id)
+        )
+    for index, duration in enumerate(durations):
+        database.add_item(run_id, index, workflow, params, started_at, duration)
+    database.finish_run(run_id)
+    return run_id
+
+
+def test_median_cycle_time_of_the_last_runs(database):
+    add_run(database, 1.0, {"travel_speed": 1000}, [100.0, 100.0])
+    add_run(database, 2.0, {"travel_speed": 1000}, [10.0, 20.0])
+    add_run(database, 3.0, {"travel_speed": 1000}, [30.0])
+
+    assert database.median_cycle_time("slice_making", last=2) == 20.0
+    assert database.median_cycle_time("slice_making") == 30.0
+    assert database.median_cycle_time("base_making") is None
+
+
+def test_regressions_compare_consecutive_parameter_sets(database):
+    add_run(database, 1.0, {"travel_speed": 1000}, [10.0, 10.0])
+    add_run(database, 2.0, {"travel_speed": 1000}, [10.0])
+    add_run(database, 3.0, {"travel_speed": 500}, [12.0, 12.0])
+    add_run(database, 4.0, {"travel_speed": 1000}, [10.5])
+
+    groups = database.regressions("slice_making", threshold=0.1)
+
+    assert [group["params"]["travel_speed"] for group in groups] == [1000, 500, 1000]
+    assert [len(group["runs"]) for group in groups] == [2, 1, 1]
+    assert [group["median"] for group in groups] == [10.0, 12.0, 10.5]
+    assert groups[0]["change"] is None
+    assert groups[1]["change"] == pytest.approx(0.2)
+    assert groups[1]["regression"]
+    assert not groups[2]["regression"]
+
+
+def test_report_exits_with_an_error_on_regressions(database, capsys):
+    add_run(database, 1.0, {"travel_speed": 1000}, [10.0])
+    add_run(database, 2.0, {"travel_speed": 500}, [15.0])
+    path = database.connection.execute("PRAGMA database_list").fetchone()[2]
+
+    assert main(["--db", path, "report"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+    assert main(["--db", path, "report", "--threshold", "1"]) == 0
+    assert main(["--db", path, "median", "slice_making"]) == 0
+    assert "slice_making: 12.5 s" in capsys.readouterr().out
+
+
+def test_runs_of_several_files_hash_them_together(database, tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.json", "b.json")]
+    for path in paths:
+        with open(path, "w") as f:
+            f.write(path)
+
+    run_id = database.start_run(paths)
+    single = database.start_run(paths[0])
+    cursor = database.connection.execute("SELECT id, job_path, job_hash FROM runs")
+    rows = dict((row[0], row[1:]) for row in cursor)
+
+    assert rows[run_id][0].split(os.pathsep) == paths
+    assert rows[run_id][1] not in (rows[single][1], None)
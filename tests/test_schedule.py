@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+from compas.geometry import Frame
+from compas_rrc import MoveToFrame
+from compas_rrc import SetMaxSpeed
+from compas_rrc import Zone
+
+from mmec_fab import PlanCache
+from mmec_fab import Task
+from mmec_fab import schedule_cost
+from mmec_fab import schedule_files
+from mmec_fab import schedule_tasks
+
+
+def slice_tasks(source, making=2):
+    tasks = [Task(source, i, "slice_making", []) for i in range(making)]
+    return tasks + [Task(source, making, "slice_placing", [])]
+
+
+def order(schedule):
+    return [(task.source, task.index) for task in schedule]
+
+
+def test_capacity_one_keeps_the_files_in_order():
+    tasks = slice_tasks(0) + slice_tasks(1)
+    assert order(schedule_tasks(tasks, capacity=1)) == order(tasks)
+
+
+def test_items_of_a_file_keep_their_order(run_data, tmp_path):
+    paths = [run_data("02_making_placing_aa-01-0{}.json".format(i)) for i in (1, 2, 3)]
+    cache = PlanCache(str(tmp_path))
+
+    plan, schedule = schedule_files(paths, capacity=2, cache=cache)
+    for source in range(len(paths)):
+        indices = [task.index for task in schedule if task.source == source]
+        assert indices == sorted(indices)
+
+    # Slices are placed in file order
+    placing = [task.source for task in schedule if task.workflow == "slice_placing"]
+    assert placing == [0, 1, 2]
+    assert len(plan.items) == len(schedule)
+    assert [step["item"] for step in plan.steps if step["item"] >= 0] == sorted(
+        step["item"] for step in plan.steps if step["item"] >= 0
+    )
+
+    file_order = sorted(schedule, key=lambda task: (task.source, task.index))
+    assert schedule_cost(schedule) <= schedule_cost(file_order) + 1e-6
+
+    _, sequential = schedule_files(paths, capacity=1, cache=cache)
+    assert order(sequential) == order(file_order)
+
+
+def test_capacity_limits_open_slices():
+    tasks = slice_tasks(0) + slice_tasks(1)
+    for schedule in (schedule_tasks(tasks, 1), schedule_tasks(tasks, 2)):
+        placed = set()
+        for task in schedule:
+            if task.workflow == "slice_placing":
+                placed.add(task.source)
+            else:
+                assert task.source not in placed
+
+    with pytest.raises(ValueError):
+        schedule_tasks(tasks, capacity=0)
+
+
+def test_task_times_are_capped_by_the_max_speed():
+    def move(x, speed):
+        frame = Frame([x, 0, 0], [1, 0, 0], [0, 1, 0])
+        return {"msg": MoveToFrame(frame, speed, Zone.Z10).msg}
+
+    steps = [move(0, 1000), move(1000, 1000), {"msg": SetMaxSpeed(100, 500).msg}]
+    steps.append(move(2000, 1000))
+    a = Task(0, 0, "slice_making", steps)
+    assert a.start == ("wobj0", [0, 0, 0])
+    assert a.end == ("wobj0", [2000, 0, 0])
+    assert a.speed == 250
+    assert a.duration == pytest.approx(1000 / 250 + 1000 / 500)
+
+    b = Task(0, 1, "slice_making", [move(3000, 1000)], tcp_max_speed=500)
+    assert b.speed == 500
+    assert schedule_cost([a, b]) == pytest.approx(a.duration + 1000 / 500)
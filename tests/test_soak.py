@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from compas_rrc import Noop
+from compas_rrc import WaitTime
+
+from mmec_fab import FakeRos
+from mmec_fab import RobotClient
+from mmec_fab import soak_test
+from mmec_fab import synthetic_source
+
+
+def test_synthetic_source_items():
+    items = list(synthetic_source("rolling", 5, columns=2).items("rolling"))
+    assert len(items) == 5
+    rolling, safe = items[3]
+    assert list(rolling.point) == [10, 10, 0]
+    assert list(safe.point) == [10, 10, 50]
+
+
+def test_client_counts_what_it_holds():
+    ros = FakeRos(execution_time=lambda msg: 0.2)
+    with RobotClient(ros=ros) as client:
+        client.set_phase("setup")
+        client.send(WaitTime(0.2))
+        client.flush()
+        assert client.pending_markers == 1
+        assert client.timeouts.pending == 1
+
+        client.send_and_wait(Noop(), timeout=5)
+        assert client.pending_markers == 0
+        assert client.timeouts.pending == 0
+
+
+def test_soak_test_passes_a_short_session():
+    report = soak_test(
+        "rolling",
+        items=40,
+        sample_every=20,
+        warmup=20,
+        max_memory_growth=100.0,
+        max_latency_drift=100.0,
+        trace=False,
+    )
+    assert report["items"] == 40
+    assert [sample["items"] for sample in report["samples"]] == [20, 40]
+    assert report["failures"] == []
+
+
+def test_soak_test_needs_a_warm_up():
+    report = soak_test("rolling", items=10, sample_every=5, warmup=20, trace=False)
+    assert report["failures"] == ["No baseline, send more than 20 items to warm up"]
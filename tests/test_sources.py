@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+from compas.geometry import Frame
+
+from mmec_fab import ChainedSource
+from mmec_fab import JsonSource
+from mmec_fab import PatternSource
+from mmec_fab import as_source
+from mmec_fab import grid_points
+from mmec_fab import layered_points
+from mmec_fab import polyline_points
+
+PICK_PLACE = {
+    "pick_frames": ((0, 0, 0), (0, 1, 0), (1, 0, 0)),
+    "place_frames": ((0, 100, 0), (0, 1, 0), (1, 0, 0)),
+}
+
+
+def test_grid_points_first_axis_fastest():
+    points = grid_points((500, 500, 0), (2, 2), (100, 50))
+    assert list(points()) == [
+        [500, 500, 0],
+        [600, 500, 0],
+        [500, 550, 0],
+        [600, 550, 0],
+    ]
+    # A new iterator every call
+    assert len(list(points())) == 4
+
+
+def test_polyline_points_keep_the_spacing_around_corners():
+    points = polyline_points([(0, 0, 0), (150, 0, 0), (150, 150, 0)], 100)
+    assert [pytest.approx(p) for p in points()] == [
+        [0, 0, 0],
+        [100, 0, 0],
+        [150, 50, 0],
+        [150, 150, 0],
+    ]
+
+
+def test_layered_points():
+    points = layered_points(lambda layer: [(0, 0, 0), (layer, 0, 0)], 2, 10)
+    assert list(points()) == [[0, 0, 0], [0, 0, 0], [0, 0, 10], [1, 0, 10]]
+
+
+def test_pattern_source_frames():
+    def place(point, index):
+        return Frame([point[0], point[1], index], [1, 0, 0], [0, 1, 0])
+
+    frames = dict(PICK_PLACE, place_frames=place)
+    source = PatternSource("pick_place", grid_points((0, 0, 0), (3,), (100,)), frames)
+
+    items = list(source.items("pick_place"))
+    assert len(items) == 3
+    pick, place = items[2]
+    assert list(pick.point) == [200, 0, 0]
+    assert list(pick.xaxis) == [0, 1, 0]
+    assert list(place.point) == [200, 0, 2]
+
+    # Other workflows have no items, and the items can be taken again
+    assert list(source.items("slice_making")) == []
+    assert len(list(source.items("pick_place"))) == 3
+
+
+def test_pattern_source_needs_all_frames():
+    with pytest.raises(ValueError, match="place_frames"):
+        PatternSource("pick_place", grid_points((0, 0, 0), (1,), (0,)), {})
+
+
+def test_as_source(run_data):
+    path = run_data("04_rolling_left.json")
+    source = as_source(path)
+    assert isinstance(source, JsonSource)
+    rolling = list(source.items("rolling"))
+    assert rolling and len(rolling[0]) == 2
+
+    frames = {
+        "rolling_frames": PICK_PLACE["pick_frames"],
+        "saferight_frames": PICK_PLACE["place_frames"],
+    }
+    pattern = PatternSource("rolling", grid_points((0, 0, 0), (2,), (10,)), frames)
+    assert as_source(pattern) is pattern
+
+    chained = as_source([path, pattern])
+    assert isinstance(chained, ChainedSource)
+    assert len(list(chained.items("rolling"))) == len(rolling) + 2
@@ -0,0 +1,138 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import compas_rrc
+import pytest
+from compas.geometry import Frame
+
+from mmec_fab import MAX_FLOAT_VALUES
+from mmec_fab import MAX_STRING_VALUES
+from mmec_fab import MotionEstimator
+from mmec_fab import MoveSteps
+from mmec_fab import Plan
+from mmec_fab import StoreTargets
+from mmec_fab import buffer_plan
+from mmec_fab import message_volume
+from mmec_fab.target_buffer import MOVES_PER_STEP
+from mmec_fab.target_buffer import TARGETS_PER_STORE
+
+POSE = [100.0, 200.0, 300.0, 0.0, 1.0, 0.0, 0.0]
+
+
+def test_store_targets_fits_the_float_values():
+    store = StoreTargets(1, [POSE] * TARGETS_PER_STORE)
+    assert len(store.float_values) <= MAX_FLOAT_VALUES
+    assert store.float_values[:2] == [1, TARGETS_PER_STORE]
+
+    with pytest.raises(ValueError):
+        StoreTargets(1, [POSE] * (TARGETS_PER_STORE + 1))
+
+
+def test_move_steps_fits_the_values():
+    moves = [(i, 250, 10, True, "wobj{}".format(i)) for i in range(MOVES_PER_STEP)]
+    trigger = {
+        "move": 2,
+        "signal": "doUnitC1Out1",
+        "value": 1,
+        "distance": 5,
+        "mode": 0,
+    }
+    steps = MoveSteps(moves, trigger)
+    assert len(steps.float_values) <= MAX_FLOAT_VALUES
+    assert len(steps.string_values) <= MAX_STRING_VALUES
+    assert steps.float_values[:5] == [MOVES_PER_STEP, 3, 5, 1, 0]
+
+    with pytest.raises(ValueError):
+        MoveSteps(moves + moves[:1])
+
+
+def _motion_time(plan):
+    # Execution time of the instructions as the controller receives them
+    motion = MotionEstimator(unknown_move=2.0)
+    return sum(
+        motion.duration(step["msg"])[0] or 0.0 for step in plan.steps if "msg" in step
+    )
+
+
+@pytest.mark.parametrize(
+    "name, job",
+    [
+        ("01_slice_making_aa-01-01.json", None),
+        ("01_slice_making_aa-01-01.json", "slice_making_trigger"),
+        ("04_rolling_left.json", None),
+    ],
+)
+def test_buffer_plan_keeps_moves_and_phases(prepare, name, job):
+    plan = prepare(name, job)
+    buffered = buffer_plan(plan)
+
+    for step in buffered.steps:
+        if "msg" in step:
+            assert len(step["msg"]["float_values"]) <= MAX_FLOAT_VALUES
+            assert len(step["msg"]["string_values"]) <= MAX_STRING_VALUES
+
+    def phases(plan):
+        return [
+            (step["item"], step["phase"])
+            for step in plan.steps
+            if step.get("new_phase")
+        ]
+
+    def prompts(plan):
+        return [step["prompt"] for step in plan.steps if "prompt" in step]
+
+    assert phases(buffered) == phases(plan)
+    assert prompts(buffered) == prompts(plan)
+    assert _motion_time(buffered) == pytest.approx(_motion_time(plan))
+    assert buffered.job["target_buffer"]["targets"] > 0
+
+
+def test_buffer_plan_sends_fewer_messages(prepare):
+    plan = prepare("01_slice_making_aa-01-01.json")
+    buffered = buffer_plan(plan)
+    assert len(buffered.steps) < len(plan.steps)
+    assert message_volume(plan)[1]["messages"] == 21
+    assert message_volume(buffered)[1]["messages"] == 10
+
+
+def test_buffer_plan_triggers_the_gripper(prepare):
+    buffered = buffer_plan(prepare("01_slice_making_aa-01-01.json"))
+    steps = [
+        step["msg"] for step in buffered.steps if step["item"] == 1 and "msg" in step
+    ]
+    assert [msg["instruction"] for msg in steps].count("r_RRC_SetDigital") == 0
+
+    # Closed at the start of the move after the fine point of the pick, and
+    # opened at the start of the release
+    pick, release = steps[0], steps[-1]
+    assert pick["string_values"][0] == "doUnitC1Out1"
+    assert pick["float_values"][:5] == [4, 4, 0, 1, 1]
+    assert release["float_values"][:5] == [1, 1, 0, 0, 1]
+
+
+def test_buffer_plan_keeps_outputs_along_fly_by_moves():
+    def step(instruction, wait=False):
+        return {"item": 0, "phase": "pick", "msg": instruction.msg, "wait": wait}
+
+    def move(z, zone):
+        frame = Frame([0, 0, z], [1, 0, 0], [0, 1, 0])
+        return step(compas_rrc.MoveToFrame(frame, 100, zone))
+
+    steps = [move(0, compas_rrc.Zone.Z10), step(compas_rrc.SetDigital("do_1", 1))]
+    steps.append(dict(move(100, compas_rrc.Zone.FINE), wait=True))
+    buffered = buffer_plan(Plan({}, [{"workflow": "pick_place"}], steps))
+
+    names = [step["msg"]["instruction"] for step in buffered.steps]
+    assert names == [
+        "r_A057_MoveSteps",
+        "r_A057_StoreTargets",
+        "r_RRC_SetDigital",
+        "r_A057_MoveSteps",
+    ]
+
+
+def test_buffer_plan_rejects_too_many_targets(prepare):
+    plan = prepare("01_slice_making_aa-01-01.json")
+    with pytest.raises(ValueError):
+        buffer_plan(plan, max_targets=10)
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from array import array
+
+import pytest
+
+from mmec_fab import ColumnarWriter
+from mmec_fab import RingBuffer
+from mmec_fab import read_columnar
+from mmec_fab import segment_times
+
+COLUMNS = [("time", "d"), ("item", "i"), ("phase", "b")]
+
+
+def test_ring_buffer_overwrites_oldest_rows():
+    buffer = RingBuffer(COLUMNS, capacity=3)
+    for i in range(5):
+        buffer.append([i * 0.5, i, -1])
+
+    assert len(buffer) == 3
+    assert buffer.dropped == 2
+    times, items, phases = buffer.drain()
+    assert list(times) == [1.0, 1.5, 2.0]
+    assert list(items) == [2, 3, 4]
+
+    assert len(buffer) == 0
+    assert [list(column) for column in buffer.drain()] == [[], [], []]
+
+
+def test_columnar_round_trip(tmp_path):
+    path = str(tmp_path / "telemetry.col")
+    writer = ColumnarWriter(path, COLUMNS, {"phases": ["approach", "place"]})
+    writer.write([array("d", [0.0, 0.1]), array("i", [0, 0]), array("b", [0, 1])])
+    writer.write([array("d", []), array("i", []), array("b", [])])
+    writer.write([array("d", [0.2]), array("i", [1]), array("b", [-1])])
+    writer.close()
+    assert writer.rows == 3
+
+    data, metadata = read_columnar(path)
+    assert metadata == {"phases": ["approach", "place"]}
+    assert list(data["time"]) == [0.0, 0.1, 0.2]
+    assert list(data["item"]) == [0, 0, 1]
+    assert list(data["phase"]) == [0, 1, -1]
+    assert data["phase"].typecode == "b"
+
+
+def test_read_columnar_checks_the_file(tmp_path):
+    path = tmp_path / "other.col"
+    path.write_bytes(b"something else")
+    with pytest.raises(ValueError):
+        read_columnar(str(path))
+
+
+def test_segment_times():
+    data = {
+        "time": [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+        "item": [0, 0, 0, 1, 1, -1],
+        "phase": [0, 0, 1, 0, 0, -1],
+        "phases": ["approach", "place"],
+    }
+    segments = segment_times(data)
+    assert [(s["item"], s["phase"], s["duration"]) for s in segments] == [
+        (0, "approach", 1.0),
+        (0, "place", 0.0),
+        (1, "approach", 1.0),
+    ]
@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pytest
+
+from mmec_fab import AdaptiveTimeouts
+from mmec_fab import MotionEstimator
+
+
+def move(point, speed=100):
+    return {
+        "instruction": "r_RRC_MoveTo",
+        "string_values": ["FrameL"],
+        "float_values": list(point) + [0, 1, 0, 0] + [0] * 6 + [speed, 10],
+    }
+
+
+def set_wobj(name):
+    return {"instruction": "r_RRC_SetWorkObject", "string_values": [name]}
+
+
+def set_max_speed(tcp):
+    return {"instruction": "r_RRC_SetMaxSpeed", "float_values": [100, tcp]}
+
+
+JOINTS = {"instruction": "r_RRC_MoveToJoints", "float_values": [0] * 6}
+
+
+def test_motion_estimator_moves():
+    motion = MotionEstimator(tcp_max_speed=250, unknown_move=3)
+
+    # First move has no known start
+    assert motion.duration(move([0, 0, 0])) == (3, True)
+    assert motion.duration(move([0, 0, 100])) == (pytest.approx(1.0), False)
+
+    # Capped by the TCP speed
+    motion.duration(set_max_speed(50))
+    assert motion.duration(move([0, 0, 0])) == (pytest.approx(2.0), False)
+
+    # Joint moves and changes of work object lose the position
+    assert motion.duration(JOINTS) == (3, True)
+    assert motion.duration(move([0, 0, 100])) == (3, True)
+    motion.duration(set_wobj("ob_A057_WobjCutST"))
+    assert motion.duration(move([0, 0, 0])) == (3, True)
+
+
+def test_motion_estimator_stops():
+    motion = MotionEstimator()
+    assert motion.duration({"instruction": "r_RRC_Stop"}) == (None, False)
+    wait = {"instruction": "r_RRC_WaitTime", "float_values": [1.5]}
+    assert motion.duration(wait) == (1.5, False)
+    assert motion.step_duration({"msg": {"instruction": "r_RRC_Stop"}}) == 0.0
+
+
+class Instruction(object):
+    def __init__(self, sequence_id, msg):
+        self.sequence_id = sequence_id
+        self.msg = msg
+
+
+def test_feedback_after_sequence_id_wrap():
+    timeouts = AdaptiveTimeouts()
+    for sequence_id in (65534, 65535, 1, 2):
+        timeouts.instruction_sent(Instruction(sequence_id, move([0, 0, 0])))
+
+    timeouts.feedback_received({"feedback_id": 65535})
+    assert timeouts.deadline(65534) is None
+    assert timeouts.deadline(65535) is None
+    assert timeouts.deadline(1) is not None
+    assert timeouts.deadline(2) is not None
+
+    # Unknown feedback leaves the queue
+    timeouts.feedback_received({"feedback_id": 7})
+    assert timeouts.deadline(1) is not None
+
+
+def test_no_deadline_behind_operator_stop():
+    timeouts = AdaptiveTimeouts()
+    timeouts.instruction_sent(Instruction(1, {"instruction": "r_RRC_Stop"}))
+    timeouts.instruction_sent(Instruction(2, move([0, 0, 0])))
+    assert timeouts.deadline(2) is None
+
+    timeouts.feedback_received({"feedback_id": 1})
+    assert timeouts.deadline(2) is not None
+
+
+def test_margin_learned_from_delays():
+    timeouts = AdaptiveTimeouts(initial_margin=10, min_margin=1, min_samples=3)
+    assert timeouts.margin == 10
+    timeouts.delays.extend([0.5, 0.5, 0.5])
+    assert timeouts.margin == 1
+    timeouts.delays.extend([2.0, 2.0, 2.0])
+    assert timeouts.margin == pytest.approx(1.25 + 3 * 0.75)
+
+
+def test_slowdown_follows_the_speed_override(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("time.time", lambda: now[0])
+    timeouts = AdaptiveTimeouts(min_samples=3)
+    timeouts.instruction_sent(Instruction(0, move([0, 0, 0])))
+    timeouts.feedback_received({"feedback_id": 0})
+
+    def run(sequence_id, seconds):
+        # Moves of 2 s up and down
+        point = [0, 0, 200 * (sequence_id % 2)]
+        timeouts.instruction_sent(Instruction(sequence_id, move(point)))
+        now[0] += seconds
+        timeouts.feedback_received({"feedback_id": sequence_id})
+
+    # Taking 4 s at half the speed override
+    for sequence_id in range(1, 4):
+        run(sequence_id, 4.0)
+    assert timeouts.slowdown == pytest.approx(2.0)
+    assert list(timeouts.delays) == pytest.approx([2.0, 0.0, 0.0])
+
+    timeouts.instruction_sent(Instruction(4, move([0, 0, 0])))
+    expected = now[0] + 2 * 2.0 * (1 + timeouts.tolerance) + timeouts.margin
+    assert timeouts.deadline(4) == pytest.approx(expected)
+    now[0] += 4.0
+    timeouts.feedback_received({"feedback_id": 4})
+
+    # Back to full speed
+    for sequence_id in range(5, 8):
+        run(sequence_id, 2.0)
+    assert timeouts.slowdown == pytest.approx(1.0)
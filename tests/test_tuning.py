@@ -0,0 +1,140 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import logging
+
+import pytest
+from compas.geometry import Frame
+from compas_rrc import MoveToFrame
+from compas_rrc import Zone
+
+from mmec_fab import DEFAULT_LIMITS
+from mmec_fab import TCP_MAX_SPEED
+from mmec_fab import Plan
+from mmec_fab import PlanCache
+from mmec_fab import analyze_speeds
+from mmec_fab import apply_profile
+from mmec_fab import load_profile
+from mmec_fab import prepare_job
+from mmec_fab import profile_path
+from mmec_fab import propose_profile
+from mmec_fab import save_profile
+
+LIMITS = {"tcp_max_speed": 1000, "accel": 100, "accel_ramp": 100}
+
+
+def move(x, speed, phase, new_phase=False, item=0):
+    frame = Frame([x, 0, 0], [1, 0, 0], [0, 1, 0])
+    msg = MoveToFrame(frame, speed, Zone.Z10).msg
+    step = {"msg": msg, "item": item, "phase": phase}
+    if new_phase:
+        step["new_phase"] = True
+    return step
+
+
+@pytest.fixture
+def plan():
+    # Fast moves capped at 250 mm/s, then slow ones
+    steps = [
+        move(0, 250, "setup", True, -1),
+        move(1000, 1000, "approach", True),
+        move(2000, 1000, "approach"),
+        move(2100, 50, "place", True),
+        move(2200, 50, "place"),
+    ]
+    return Plan({"name": "slice_making"}, [{"workflow": "slice_making"}], steps)
+
+
+SEGMENTS = [
+    {"item": 0, "phase": "approach", "duration": 8.5},
+    {"item": 0, "phase": "place", "duration": 6.0},
+]
+
+
+def test_analyze_speeds_finds_the_limits(plan):
+    approach, place = analyze_speeds(plan, SEGMENTS)
+
+    assert approach["phase"] == "approach"
+    assert approach["distance"] == pytest.approx(2000)
+    assert approach["commanded"] == pytest.approx(2000 / 1000)
+    assert approach["capped"] == pytest.approx(2000 / TCP_MAX_SPEED)
+    assert approach["limit"] == "speed"
+
+    assert place["capped"] == pytest.approx(place["commanded"])
+    assert place["limit"] == "acceleration"
+
+    assert [row["limit"] for row in analyze_speeds(plan, [])] == [None, None]
+
+
+def test_default_limits_keep_the_client_settings(plan):
+    profile = propose_profile(plan, analyze_speeds(plan, SEGMENTS))
+    assert profile["limits"] == DEFAULT_LIMITS
+    assert profile["phases"] == {}
+
+
+def test_apply_profile_sets_the_speed_cap_per_phase(plan):
+    profile = propose_profile(plan, analyze_speeds(plan, SEGMENTS), LIMITS)
+    approach = profile["phases"]["slice_making"]["approach"]
+    assert approach["tcp_max_speed"] == 1000
+    assert approach["saved"] == pytest.approx(2000 / TCP_MAX_SPEED - 2000 / 1000)
+
+    tuned = apply_profile(plan, profile)
+    assert tuned.job["profile"] is profile
+    instructions = [
+        (step["phase"], step.get("new_phase", False), step["msg"]["instruction"])
+        for step in tuned.steps
+    ]
+    assert instructions[0] == ("setup", True, "r_RRC_MoveTo")
+    assert instructions[1] == ("approach", True, "r_RRC_SetMaxSpeed")
+    assert instructions[2] == ("approach", False, "r_RRC_MoveTo")
+    assert instructions[4] == ("place", True, "r_RRC_SetMaxSpeed")
+    assert tuned.steps[1]["msg"]["float_values"][1] == 1000
+    assert tuned.steps[4]["msg"]["float_values"][1] == TCP_MAX_SPEED
+    assert len(tuned.steps) == len(plan.steps) + 2
+
+
+def test_prepare_job_logs_the_profile(run_data, tmp_path, caplog):
+    path = run_data("04_rolling_left.json")
+    cache = PlanCache(str(tmp_path))
+    profile = {
+        "job": "rolling_left",
+        "phases": {"rolling": {"roll": dict(LIMITS, tcp_max_speed=200)}},
+    }
+    with caplog.at_level(logging.WARNING, logger="mmec_fab"):
+        prepare_job(path, cache=cache, profile=profile)
+    assert "rolling roll 200 mm/s 100 %" in caplog.text
+    assert "(given)" in caplog.text
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="mmec_fab"):
+        prepare_job(path, cache=cache, profile=False)
+    assert caplog.text == ""
+
+
+def test_profiles_are_checked_against_their_limits(plan, tmp_path):
+    profile = propose_profile(plan, analyze_speeds(plan, SEGMENTS), LIMITS)
+    directory = str(tmp_path)
+    save_profile(profile, directory)
+    assert load_profile("slice_making", directory) == profile
+
+    # Faster than the limits of the profile
+    approach = profile["phases"]["slice_making"]["approach"]
+    approach["tcp_max_speed"] = 1500
+    with pytest.raises(ValueError, match="tcp_max_speed of slice_making approach"):
+        apply_profile(plan, profile)
+    with pytest.raises(ValueError, match="1500"):
+        save_profile(profile, directory)
+
+    # Without limits of its own, a profile keeps to the default ones
+    approach["tcp_max_speed"] = 1000
+    del profile["limits"]
+    with open(profile_path("slice_making", directory), "w") as f:
+        json.dump(profile, f)
+    with pytest.raises(ValueError, match="the limit is {}".format(TCP_MAX_SPEED)):
+        load_profile("slice_making", directory)
+
+    approach.update(tcp_max_speed=TCP_MAX_SPEED, accel=0)
+    with pytest.raises(ValueError, match="accel"):
+        apply_profile(plan, profile)